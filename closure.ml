@@ -116,6 +116,9 @@ let f e =
   let e' = g M.empty S.empty e in
   Prog(List.rev !toplevel, e')
 
+(* %.17gǽϤ%fǤ1e-70.0ˤʤʤͤݤ졤.binȰ㤦ץˤʤäƤޤ *)
+let float2String f = Printf.sprintf "%.17g" f
+
 let rec xts2String list acc =
   match list with
   | [] -> acc
@@ -152,7 +155,7 @@ and closure2String t =
   match t with
   | Unit -> "Unit"
   | Int(i) -> "Int(" ^ (Printf.sprintf "%d" i) ^ ")"
-  | Float(f) -> "Float(" ^ (Printf.sprintf "%f" f) ^ ")"
+  | Float(f) -> "Float(" ^ (float2String f) ^ ")"
   | Neg(x) -> "Neg(" ^ x ^ ")"
   | Add(x, y) -> "Add(" ^ x ^ "," ^ y ^ ")"
   | Sub(x, y) -> "Sub(" ^ x ^ "," ^ y ^ ")"
@@ -187,7 +190,7 @@ and closure2StringWithoutPos t =
   match t with
   | Unit -> "Unit"
   | Int(i) -> "Int(" ^ (Printf.sprintf "%d" i) ^ ")"
-  | Float(f) -> "Float(" ^ (Printf.sprintf "%f" f) ^ ")"
+  | Float(f) -> "Float(" ^ (float2String f) ^ ")"
   | Neg(x) -> "Neg(" ^ x ^ ")"
   | Add(x, y) -> "Add(" ^ x ^ "," ^ y ^ ")"
   | Sub(x, y) -> "Sub(" ^ x ^ "," ^ y ^ ")"
@@ -216,4 +219,106 @@ and closure2StringWithoutPos t =
 
 let closureProg2StringWithoutPos prog =
   let Prog(fundef_list, t) = prog in
-  "fundef list:\n[" ^ (fundefList2String fundef_list "") ^ "]\n" ^ "t:\n" ^ (closure2StringWithoutPos t)
\ No newline at end of file
+  "fundef list:\n[" ^ (fundefList2String fundef_list "") ^ "]\n" ^ "t:\n" ^ (closure2StringWithoutPos t)
+
+(* closureѴΥץХʥǽ񤭽Ф (py/closureBin.py ɤ߹) *)
+(* ѿ̾ʸʸɽ˰٤Ǽ,ƥΡɤϥ1byteʸɽֹɽ *)
+(* ꥹȤϥƥȷƱս¤٤ *)
+let binary_version = 1
+
+let add_u8 buf n = Buffer.add_char buf (Char.chr (n land 0xff))
+
+let add_u32 buf n =
+  add_u8 buf n;
+  add_u8 buf (n lsr 8);
+  add_u8 buf (n lsr 16);
+  add_u8 buf (n lsr 24)
+
+let add_i64 buf n =
+  let rec loop i n =
+    if i < 8 then
+      (add_u8 buf (Int64.to_int (Int64.logand n 0xffL));
+       loop (i + 1) (Int64.shift_right_logical n 8)) in
+  loop 0 n
+
+let string_table = Hashtbl.create 1024
+let string_list = ref []
+let string_count = ref 0
+
+let add_str buf s =
+  let i =
+    try Hashtbl.find string_table s with
+    | Not_found ->
+        let i = !string_count in
+        Hashtbl.add string_table s i;
+        string_list := s :: !string_list;
+        incr string_count;
+        i in
+  add_u32 buf i
+
+let add_list buf f list =
+  add_u32 buf (List.length list);
+  List.iter (f buf) (List.rev list)
+
+let add_xt buf (x, t) =
+  add_str buf x;
+  add_str buf (Type.type2string t)
+
+let rec add_closure buf t =
+  match t with
+  | Unit -> add_u8 buf 0
+  | Int(i) -> add_u8 buf 1; add_i64 buf (Int64.of_int i)
+  | Float(f) -> add_u8 buf 2; add_i64 buf (Int64.bits_of_float f)
+  | Neg(x) -> add_u8 buf 3; add_str buf x
+  | Add(x, y) -> add_u8 buf 4; add_str buf x; add_str buf y
+  | Sub(x, y) -> add_u8 buf 5; add_str buf x; add_str buf y
+  | Mul(x, y) -> add_u8 buf 6; add_str buf x; add_str buf y
+  | Div(x, y) -> add_u8 buf 7; add_str buf x; add_str buf y
+  | FNeg(x) -> add_u8 buf 8; add_str buf x
+  | FAdd(x, y) -> add_u8 buf 9; add_str buf x; add_str buf y
+  | FSub(x, y) -> add_u8 buf 10; add_str buf x; add_str buf y
+  | FMul(x, y) -> add_u8 buf 11; add_str buf x; add_str buf y
+  | FDiv(x, y) -> add_u8 buf 12; add_str buf x; add_str buf y
+  | IfEq(x, y, e1, e2) -> add_u8 buf 13; add_str buf x; add_str buf y; add_closure buf e1; add_closure buf e2
+  | IfNEq(x, y, e1, e2) -> add_u8 buf 14; add_str buf x; add_str buf y; add_closure buf e1; add_closure buf e2
+  | IfLE(x, y, e1, e2) -> add_u8 buf 15; add_str buf x; add_str buf y; add_closure buf e1; add_closure buf e2
+  | IfLT(x, y, e1, e2) -> add_u8 buf 16; add_str buf x; add_str buf y; add_closure buf e1; add_closure buf e2
+  | Let(xt, e1, e2) -> add_u8 buf 17; add_xt buf xt; add_closure buf e1; add_closure buf e2
+  | Var(x) -> add_u8 buf 18; add_str buf x
+  | MakeCls(xt, { entry = Id.L(l); actual_fv = ys }, e) -> add_u8 buf 19; add_xt buf xt; add_str buf l; add_list buf add_str ys; add_closure buf e
+  | AppCls(x, ys) -> add_u8 buf 20; add_str buf x; add_list buf add_str ys
+  | AppDir(Id.L(l), ys) -> add_u8 buf 21; add_str buf l; add_list buf add_str ys
+  | Tuple(ys) -> add_u8 buf 22; add_list buf add_str ys
+  | LetTuple(xts, y, e) -> add_u8 buf 23; add_list buf add_xt xts; add_str buf y; add_closure buf e
+  | Get(x, y) -> add_u8 buf 24; add_str buf x; add_str buf y
+  | Put(x, y, z) -> add_u8 buf 25; add_str buf x; add_str buf y; add_str buf z
+  | ExtArray(Id.L(l)) -> add_u8 buf 26; add_str buf l
+  | ExprWithPos(e, _) -> add_closure buf e
+
+let add_fundef buf fundef =
+  let (Id.L(l), t) = fundef.name in
+  add_str buf l;
+  add_str buf (Type.type2string t);
+  add_list buf add_xt fundef.args;
+  add_list buf add_xt fundef.formal_fv;
+  add_closure buf fundef.body
+
+(* إå("PYCB", version, first_hp), ʸɽ, fundef list, t ν¤٤ *)
+let closureProg2Binary first_hp prog =
+  let Prog(fundef_list, t) = prog in
+  Hashtbl.reset string_table;
+  string_list := [];
+  string_count := 0;
+  let body = Buffer.create 65536 in
+  add_list body add_fundef fundef_list;
+  add_closure body t;
+  let buf = Buffer.create (Buffer.length body + 65536) in
+  Buffer.add_string buf "PYCB";
+  add_u32 buf binary_version;
+  add_i64 buf (Int64.of_int first_hp);
+  add_u32 buf !string_count;
+  List.iter
+    (fun s -> add_u32 buf (String.length s); Buffer.add_string buf s)
+    (List.rev !string_list);
+  Buffer.add_buffer buf body;
+  Buffer.contents buf
@@ -37,4 +37,5 @@ type prog = Prog of fundef list * t
 val fv : t -> S.t
 val f : KNormal.t -> prog
 val closureProg2String : prog -> string
-val closureProg2StringWithoutPos : prog -> string
\ No newline at end of file
+val closureProg2StringWithoutPos : prog -> string
+val closureProg2Binary : int -> prog -> string
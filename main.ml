@@ -43,6 +43,10 @@ let lexbuf l f = (* 
         Printf.fprintf outchan "first_hp : %s\n" (string_of_int first_hp);
         Printf.fprintf outchan "%s" closure_string;
         (close_out outchan);
+        (* ƱƤХʥǤ񤭽Ф (py/main.pyϤͥ褷ɤ) *)
+        let binchan = open_out_bin (f ^ ".bin") in
+        output_string binchan (Closure.closureProg2Binary first_hp tmp3);
+        (close_out binchan);
         ()
 
 let file f =
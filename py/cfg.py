@@ -0,0 +1,360 @@
+#--------------------------------------------------
+#
+# cfg.py
+# 1関数分のList[virtual.Virtual_Asm]の制御フローグラフ
+#
+# 実装の方針：
+# CFG(lis)を作ると，ラベルの位置・有効な命令の後続命令・基本ブロックとブロック間の先行/後続をまとめて計算する
+# 支配木・自然ループ・ループの深さは使われたときに初めて計算し，覚えておく
+# 実行頻度の見積もりは，ブロックのループの深さと関数の再帰（自分自身を呼び出しているか）から LOOP_WEIGHT ** 深さ とする
+# 同じ命令列について生存解析・スタックスロットの割り当て・実行頻度の見積もりをするときは，作ったCFGを引数で渡して使い回す
+# ラベル・分岐・ジャンプ以外の命令を挿入・削除するだけの書き換え（spillのstore/restore, rematなど）ではブロックの形が変わらないので，
+# updateInstrsで命令のidxを付け替えるだけにして，ブロック間の枝・支配木・ループは作り直さない
+#
+#--------------------------------------------------
+
+from typing import List, Dict, Set, Tuple
+import virtual
+import opcodes
+
+# ループの深さが1増えるごとに何倍の回数実行されると見積もるか
+LOOP_WEIGHT = 8
+# 実行頻度の見積もりで考えるループの深さの上限
+MAX_LOOP_DEPTH = 4
+
+# 命令の流れを変える（ブロックの形に関わる）命令かどうか
+CONTROL_FLAGS = opcodes.IS_BRANCH | opcodes.IS_JUMP
+
+# ブロックの形に関わる行（ラベル・分岐・ジャンプ）なら，その種類とラベル名の組を返し，そうでなければNoneを返す
+def controlKey (asm:virtual.Virtual_Asm) -> Tuple[str, str]:
+    if asm.op == opcodes.LABEL:
+        return ("label", asm.arg_list[0].name)
+    flags = opcodes.INFO[asm.op].flags
+    if flags & opcodes.IS_BRANCH:
+        return ("branch", asm.arg_list[2].name)
+    if flags & opcodes.IS_JUMP:
+        return ("jump", asm.arg_list[0].name)
+    return None
+
+# ラベル名 => lisの中でのそのラベルの行のidx
+def labelPositions (lis:List[virtual.Virtual_Asm]) -> Dict[str, int]:
+    label_pos = {}
+    for i in range(len(lis)):
+        if lis[i].op == opcodes.LABEL:
+            label_pos[lis[i].arg_list[0].name] = i
+    return label_pos
+
+# ラベルの行やコメントアウトの行はskipしたうえで、now_idxの直後の命令のidxを返す
+def getImmediatelySuccInstrIdx (now_idx:int, asm_length:int, lis:List[virtual.Virtual_Asm]) -> List[int]:
+    j = now_idx + 1
+    while j < asm_length and (opcodes.INFO[lis[j].op].flags & opcodes.IS_NOT_INSTR): # ラベルの行やコメントアウトの行はskip
+        j += 1
+    if j == asm_length: # lisの最後に達している
+        return []
+    else:
+        return [j]
+
+# List[virtual.Virtual_Asm]のそれぞれのVirtual_Asmに対して、後続命令を計算する
+# 返り値は
+#   命令のidx => 後続命令のidxの配列
+# という要素が入った辞書succ_instrs
+def getSuccInstrs (lis:List[virtual.Virtual_Asm], label_pos:Dict[str, int]) -> Dict[int, List[int]]:
+    asm_length = len(lis)
+    succ_instrs = {}
+    for i in range(asm_length):
+        asm = lis[i]
+        flags = opcodes.INFO[asm.op].flags
+        if flags & opcodes.IS_NOT_INSTR: # ラベルの行やコメントアウトの行に関しては無視
+            continue
+        if flags & opcodes.IS_BRANCH: # 2通りの後続命令がある命令
+            label_idx = label_pos[asm.arg_list[2].name]
+            succ_instrs[i] = getImmediatelySuccInstrIdx(i, asm_length, lis) + getImmediatelySuccInstrIdx(label_idx, asm_length, lis)
+        elif asm.op == opcodes.J: # ジャンプ命令
+            label_idx = label_pos[asm.arg_list[0].name]
+            succ_instrs[i] = getImmediatelySuccInstrIdx(label_idx, asm_length, lis)
+        else: # 次の命令に進むだけの命令
+            succ_instrs[i] = getImmediatelySuccInstrIdx(i, asm_length, lis)
+    return succ_instrs
+
+# ラベルやコメントアウトの行以外の有効な命令のidxのリストの取得
+def getInstrIdxList (lis:List[virtual.Virtual_Asm]) -> List[int]:
+    instr_idx_list = []
+    for i in range(len(lis)):
+        if not (opcodes.INFO[lis[i].op].flags & opcodes.IS_NOT_INSTR):
+            instr_idx_list.append(i)
+    return instr_idx_list
+
+# 基本ブロック
+class BasicBlock:
+    __slots__ = ("instrs", "succs", "preds")
+    def __init__ (self, instrs:List[int]):
+        self.instrs = instrs # ブロック内の命令のidx（ラベルやコメントアウトの行は含まない）
+        self.succs: List[int] = [] # 後続ブロックの番号
+        self.preds: List[int] = [] # 先行ブロックの番号
+
+# 有効な命令のidxのリストと後続命令から，基本ブロックのリストと，命令のidx => ブロックの番号 の辞書を作る
+# ブロックの先頭になるのは，最初の命令・分岐やジャンプの飛び先・次の命令にそのまま進まない命令の直後の命令
+def buildBasicBlocks (instr_idx_list:List[int], succ_instrs:Dict[int, List[int]]) -> Tuple[List[BasicBlock], Dict[int, int]]:
+    length = len(instr_idx_list)
+    is_leader = {i : False for i in instr_idx_list}
+    is_leader[instr_idx_list[0]] = True
+    for k in range(length):
+        i = instr_idx_list[k]
+        next_i = instr_idx_list[k + 1] if k + 1 < length else None
+        if succ_instrs[i] != ([next_i] if next_i is not None else []):
+            for j in succ_instrs[i]:
+                is_leader[j] = True
+            if next_i is not None:
+                is_leader[next_i] = True
+
+    blocks = []
+    block_of = {}
+    for i in instr_idx_list:
+        if is_leader[i]:
+            blocks.append(BasicBlock([]))
+        blocks[-1].instrs.append(i)
+        block_of[i] = len(blocks) - 1
+
+    for b in range(len(blocks)):
+        for j in succ_instrs[blocks[b].instrs[-1]]:
+            c = block_of[j]
+            if c not in blocks[b].succs:
+                blocks[b].succs.append(c)
+                blocks[c].preds.append(b)
+
+    return blocks, block_of
+
+# 後続ブロックが先に来る順（先頭のブロックからの深さ優先探索の後順）でブロックの番号を並べる
+# 先頭のブロックから辿り着けないブロックは，only_reachableがFalseなら最後に付け加える
+def postOrder (blocks:List[BasicBlock], only_reachable:bool = False) -> List[int]:
+    order = []
+    visited = [False] * len(blocks)
+    for root in range(len(blocks)):
+        if visited[root]:
+            continue
+        if root > 0 and only_reachable:
+            break
+        visited[root] = True
+        stack = [(root, 0)]
+        while stack:
+            b, k = stack.pop()
+            succs = blocks[b].succs
+            if k < len(succs):
+                stack.append((b, k + 1))
+                c = succs[k]
+                if not visited[c]:
+                    visited[c] = True
+                    stack.append((c, 0))
+            else:
+                order.append(b)
+    return order
+
+# 自然ループ（headerへの後退辺をもつ，headerに支配されたブロックの集合）
+class Loop:
+    __slots__ = ("header", "body")
+    def __init__ (self, header:int, body:Set[int]):
+        self.header = header # ループの先頭のブロックの番号
+        self.body = body # ループに含まれるブロックの番号の集合（headerを含む）
+
+# 関数の先頭のラベル名の関数を，関数の中で呼び出しているかどうか
+def isSelfRecursive (lis:List[virtual.Virtual_Asm]) -> bool:
+    if len(lis) == 0 or lis[0].op != opcodes.LABEL:
+        return False
+    func_name = lis[0].arg_list[0].name
+    for asm in lis:
+        if opcodes.INFO[asm.op].flags & opcodes.IS_CALL:
+            for reg in asm.arg_list:
+                if reg.typ == "label" and reg.name == func_name:
+                    return True
+    return False
+
+# 1関数分の制御フローグラフ
+# recursion_depthは関数全体を囲むループの深さとみなす値で，Noneのときは自分自身を呼び出していれば1とする
+class CFG:
+    def __init__ (self, lis:List[virtual.Virtual_Asm], recursion_depth:int = None):
+        self.lis = lis
+        self.recursion_depth = recursion_depth
+        self.build()
+
+    # ラベル・後続命令・基本ブロックを作り直す（ブロックの形から計算するものは捨てる）
+    def build (self):
+        self.label_pos = labelPositions(self.lis)
+        self.instr_idx_list = getInstrIdxList(self.lis)
+        self.succ_instrs = getSuccInstrs(self.lis, self.label_pos)
+        if self.instr_idx_list:
+            self.blocks, self.block_of = buildBasicBlocks(self.instr_idx_list, self.succ_instrs)
+        else:
+            self.blocks, self.block_of = [], {}
+        self.idom = None
+        self.loops = None
+        self.loop_depth = None
+
+    # ラベルの行のidx（ラベルがなければNone）
+    def labelIdx (self, label:str) -> int:
+        return self.label_pos.get(label)
+
+    # 命令のidx => 先行命令のidxの配列
+    def predInstrs (self) -> Dict[int, List[int]]:
+        preds = {i : [] for i in self.instr_idx_list}
+        for i in self.instr_idx_list:
+            for j in self.succ_instrs[i]:
+                preds[j].append(i)
+        return preds
+
+    # 各ブロックの直接の支配ブロックの番号のリスト（先頭のブロックは自分自身，辿り着けないブロックはNone）
+    # Cooper, Harvey, Kennedyの反復法で，逆後順に直接の支配ブロックを更新していく
+    def dominators (self) -> List[int]:
+        if self.idom is not None:
+            return self.idom
+        n = len(self.blocks)
+        idom = [None] * n
+        if n == 0:
+            self.idom = idom
+            return idom
+        rpo = list(reversed(postOrder(self.blocks, True)))
+        rpo_num = {b : k for k, b in enumerate(rpo)}
+        idom[0] = 0
+        def intersect (a:int, b:int) -> int:
+            while a != b:
+                while rpo_num[a] > rpo_num[b]:
+                    a = idom[a]
+                while rpo_num[b] > rpo_num[a]:
+                    b = idom[b]
+            return a
+        changed = True
+        while changed:
+            changed = False
+            for b in rpo[1:]:
+                new_idom = None
+                for p in self.blocks[b].preds:
+                    if idom[p] is not None:
+                        new_idom = p if new_idom is None else intersect(p, new_idom)
+                if idom[b] != new_idom:
+                    idom[b] = new_idom
+                    changed = True
+        self.idom = idom
+        return idom
+
+    # ブロックaがブロックbを支配しているかどうか
+    def dominates (self, a:int, b:int) -> bool:
+        idom = self.dominators()
+        if idom[b] is None:
+            return False
+        while b != a:
+            if b == 0:
+                return False
+            b = idom[b]
+        return True
+
+    # 自然ループのリスト（同じheaderへの後退辺が複数あれば1つのループにまとめる）
+    def naturalLoops (self) -> List[Loop]:
+        if self.loops is not None:
+            return self.loops
+        bodies = {}
+        for b in range(len(self.blocks)):
+            for h in self.blocks[b].succs:
+                if self.dominates(h, b): # b -> h が後退辺
+                    body = bodies.setdefault(h, {h})
+                    stack = [b]
+                    while stack:
+                        c = stack.pop()
+                        if c not in body:
+                            body.add(c)
+                            stack.extend(self.blocks[c].preds)
+        self.loops = [Loop(h, body) for h, body in bodies.items()]
+        return self.loops
+
+    # ブロックの番号 => そのブロックを含む自然ループの数
+    def loopDepths (self) -> List[int]:
+        if self.loop_depth is not None:
+            return self.loop_depth
+        depth = [0] * len(self.blocks)
+        for loop in self.naturalLoops():
+            for b in loop.body:
+                depth[b] += 1
+        self.loop_depth = depth
+        return depth
+
+    # 関数全体を囲むループの深さとみなす値
+    def recursionDepth (self) -> int:
+        if self.recursion_depth is None:
+            self.recursion_depth = 1 if isSelfRecursive(self.lis) else 0
+        return self.recursion_depth
+
+    # ブロックbの実行頻度の見積もり（関数1回の呼び出しあたりではなく，関数の外のループも含めた相対的な重み）
+    def blockFrequency (self, b:int) -> int:
+        return LOOP_WEIGHT ** min(self.loopDepths()[b] + self.recursionDepth(), MAX_LOOP_DEPTH)
+
+    # 命令のidx => その命令の実行頻度の見積もり（有効な命令のみ）
+    def instrFrequencies (self) -> Dict[int, int]:
+        freq = {}
+        for b in range(len(self.blocks)):
+            f = self.blockFrequency(b)
+            for i in self.blocks[b].instrs:
+                freq[i] = f
+        return freq
+
+    # new_lisを，self.lisにラベル・分岐・ジャンプ以外の命令を挿入・削除したもの（old_idx: 元からある行の new_lisでのidx => self.lisでのidx）として，
+    # new_lisのCFGにする
+    # 挿入した命令は，直前の元からある命令と同じブロックに入れる（直前がラベル・分岐・ジャンプの行なら，直後の元からある命令と同じブロックに入れる）
+    # ラベル・分岐・ジャンプの行が順番どおりに全部残っていないか，空になるブロックがあれば，ブロックの形が変わるので全体を作り直す
+    def updateInstrs (self, new_lis:List[virtual.Virtual_Asm], old_idx:Dict[int, int]):
+        if not self.keepsBlocks(new_lis, old_idx):
+            self.lis = new_lis
+            self.build()
+            return
+        old_block_of = self.block_of
+        block_instrs = [[] for _ in self.blocks]
+        waiting = [] # 直後の元からある命令のブロックに入れる，挿入した命令
+        cur = None # 直前の元からある命令のブロック（直前がラベル・分岐・ジャンプの行ならNone）
+        for j, asm in enumerate(new_lis):
+            flags = opcodes.INFO[asm.op].flags
+            i = old_idx.get(j)
+            if asm.op == opcodes.LABEL:
+                cur = None
+            elif flags & opcodes.IS_NOT_INSTR:
+                continue
+            elif i is None:
+                if cur is None:
+                    waiting.append(j)
+                else:
+                    block_instrs[cur].append(j)
+            else:
+                cur = old_block_of[i]
+                block_instrs[cur] += waiting
+                block_instrs[cur].append(j)
+                waiting = []
+                if flags & CONTROL_FLAGS:
+                    cur = None
+        if waiting or [] in block_instrs: # 最後の元からある命令より後ろに挿入した命令があるか，空になるブロックがある
+            self.lis = new_lis
+            self.build()
+            return
+        self.lis = new_lis
+        self.label_pos = labelPositions(new_lis)
+        self.instr_idx_list = getInstrIdxList(new_lis)
+        self.succ_instrs = getSuccInstrs(new_lis, self.label_pos)
+        self.block_of = {}
+        for b in range(len(self.blocks)):
+            self.blocks[b].instrs = block_instrs[b]
+            for j in block_instrs[b]:
+                self.block_of[j] = b
+
+    # updateInstrsで，元からある行が順番を変えずに残り，ラベル・分岐・ジャンプの行は全部そのまま（飛び先も同じで）残っていて，
+    # 新しい行にも置き換えた行にもラベル・分岐・ジャンプがないかどうか
+    def keepsBlocks (self, new_lis:List[virtual.Virtual_Asm], old_idx:Dict[int, int]) -> bool:
+        prev = -1
+        for j, asm in enumerate(new_lis):
+            i = old_idx.get(j)
+            if i is None:
+                if controlKey(asm) is not None:
+                    return False
+                continue
+            if i <= prev or controlKey(asm) != controlKey(self.lis[i]):
+                return False
+            prev = i
+        kept = set(old_idx.values())
+        for i, asm in enumerate(self.lis):
+            if i not in kept and controlKey(asm) is not None:
+                return False
+        return True
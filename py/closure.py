@@ -7,72 +7,90 @@
 
 from typing import List
 import re
+import sys
+import error
 
+# 木のノードは数が多いので,__slots__で属性を固定して__dict__を持たせない
 class Closure_t:
+    __slots__ = ()
     def __init__ (self):
         pass
 
 class Unit (Closure_t):
+    __slots__ = ()
     def __init__ (self):
         pass
 
 class Int (Closure_t):
+    __slots__ = ("val",)
     def __init__ (self, val:int):
         self.val = val
 
 class Float (Closure_t):
+    __slots__ = ("val",)
     def __init__ (self, val:float):
         self.val = val
 
 class Neg (Closure_t):
+    __slots__ = ("var",)
     def __init__ (self, var:str):
         self.var = var
 
 class Add (Closure_t):
+    __slots__ = ("var1", "var2")
     def __init__ (self, var1:str, var2:str):
         self.var1 = var1
         self.var2 = var2
 
 class Sub (Closure_t):
+    __slots__ = ("var1", "var2")
     def __init__ (self, var1:str, var2:str):
         self.var1 = var1
         self.var2 = var2
 
 class Mul (Closure_t):
+    __slots__ = ("var1", "var2")
     def __init__ (self, var1:str, var2:str):
         self.var1 = var1
         self.var2 = var2
 
 class Div (Closure_t):
+    __slots__ = ("var1", "var2")
     def __init__ (self, var1:str, var2:str):
         self.var1 = var1
         self.var2 = var2
 
 class FNeg (Closure_t):
+    __slots__ = ("var",)
     def __init__ (self, var:str):
         self.var = var
 
 class FAdd (Closure_t):
+    __slots__ = ("var1", "var2")
     def __init__ (self, var1:str, var2:str):
         self.var1 = var1
         self.var2 = var2
 
 class FSub (Closure_t):
+    __slots__ = ("var1", "var2")
     def __init__ (self, var1:str, var2:str):
         self.var1 = var1
         self.var2 = var2
 
 class FMul (Closure_t):
+    __slots__ = ("var1", "var2")
     def __init__ (self, var1:str, var2:str):
         self.var1 = var1
         self.var2 = var2
 
 class FDiv (Closure_t):
+    __slots__ = ("var1", "var2")
     def __init__ (self, var1:str, var2:str):
         self.var1 = var1
         self.var2 = var2
 
 class IfEq (Closure_t):
+    __slots__ = ("var1", "var2", "e1", "e2")
     def __init__ (self, var1:str, var2:str, e1:Closure_t, e2:Closure_t):
         self.var1 = var1
         self.var2 = var2
@@ -80,6 +98,7 @@ class IfEq (Closure_t):
         self.e2 = e2
 
 class IfNEq (Closure_t):
+    __slots__ = ("var1", "var2", "e1", "e2")
     def __init__ (self, var1:str, var2:str, e1:Closure_t, e2:Closure_t):
         self.var1 = var1
         self.var2 = var2
@@ -87,6 +106,7 @@ class IfNEq (Closure_t):
         self.e2 = e2
 
 class IfLE (Closure_t):
+    __slots__ = ("var1", "var2", "e1", "e2")
     def __init__ (self, var1:str, var2:str, e1:Closure_t, e2:Closure_t):
         self.var1 = var1
         self.var2 = var2
@@ -94,6 +114,7 @@ class IfLE (Closure_t):
         self.e2 = e2
 
 class IfLT (Closure_t):
+    __slots__ = ("var1", "var2", "e1", "e2")
     def __init__ (self, var1:str, var2:str, e1:Closure_t, e2:Closure_t):
         self.var1 = var1
         self.var2 = var2
@@ -101,6 +122,7 @@ class IfLT (Closure_t):
         self.e2 = e2
 
 class Let (Closure_t):
+    __slots__ = ("var", "type", "e1", "e2")
     def __init__ (self, var:str, type:str, e1:Closure_t, e2:Closure_t):
         self.var = var
         self.type = type
@@ -108,15 +130,18 @@ class Let (Closure_t):
         self.e2 = e2
 
 class Var (Closure_t):
+    __slots__ = ("var",)
     def __init__ (self, var:str):
         self.var = var
 
 class Closure:
+    __slots__ = ("entry", "actual_fv")
     def __init__ (self, entry:str, actual_fv:List[str]):
         self.entry = entry
         self.actual_fv = actual_fv
 
 class MakeCls (Closure_t):
+    __slots__ = ("var", "type", "closure", "e")
     def __init__ (self, var:str, type:str, closure:Closure, e:Closure_t):
         self.var = var
         self.type = type
@@ -124,41 +149,49 @@ class MakeCls (Closure_t):
         self.e = e
 
 class AppCls (Closure_t):
+    __slots__ = ("var", "args")
     def __init__ (self, var:str, args:List[str]):
         self.var = var
         self.args = args
 
 class AppDir (Closure_t):
+    __slots__ = ("var", "args")
     def __init__ (self, var:str, args:List[str]):
         self.var = var
         self.args = args
 
 class Tuple (Closure_t):
+    __slots__ = ("vars",)
     def __init__ (self, vars:List[str]):
         self.vars = vars
 
 class LetTuple (Closure_t):
+    __slots__ = ("vars", "var", "e")
     def __init__ (self, vars, var:str, e:Closure_t):
         self.vars = vars
         self.var = var
         self.e = e
 
 class Get (Closure_t):
+    __slots__ = ("var1", "var2")
     def __init__ (self, var1:str, var2:str):
         self.var1 = var1
         self.var2 = var2
 
 class Put (Closure_t):
+    __slots__ = ("var1", "var2", "var3")
     def __init__ (self, var1:str, var2:str, var3:str):
         self.var1 = var1
         self.var2 = var2
         self.var3 = var3
 
 class ExtArray (Closure_t):
+    __slots__ = ("var",)
     def __init__ (self, var:str):
         self.var = var
 
 class Fundef:
+    __slots__ = ("name", "args", "formal_fv", "body")
     def __init__ (self, name:List[str], args:List[List[str]], formal_fv, body:Closure_t):
         self.name = name
         self.args = args
@@ -166,169 +199,265 @@ class Fundef:
         self.body = body
 
 class Prog:
+    __slots__ = ("fundefs", "e", "first_hp")
     def __init__ (self, fundefs:List[Fundef], e:Closure_t, first_hp:int):
         self.fundefs = fundefs
         self.e = e
         self.first_hp = first_hp
 
+IF_TYPES = {IfEq, IfNEq, IfLE, IfLT}
+
+# closure_tの部分木を（自分自身も含めて）すべて返す（再帰呼び出しの代わりに明示的なスタックを使う）
+def subtrees (closure_t:Closure_t) -> List[Closure_t]:
+    nodes = []
+    stack = [closure_t]
+    while stack != []:
+        node = stack.pop()
+        nodes.append(node)
+        typ = type(node)
+        if typ is Let or typ in IF_TYPES:
+            stack.append(node.e2)
+            stack.append(node.e1)
+        elif typ is MakeCls or typ is LetTuple:
+            stack.append(node.e)
+    return nodes
+
 # パースの補助関数
-# strからList[str]に変換する
-def explode (text:str) -> List[str]:
-    if len(text) == 2:
-        return []
-    
-    bras = ['(', '{', '[']
-    kets = [')', '}', ']']
-    idx = 0
-    while text[idx] not in bras:
-        idx += 1
-    separators_idx = [idx] # set positions of , ( ) 
-
-    count = 0
-    for i in range(idx + 1, len(text)):
-        if text[i] in bras:
-            count += 1
-        elif text[i] in kets:
-            count -= 1
-        elif text[i] == ',' and count == 0:
-            separators_idx.append(i)
-    if text[-2] != ',': # 最後の要素のあとにもコンマがついている場合に対応
-        separators_idx.append(len(text) - 1)
-
-    # 取得したコンマの位置から実際にリストを作成する
+# 字句解析: 区切り記号 ( ) [ ] { } , : ; と,それ以外の連続する文字列(変数名・数値・型名の断片)に分解する
+# 入力全体を一度だけ走査するので,パースは入力長に対して線形時間で済む
+TOKEN_RE = re.compile(r'[()\[\]{},:;]|[^()\[\]{},:;\s]+')
+
+# 変数名は同じ文字列が何度も現れるので,sys.internで1つの文字列オブジェクトにまとめる
+def tokenize (text:str) -> List[str]:
+    return list(map(sys.intern, TOKEN_RE.findall(text)))
+
+class TokenStream:
+    def __init__ (self, text:str):
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek (self) -> str:
+        return self.tokens[self.pos]
+
+    def next (self) -> str:
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def expect (self, tok:str):
+        if self.tokens[self.pos] != tok:
+            error.error("Parse error: expected '{}' but got '{}' at token {}.".format(tok, self.tokens[self.pos], self.pos))
+        self.pos += 1
+
+# 型はpythonのデータ構造に変換せず文字列のまま保持する
+# 括弧の対応をとりながら,深さ0の , または ) が現れるまでのトークンを連結する
+def parseType (ts:TokenStream) -> str:
+    tokens = ts.tokens
+    start = ts.pos
+    pos = start
+    depth = 0
+    while True:
+        tok = tokens[pos]
+        if tok in '([{':
+            depth += 1
+        elif tok in ')]}':
+            if depth == 0:
+                break
+            depth -= 1
+        elif tok == ',' and depth == 0:
+            break
+        pos += 1
+    ts.pos = pos
+    return sys.intern("".join(tokens[start:pos]))
+
+# (x,type)
+def parseVarType (ts:TokenStream) -> List[str]:
+    ts.expect('(')
+    var = ts.next()
+    ts.expect(',')
+    type = parseType(ts)
+    ts.expect(')')
+    return [var, type]
+
+# [elem,elem,...,] (最後の要素のあとにもコンマがついている場合にも対応)
+def parseList (ts:TokenStream, parseElem) -> list:
+    ts.expect('[')
     ret = []
-    for i in range(len(separators_idx) - 1):
-        ret.append(text[(separators_idx[i]+1):(separators_idx[i+1])])
+    while ts.peek() != ']':
+        ret.append(parseElem(ts))
+        if ts.peek() == ',':
+            ts.pos += 1
+    ts.pos += 1
     return ret
 
-def str2Closure (text:str) -> Closure:
-    if re.match(r"^\{(.*)\}", text) != None:
-        entry = re.search(r'\{entry:(.*?),', text).group(1)
-        actual_fv = re.search(r'actual_fv:(.*?)\}', text).group(1)
-        actual_fv_list = explode(actual_fv)
-        return Closure(entry, actual_fv_list)
-
-def str2Closure_t (text:str) -> Closure_t:
-    if re.match(r"^Unit", text) != None:
+def parseName (ts:TokenStream) -> str:
+    return ts.next()
+
+# {entry:l,actual_fv:[...]}
+def parseClosure (ts:TokenStream) -> Closure:
+    ts.expect('{')
+    ts.expect('entry')
+    ts.expect(':')
+    entry = ts.next()
+    ts.expect(',')
+    ts.expect('actual_fv')
+    ts.expect(':')
+    actual_fv = parseList(ts, parseName)
+    ts.expect('}')
+    return Closure(entry, actual_fv)
+
+# 引数が変数名のみからなる構築子とそのクラス
+SIMPLE_NODES = {
+    "Neg": Neg, "FNeg": FNeg, "Var": Var, "ExtArray": ExtArray,
+    "Add": Add, "Sub": Sub, "Mul": Mul, "Div": Div,
+    "FAdd": FAdd, "FSub": FSub, "FMul": FMul, "FDiv": FDiv,
+    "Get": Get, "Put": Put,
+}
+IF_NODES = {"IfEq": IfEq, "IfNEq": IfNEq, "IfLE": IfLE, "IfLT": IfLT}
+
+def parseClosure_t (ts:TokenStream) -> Closure_t:
+    name = ts.next()
+    if name == "Unit":
         return Unit()
-    elif re.match(r"^Int\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Int(int(exploded_lis[0]))
-    elif re.match(r"^Float\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Float(float(exploded_lis[0]))
-    elif re.match(r"^Neg\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Neg(exploded_lis[0])
-    elif re.match(r"^Add\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Add(exploded_lis[0], exploded_lis[1])
-    elif re.match(r"^Sub\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Sub(exploded_lis[0], exploded_lis[1])
-    elif re.match(r"^Mul\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Mul(exploded_lis[0], exploded_lis[1])
-    elif re.match(r"^Div\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Div(exploded_lis[0], exploded_lis[1])
-    elif re.match(r"^FNeg\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return FNeg(exploded_lis[0])
-    elif re.match(r"^FAdd\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return FAdd(exploded_lis[0], exploded_lis[1])
-    elif re.match(r"^FSub\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return FSub(exploded_lis[0], exploded_lis[1])
-    elif re.match(r"^FMul\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return FMul(exploded_lis[0], exploded_lis[1])
-    elif re.match(r"^FDiv\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return FDiv(exploded_lis[0], exploded_lis[1])
-    elif re.match(r"^IfEq\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        e1 = str2Closure_t(exploded_lis[2])
-        e2 = str2Closure_t(exploded_lis[3])
-        return IfEq(exploded_lis[0], exploded_lis[1], e1, e2)
-    elif re.match(r"^IfNEq\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        e1 = str2Closure_t(exploded_lis[2])
-        e2 = str2Closure_t(exploded_lis[3])
-        return IfNEq(exploded_lis[0], exploded_lis[1], e1, e2)
-    elif re.match(r"^IfLE\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        e1 = str2Closure_t(exploded_lis[2])
-        e2 = str2Closure_t(exploded_lis[3])
-        return IfLE(exploded_lis[0], exploded_lis[1], e1, e2)
-    elif re.match(r"^IfLT\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        e1 = str2Closure_t(exploded_lis[2])
-        e2 = str2Closure_t(exploded_lis[3])
-        return IfLT(exploded_lis[0], exploded_lis[1], e1, e2)
-    elif re.match(r"^Let\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        var_type = explode(exploded_lis[0])
-        var = var_type[0]
-        type = var_type[1]
-        e1 = str2Closure_t(exploded_lis[1])
-        e2 = str2Closure_t(exploded_lis[2])
+    ts.expect('(')
+    if name in SIMPLE_NODES:
+        vars = [ts.next()]
+        while ts.next() == ',':
+            vars.append(ts.next())
+        return SIMPLE_NODES[name](*vars)
+    elif name == "Let":
+        var, type = parseVarType(ts)
+        ts.expect(',')
+        e1 = parseClosure_t(ts)
+        ts.expect(',')
+        e2 = parseClosure_t(ts)
+        ts.expect(')')
         return Let(var, type, e1, e2)
-    elif re.match(r"^Var\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Var(exploded_lis[0])
-    elif re.match(r"^MakeCls\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        var_type = explode(exploded_lis[0])
-        var = var_type[0]
-        type = var_type[1]
-        closure = str2Closure(exploded_lis[1])
-        e = str2Closure_t(exploded_lis[2])
+    elif name in IF_NODES:
+        var1 = ts.next()
+        ts.expect(',')
+        var2 = ts.next()
+        ts.expect(',')
+        e1 = parseClosure_t(ts)
+        ts.expect(',')
+        e2 = parseClosure_t(ts)
+        ts.expect(')')
+        return IF_NODES[name](var1, var2, e1, e2)
+    elif name == "Int":
+        val = int(ts.next())
+        ts.expect(')')
+        return Int(val)
+    elif name == "Float":
+        val = float(ts.next())
+        ts.expect(')')
+        return Float(val)
+    elif name == "AppCls" or name == "AppDir":
+        var = ts.next()
+        ts.expect(',')
+        args = parseList(ts, parseName)
+        ts.expect(')')
+        return AppCls(var, args) if name == "AppCls" else AppDir(var, args)
+    elif name == "MakeCls":
+        var, type = parseVarType(ts)
+        ts.expect(',')
+        closure = parseClosure(ts)
+        ts.expect(',')
+        e = parseClosure_t(ts)
+        ts.expect(')')
         return MakeCls(var, type, closure, e)
-    elif re.match(r"^AppCls\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        args = explode(exploded_lis[1])
-        return AppCls(exploded_lis[0], args)
-    elif re.match(r"^AppDir\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        args = explode(exploded_lis[1])
-        return AppDir(exploded_lis[0], args)
-    elif re.match(r"^Tuple\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        vars = explode(exploded_lis[0])
+    elif name == "Tuple":
+        vars = parseList(ts, parseName)
+        ts.expect(')')
         return Tuple(vars)
-    elif re.match(r"^LetTuple\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        vars_tmp = explode(exploded_lis[0])
-        vars = []
-        for var in vars_tmp:
-            vars.append(explode(var))
-        e = str2Closure_t(exploded_lis[2])
-        return LetTuple(vars, exploded_lis[1], e)
-    elif re.match(r"^Get\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Get(exploded_lis[0], exploded_lis[1])
-    elif re.match(r"^Put\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return Put(exploded_lis[0], exploded_lis[1], exploded_lis[2])
-    elif re.match(r"^ExtArray\((.*)\)", text) != None:
-        exploded_lis = explode(text)
-        return ExtArray(exploded_lis[0])
-
-def str2Fundef_list (text:str) -> List[Fundef]:
-    fundefs = explode(text)
-    ret = []
-    for fundef in fundefs:
-        name = explode(re.search(r'name:(.*),args', fundef).group(1))
-        args_tmp = explode(re.search(r'args:(.*),formal_fv', fundef).group(1))
-        args = []
-        for arg in args_tmp:
-            args.append(explode(arg))
-        formal_fv_tmp = explode(re.search(r'formal_fv:(.*),body', fundef).group(1))
-        formal_fv = []
-        for fv in formal_fv_tmp:
-            formal_fv.append(explode(fv))
-        body = str2Closure_t(re.search(r'body:(.*)\}', fundef).group(1))
-        ret.append(Fundef(name, args, formal_fv, body))
-    return ret
+    elif name == "LetTuple":
+        vars = parseList(ts, parseVarType)
+        ts.expect(',')
+        var = ts.next()
+        ts.expect(',')
+        e = parseClosure_t(ts)
+        ts.expect(')')
+        return LetTuple(vars, var, e)
+    else:
+        error.error("Invalid Closure Type: {}.".format(name))
+
+# parseClosure_tと同じ結果を,再帰呼び出しの代わりに明示的なスタックを使って計算する
+# 長いLetの連鎖でも再帰の深さ制限に依存しない
+# スタックの各要素は [構築子の名前, 子以外の要素, 読み終えた子のリスト, 子の個数]
+def parseClosure_t_iter (ts:TokenStream) -> Closure_t:
+    stack = []
+    while True:
+        # 子を持つノードは先頭部分だけ読んでスタックに積み,子を持たないノードはparseClosure_tで読む
+        name = ts.peek()
+        if name == "Let" or name == "MakeCls" or name in IF_NODES or name == "LetTuple":
+            ts.pos += 2 # 構築子の名前と (
+            if name == "Let":
+                stack.append([name, parseVarType(ts), [], 2])
+            elif name == "MakeCls":
+                var_type = parseVarType(ts)
+                ts.expect(',')
+                stack.append([name, var_type + [parseClosure(ts)], [], 1])
+            elif name == "LetTuple":
+                vars = parseList(ts, parseVarType)
+                ts.expect(',')
+                stack.append([name, [vars, ts.next()], [], 1])
+            else:
+                var1 = ts.next()
+                ts.expect(',')
+                stack.append([name, [var1, ts.next()], [], 2])
+            ts.expect(',')
+            continue
+        val = parseClosure_t(ts)
+
+        # 読み終えたノードを親に渡し,親の子が揃ったら親を組み立てる
+        while True:
+            if stack == []:
+                return val
+            frame = stack[-1]
+            frame[2].append(val)
+            if len(frame[2]) < frame[3]:
+                ts.expect(',')
+                break
+            ts.expect(')')
+            stack.pop()
+            name, fields, children, _ = frame
+            if name == "Let":
+                val = Let(fields[0], fields[1], children[0], children[1])
+            elif name == "MakeCls":
+                val = MakeCls(fields[0], fields[1], fields[2], children[0])
+            elif name == "LetTuple":
+                val = LetTuple(fields[0], fields[1], children[0])
+            else:
+                val = IF_NODES[name](fields[0], fields[1], children[0], children[1])
+
+# use_explicit_stackがTrueのときはparseClosure_t_iterを使う
+def parseBody (ts:TokenStream, use_explicit_stack:bool = False) -> Closure_t:
+    if use_explicit_stack:
+        return parseClosure_t_iter(ts)
+    return parseClosure_t(ts)
+
+# {name:(l,type),args:[...],formal_fv:[...],body:e}
+def parseFundef (ts:TokenStream, use_explicit_stack:bool = False) -> Fundef:
+    ts.expect('{')
+    ts.expect('name')
+    ts.expect(':')
+    name = parseVarType(ts)
+    ts.expect(',')
+    ts.expect('args')
+    ts.expect(':')
+    args = parseList(ts, parseVarType)
+    ts.expect(',')
+    ts.expect('formal_fv')
+    ts.expect(':')
+    formal_fv = parseList(ts, parseVarType)
+    ts.expect(',')
+    ts.expect('body')
+    ts.expect(':')
+    body = parseBody(ts, use_explicit_stack)
+    ts.expect('}')
+    return Fundef(name, args, formal_fv, body)
+
+def str2Closure_t (text:str, use_explicit_stack:bool = False) -> Closure_t:
+    return parseBody(TokenStream(text), use_explicit_stack)
+
+def str2Fundef_list (text:str, use_explicit_stack:bool = False) -> List[Fundef]:
+    return parseList(TokenStream(text), lambda ts: parseFundef(ts, use_explicit_stack))
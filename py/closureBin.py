@@ -0,0 +1,368 @@
+#--------------------------------------------------
+#
+# closureBin.py
+# closure変換まで行われたデータのバイナリ形式(closure.mlのclosureProg2Binaryが出力する)の読み書きを行う
+#
+#--------------------------------------------------
+
+# 形式 (数値はすべてリトルエンディアン)
+#   "PYCB" / version:u32 / first_hp:i64
+#   文字列表: 個数:u32, (長さ:u32, utf-8のバイト列) * 個数
+#   fundef list: 個数:u32, (name:str, type:str, args:list(xt), formal_fv:list(xt), body:t) * 個数
+#   t
+# str は文字列表の番号(u32), list は 個数:u32 のあとに要素を並べたもの, xt は (var:str, type:str)
+# t はタグ1byteのあとにそのノードの要素を並べたもの (Int は i64, Float は f64)
+# リストの並び順はテキスト形式と同じ(OCaml側のリストの逆順)
+
+from typing import List
+import mmap
+import struct
+import sys
+import closure
+import error
+
+MAGIC = b"PYCB"
+VERSION = 1
+
+U32 = struct.Struct("<I")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+
+# 形式が正しくないデータを読んだときのエラー（loadProgはerror.errorで止め，progCacheはキャッシュに無かったものとして扱う）
+class FormatError (Exception):
+    pass
+
+# タグはclosure.mlのClosure.tの構築子の順番と同じ
+TAG_UNIT = 0
+TAG_INT = 1
+TAG_FLOAT = 2
+TAG_NEG = 3
+TAG_ADD = 4
+TAG_SUB = 5
+TAG_MUL = 6
+TAG_DIV = 7
+TAG_FNEG = 8
+TAG_FADD = 9
+TAG_FSUB = 10
+TAG_FMUL = 11
+TAG_FDIV = 12
+TAG_IFEQ = 13
+TAG_IFNEQ = 14
+TAG_IFLE = 15
+TAG_IFLT = 16
+TAG_LET = 17
+TAG_VAR = 18
+TAG_MAKECLS = 19
+TAG_APPCLS = 20
+TAG_APPDIR = 21
+TAG_TUPLE = 22
+TAG_LETTUPLE = 23
+TAG_GET = 24
+TAG_PUT = 25
+TAG_EXTARRAY = 26
+
+# 変数名1つを引数にとるノード
+ONE_VAR_TAGS = {TAG_NEG: closure.Neg, TAG_FNEG: closure.FNeg, TAG_VAR: closure.Var, TAG_EXTARRAY: closure.ExtArray}
+# 変数名2つを引数にとるノード
+TWO_VAR_TAGS = {
+    TAG_ADD: closure.Add, TAG_SUB: closure.Sub, TAG_MUL: closure.Mul, TAG_DIV: closure.Div,
+    TAG_FADD: closure.FAdd, TAG_FSUB: closure.FSub, TAG_FMUL: closure.FMul, TAG_FDIV: closure.FDiv,
+    TAG_GET: closure.Get,
+}
+IF_TAGS = {TAG_IFEQ: closure.IfEq, TAG_IFNEQ: closure.IfNEq, TAG_IFLE: closure.IfLE, TAG_IFLT: closure.IfLT}
+
+#--------------------------------------------------
+# 読み込み
+#--------------------------------------------------
+
+class BinaryReader:
+    def __init__ (self, buf):
+        self.buf = buf
+        self.pos = 0
+        self.strs = []
+
+    def u8 (self) -> int:
+        val = self.buf[self.pos]
+        self.pos += 1
+        return val
+
+    def u32 (self) -> int:
+        val = U32.unpack_from(self.buf, self.pos)[0]
+        self.pos += 4
+        return val
+
+    def i64 (self) -> int:
+        val = I64.unpack_from(self.buf, self.pos)[0]
+        self.pos += 8
+        return val
+
+    def f64 (self) -> float:
+        val = F64.unpack_from(self.buf, self.pos)[0]
+        self.pos += 8
+        return val
+
+    def sym (self) -> str:
+        val = self.strs[U32.unpack_from(self.buf, self.pos)[0]]
+        self.pos += 4
+        return val
+
+    def symList (self) -> List[str]:
+        return [self.sym() for _ in range(self.u32())]
+
+    def xtList (self) -> List[List[str]]:
+        return [[self.sym(), self.sym()] for _ in range(self.u32())]
+
+def readStringTable (r:BinaryReader):
+    buf = r.buf
+    for _ in range(r.u32()):
+        length = r.u32()
+        r.strs.append(sys.intern(str(buf[r.pos:r.pos+length], "utf-8")))
+        r.pos += length
+
+def readClosure_t (r:BinaryReader) -> closure.Closure_t:
+    tag = r.u8()
+    if tag in TWO_VAR_TAGS:
+        return TWO_VAR_TAGS[tag](r.sym(), r.sym())
+    elif tag == TAG_LET:
+        var = r.sym()
+        type = r.sym()
+        e1 = readClosure_t(r)
+        e2 = readClosure_t(r)
+        return closure.Let(var, type, e1, e2)
+    elif tag in ONE_VAR_TAGS:
+        return ONE_VAR_TAGS[tag](r.sym())
+    elif tag in IF_TAGS:
+        var1 = r.sym()
+        var2 = r.sym()
+        e1 = readClosure_t(r)
+        e2 = readClosure_t(r)
+        return IF_TAGS[tag](var1, var2, e1, e2)
+    elif tag == TAG_INT:
+        return closure.Int(r.i64())
+    elif tag == TAG_FLOAT:
+        return closure.Float(r.f64())
+    elif tag == TAG_UNIT:
+        return closure.Unit()
+    elif tag == TAG_APPDIR:
+        var = r.sym()
+        return closure.AppDir(var, r.symList())
+    elif tag == TAG_APPCLS:
+        var = r.sym()
+        return closure.AppCls(var, r.symList())
+    elif tag == TAG_MAKECLS:
+        var = r.sym()
+        type = r.sym()
+        entry = r.sym()
+        actual_fv = r.symList()
+        e = readClosure_t(r)
+        return closure.MakeCls(var, type, closure.Closure(entry, actual_fv), e)
+    elif tag == TAG_TUPLE:
+        return closure.Tuple(r.symList())
+    elif tag == TAG_LETTUPLE:
+        vars = r.xtList()
+        var = r.sym()
+        return closure.LetTuple(vars, var, readClosure_t(r))
+    elif tag == TAG_PUT:
+        return closure.Put(r.sym(), r.sym(), r.sym())
+    else:
+        raise FormatError("Invalid tag {} at offset {}.".format(tag, r.pos - 1))
+
+# readClosure_tと同じ結果を,再帰呼び出しの代わりに明示的なスタックを使って計算する
+# スタックの各要素は [タグ, 子以外の要素, 読み終えた子のリスト, 子の個数]
+def readClosure_t_iter (r:BinaryReader) -> closure.Closure_t:
+    stack = []
+    buf = r.buf
+    while True:
+        # 子を持つノードは先頭部分だけ読んでスタックに積み,子を持たないノードはreadClosure_tで読む
+        tag = buf[r.pos]
+        if tag == TAG_LET or tag in IF_TAGS:
+            r.pos += 1
+            stack.append([tag, [r.sym(), r.sym()], [], 2])
+            continue
+        elif tag == TAG_MAKECLS:
+            r.pos += 1
+            stack.append([tag, [r.sym(), r.sym(), r.sym(), r.symList()], [], 1])
+            continue
+        elif tag == TAG_LETTUPLE:
+            r.pos += 1
+            stack.append([tag, [r.xtList(), r.sym()], [], 1])
+            continue
+        val = readClosure_t(r)
+
+        # 読み終えたノードを親に渡し,親の子が揃ったら親を組み立てる
+        while stack != []:
+            frame = stack[-1]
+            frame[2].append(val)
+            if len(frame[2]) < frame[3]:
+                break
+            stack.pop()
+            tag, fields, children, _ = frame
+            if tag == TAG_LET:
+                val = closure.Let(fields[0], fields[1], children[0], children[1])
+            elif tag == TAG_MAKECLS:
+                val = closure.MakeCls(fields[0], fields[1], closure.Closure(fields[2], fields[3]), children[0])
+            elif tag == TAG_LETTUPLE:
+                val = closure.LetTuple(fields[0], fields[1], children[0])
+            else:
+                val = IF_TAGS[tag](fields[0], fields[1], children[0], children[1])
+        if stack == []:
+            return val
+
+# use_explicit_stackがTrueのときはreadClosure_t_iterを使う
+def readBody (r:BinaryReader, use_explicit_stack:bool = False) -> closure.Closure_t:
+    if use_explicit_stack:
+        return readClosure_t_iter(r)
+    return readClosure_t(r)
+
+def readFundef (r:BinaryReader, use_explicit_stack:bool = False) -> closure.Fundef:
+    name = [r.sym(), r.sym()]
+    args = r.xtList()
+    formal_fv = r.xtList()
+    body = readBody(r, use_explicit_stack)
+    return closure.Fundef(name, args, formal_fv, body)
+
+def buf2Prog (buf, use_explicit_stack:bool = False) -> closure.Prog:
+    if buf[0:4] != MAGIC:
+        raise FormatError("Not a pycaml binary intermediate file.")
+    r = BinaryReader(buf)
+    r.pos = 4
+    version = r.u32()
+    if version != VERSION:
+        raise FormatError("Unsupported binary intermediate version: {} (expected {}).".format(version, VERSION))
+    first_hp = r.i64()
+    readStringTable(r)
+    fundefs = [readFundef(r, use_explicit_stack) for _ in range(r.u32())]
+    e = readBody(r, use_explicit_stack)
+    return closure.Prog(fundefs, e, first_hp)
+
+# ファイルはmmapで開き,バッファから直接読み出す（形式が正しくなければFormatErrorを投げる）
+def readProg (path:str, use_explicit_stack:bool = False) -> closure.Prog:
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return buf2Prog(buf, use_explicit_stack)
+
+# readProgと同じだが，形式が正しくなければエラーで止める
+def loadProg (path:str, use_explicit_stack:bool = False) -> closure.Prog:
+    try:
+        return readProg(path, use_explicit_stack)
+    except FormatError as e:
+        error.error(str(e))
+
+#--------------------------------------------------
+# 書き出し (OCaml側と同じ形式, テキスト形式からの変換などに使う)
+#--------------------------------------------------
+
+class BinaryWriter:
+    def __init__ (self):
+        self.out = bytearray()
+        self.strs = {}
+
+    def u8 (self, val:int):
+        self.out.append(val)
+
+    def u32 (self, val:int):
+        self.out += U32.pack(val)
+
+    def sym (self, val:str):
+        if val not in self.strs:
+            self.strs[val] = len(self.strs)
+        self.out += U32.pack(self.strs[val])
+
+    def symList (self, vals:List[str]):
+        self.u32(len(vals))
+        for val in vals:
+            self.sym(val)
+
+    def xtList (self, vals:List[List[str]]):
+        self.u32(len(vals))
+        for var, type in vals:
+            self.sym(var)
+            self.sym(type)
+
+TAGS_OF_CLASS = {}
+for tags in [ONE_VAR_TAGS, TWO_VAR_TAGS, IF_TAGS]:
+    for tag in tags:
+        TAGS_OF_CLASS[tags[tag]] = tag
+
+# 木を前順に書き出す（深いLetの連鎖でも再帰しないように，これから書き出す木をスタックに積んでおく）
+def writeClosure_t (w:BinaryWriter, closure_t:closure.Closure_t):
+    stack = [closure_t]
+    while stack != []:
+        closure_t = stack.pop()
+        typ = type(closure_t)
+        if typ in TAGS_OF_CLASS:
+            tag = TAGS_OF_CLASS[typ]
+            w.u8(tag)
+            if tag in ONE_VAR_TAGS:
+                w.sym(closure_t.var)
+            else:
+                w.sym(closure_t.var1)
+                w.sym(closure_t.var2)
+                if tag in IF_TAGS:
+                    stack.append(closure_t.e2)
+                    stack.append(closure_t.e1)
+        elif typ is closure.Let:
+            w.u8(TAG_LET)
+            w.sym(closure_t.var)
+            w.sym(closure_t.type)
+            stack.append(closure_t.e2)
+            stack.append(closure_t.e1)
+        elif typ is closure.Int:
+            w.u8(TAG_INT)
+            w.out += I64.pack(closure_t.val)
+        elif typ is closure.Float:
+            w.u8(TAG_FLOAT)
+            w.out += F64.pack(closure_t.val)
+        elif typ is closure.Unit:
+            w.u8(TAG_UNIT)
+        elif typ is closure.AppDir or typ is closure.AppCls:
+            w.u8(TAG_APPDIR if typ is closure.AppDir else TAG_APPCLS)
+            w.sym(closure_t.var)
+            w.symList(closure_t.args)
+        elif typ is closure.MakeCls:
+            w.u8(TAG_MAKECLS)
+            w.sym(closure_t.var)
+            w.sym(closure_t.type)
+            w.sym(closure_t.closure.entry)
+            w.symList(closure_t.closure.actual_fv)
+            stack.append(closure_t.e)
+        elif typ is closure.Tuple:
+            w.u8(TAG_TUPLE)
+            w.symList(closure_t.vars)
+        elif typ is closure.LetTuple:
+            w.u8(TAG_LETTUPLE)
+            w.xtList(closure_t.vars)
+            w.sym(closure_t.var)
+            stack.append(closure_t.e)
+        elif typ is closure.Put:
+            w.u8(TAG_PUT)
+            w.sym(closure_t.var1)
+            w.sym(closure_t.var2)
+            w.sym(closure_t.var3)
+        else:
+            error.error("Invalid Closure Type.")
+
+def prog2Bytes (prog:closure.Prog) -> bytes:
+    w = BinaryWriter()
+    w.u32(len(prog.fundefs))
+    for fundef in prog.fundefs:
+        w.sym(fundef.name[0])
+        w.sym(fundef.name[1])
+        w.xtList(fundef.args)
+        w.xtList(fundef.formal_fv)
+        writeClosure_t(w, fundef.body)
+    writeClosure_t(w, prog.e)
+
+    header = bytearray(MAGIC)
+    header += U32.pack(VERSION)
+    header += I64.pack(prog.first_hp)
+    header += U32.pack(len(w.strs))
+    for s in w.strs: # 辞書は挿入順なので番号順に並ぶ
+        encoded = s.encode("utf-8")
+        header += U32.pack(len(encoded))
+        header += encoded
+    return bytes(header + w.out)
+
+def dumpProg (prog:closure.Prog, path:str):
+    with open(path, "wb") as f:
+        f.write(prog2Bytes(prog))
@@ -5,17 +5,40 @@
 #
 #--------------------------------------------------
 
+from typing import Dict, List, Set
 import closure
-import copy
+import reglist
+import context
+import cfg
 
-# 環境envに対して{key => value}のペアを加える
-def add (env, key, value):
-    new_env = copy.deepcopy(env)
-    new_env[key] = value
-    return new_env
+# 定数 => 定数レジスタ の表はctx.int_const_regs, ctx.float_const_regs（context.CompilationContext.setConstRegsで設定する）
+
+# 環境constenvは変数名 => 定数レジスタ名 のdictで,Letの処理の間だけ束縛を加えて,終わったら元に戻す
+# （束縛のたびにdictをコピーしないので,束縛の追加・削除はO(1)で済む）
+
+# 環境envに{key => value}の束縛を加え,元の束縛（なければNone）を返す
+def bind (env, key, value):
+    prev = env.get(key)
+    env[key] = value
+    return prev
+
+# bindで加えた束縛を取り除き,bindの前の状態に戻す
+def unbind (env, key, prev):
+    if prev is None:
+        del env[key]
+    else:
+        env[key] = prev
+
+# Letのe1が定数レジスタに置き換えられる定数であれば,その定数レジスタの名前を返す
+def constRegOfLet (ctx:context.CompilationContext, closure_t:closure.Let):
+    if type(closure_t.e1) is closure.Int:
+        return ctx.int_const_regs.get(closure_t.e1.val)
+    elif type(closure_t.e1) is closure.Float:
+        return ctx.float_const_regs.get(closure_t.e1.val)
+    return None
 
 # メイン部分
-def constReg (closure_t:closure.Closure_t, constenv) -> closure.Closure_t:
+def constReg (ctx:context.CompilationContext, closure_t:closure.Closure_t, constenv) -> closure.Closure_t:
     typ = type(closure_t)
 
     # Varが定数レジスタで置き換えることができる場合、置き換えて返す
@@ -23,88 +46,38 @@ def constReg (closure_t:closure.Closure_t, constenv) -> closure.Closure_t:
         return closure.Var(constenv[closure_t.var])
 
     # Let((x,t), e1, e2)において、e1がIntかFloatであって、対応する定数レジスタがあるとき、xは定数レジスタとして置き換えることができる
+    # (どの定数がどのレジスタに対応するかはctx.int_const_regs, ctx.float_const_regsを参照)
     elif typ is closure.Let:
-        # e1がIntである場合
-        if type(closure_t.e1) is closure.Int:
-            if closure_t.e1.val == 0: # 0レジスタに置き換えることができる
-                return closure.Let(
-                    closure_t.var,
-                    closure_t.type,
-                    constReg(closure_t.e1, constenv),
-                    # e1を0レジスタとして置き換えることができるので、constenvに加えた上で次の計算を進める
-                    constReg(closure_t.e2, add(constenv, closure_t.var, "x0"))
-                )
-            elif closure_t.e1.val == 1: # 1レジスタに置き換えることができる
-                return closure.Let(
-                    closure_t.var,
-                    closure_t.type,
-                    constReg(closure_t.e1, constenv),
-                    constReg(closure_t.e2, add(constenv, closure_t.var, "x25"))
-                )
-            elif closure_t.e1.val == 2: # 2レジスタに置き換えることができる
-                return closure.Let(
-                    closure_t.var,
-                    closure_t.type, 
-                    constReg(closure_t.e1, constenv),
-                    constReg(closure_t.e2, add(constenv, closure_t.var, "x26"))
-                )
-            elif closure_t.e1.val == 3: # 3レジスタに置き換えることができる
-                return closure.Let(
-                    closure_t.var,
-                    closure_t.type,
-                    constReg(closure_t.e1, constenv),
-                    constReg(closure_t.e2, add(constenv, closure_t.var, "x27"))
-                )
-            else: # 対応する定数整数レジスタがないので、環境を変えることなくe2の計算を進める
-                return closure.Let(closure_t.var, closure_t.type, constReg(closure_t.e1, constenv), constReg(closure_t.e2, constenv))
-        # e1がFloatである場合（以下Intである場合と同じロジック）
-        elif type(closure_t.e1) is closure.Float:
-            if closure_t.e1.val == 0.0:
-                return closure.Let(
-                    closure_t.var,
-                    closure_t.type,
-                    constReg(closure_t.e1, constenv),
-                    constReg(closure_t.e2, add(constenv, closure_t.var, "f25"))
-                )
-            elif closure_t.e1.val == 1.0:
-                return closure.Let(
-                    closure_t.var,
-                    closure_t.type,
-                    constReg(closure_t.e1, constenv),
-                    constReg(closure_t.e2, add(constenv, closure_t.var, "f26"))
-                )
-            elif closure_t.e1.val == 2.0:
-                return closure.Let(
-                    closure_t.var,
-                    closure_t.type,
-                    constReg(closure_t.e1, constenv),
-                    constReg(closure_t.e2, add(constenv, closure_t.var, "f27"))
-                )
-            else:
-                return closure.Let(closure_t.var, closure_t.type, constReg(closure_t.e1, constenv), constReg(closure_t.e2, constenv))
-        else: # e1がIntでもFloatでもないので定数レジスタとして置き換えることはできない
-            return closure.Let(closure_t.var, closure_t.type, constReg(closure_t.e1, constenv), constReg(closure_t.e2, constenv))
+        e1 = constReg(ctx, closure_t.e1, constenv)
+        reg = constRegOfLet(ctx, closure_t)
+        if reg is None: # 対応する定数レジスタがないので、環境を変えることなくe2の計算を進める
+            e2 = constReg(ctx, closure_t.e2, constenv)
+        else: # e1を定数レジスタとして置き換えることができるので、constenvに加えた上で次の計算を進め、終わったら元に戻す
+            prev = bind(constenv, closure_t.var, reg)
+            e2 = constReg(ctx, closure_t.e2, constenv)
+            unbind(constenv, closure_t.var, prev)
+        return closure.Let(closure_t.var, closure_t.type, e1, e2)
 
     # If((var1, var2), e1, e2)において、var1とvar2は置き換えられるなら置き換えた上で、e1,e2の計算を進める
     elif typ is closure.IfEq:
         var1 = constenv[closure_t.var1] if closure_t.var1 in constenv else closure_t.var1
         var2 = constenv[closure_t.var2] if closure_t.var2 in constenv else closure_t.var2
-        return closure.IfEq(var1, var2, constReg(closure_t.e1, constenv), constReg(closure_t.e2, constenv))
+        return closure.IfEq(var1, var2, constReg(ctx, closure_t.e1, constenv), constReg(ctx, closure_t.e2, constenv))
     elif typ is closure.IfNEq:
         var1 = constenv[closure_t.var1] if closure_t.var1 in constenv else closure_t.var1
         var2 = constenv[closure_t.var2] if closure_t.var2 in constenv else closure_t.var2
-        return closure.IfNEq(var1, var2, constReg(closure_t.e1, constenv), constReg(closure_t.e2, constenv))
+        return closure.IfNEq(var1, var2, constReg(ctx, closure_t.e1, constenv), constReg(ctx, closure_t.e2, constenv))
     elif typ is closure.IfLE:
         var1 = constenv[closure_t.var1] if closure_t.var1 in constenv else closure_t.var1
         var2 = constenv[closure_t.var2] if closure_t.var2 in constenv else closure_t.var2
-        return closure.IfLE(var1, var2, constReg(closure_t.e1, constenv), constReg(closure_t.e2, constenv))
+        return closure.IfLE(var1, var2, constReg(ctx, closure_t.e1, constenv), constReg(ctx, closure_t.e2, constenv))
     elif typ is closure.IfLT:
         var1 = constenv[closure_t.var1] if closure_t.var1 in constenv else closure_t.var1
         var2 = constenv[closure_t.var2] if closure_t.var2 in constenv else closure_t.var2
-        return closure.IfLT(var1, var2, constReg(closure_t.e1, constenv), constReg(closure_t.e2, constenv))
+        return closure.IfLT(var1, var2, constReg(ctx, closure_t.e1, constenv), constReg(ctx, closure_t.e2, constenv))
 
     elif typ is closure.LetTuple:
-        return closure.LetTuple(closure_t.vars, closure_t.var, constReg(closure_t.e, constenv))
+        return closure.LetTuple(closure_t.vars, closure_t.var, constReg(ctx, closure_t.e, constenv))
 
     # 引数を置き換えられるなら置き換える
     elif typ is closure.Add:
@@ -158,3 +131,180 @@ def constReg (closure_t:closure.Closure_t, constenv) -> closure.Closure_t:
     
     else:
         return closure_t
+
+# constRegと同じ結果を,再帰呼び出しの代わりに明示的なスタックを使って計算する
+# tasks: これから行う処理のスタック。("visit", 木)は木を変換して結果をresultsに積む処理,
+#        ("build", 木)はresultsから子の変換結果を取り出して木を組み立て直す処理,
+#        ("bind", 変数, レジスタ), ("unbind", 変数)はLetのe2の処理の前後で環境に束縛を加える・取り除く処理
+def constReg_iter (ctx:context.CompilationContext, closure_t:closure.Closure_t, constenv) -> closure.Closure_t:
+    tasks = [("visit", closure_t)]
+    results = []
+    saved = [] # bindで上書きした元の束縛
+    while tasks != []:
+        task = tasks.pop()
+        kind = task[0]
+        if kind == "bind":
+            saved.append(bind(constenv, task[1], task[2]))
+            continue
+        elif kind == "unbind":
+            unbind(constenv, task[1], saved.pop())
+            continue
+        node = task[1]
+        typ = type(node)
+        if kind == "visit":
+            if typ is closure.Let:
+                reg = constRegOfLet(ctx, node)
+                tasks.append(("build", node))
+                if reg is None:
+                    tasks.append(("visit", node.e2))
+                else:
+                    tasks.append(("unbind", node.var))
+                    tasks.append(("visit", node.e2))
+                    tasks.append(("bind", node.var, reg))
+                tasks.append(("visit", node.e1))
+            elif typ in closure.IF_TYPES:
+                var1 = constenv[node.var1] if node.var1 in constenv else node.var1
+                var2 = constenv[node.var2] if node.var2 in constenv else node.var2
+                tasks.append(("build", typ(var1, var2, None, None)))
+                tasks.append(("visit", node.e2))
+                tasks.append(("visit", node.e1))
+            elif typ is closure.LetTuple:
+                tasks.append(("build", node))
+                tasks.append(("visit", node.e))
+            else: # 子を持たないノードはconstRegで変換する（再帰しない）
+                results.append(constReg(ctx, node, constenv))
+        else:
+            if typ is closure.Let:
+                e2 = results.pop()
+                e1 = results.pop()
+                results.append(closure.Let(node.var, node.type, e1, e2))
+            elif typ in closure.IF_TYPES:
+                node.e2 = results.pop()
+                node.e1 = results.pop()
+                results.append(node)
+            else:
+                results.append(closure.LetTuple(node.vars, node.var, results.pop()))
+    return results[0]
+
+# 以下,どの定数に定数レジスタを割り当てるかを決める解析
+#
+# 定数ごとに,constRegで定数レジスタに置き換えられる位置での使用回数を数え,
+# 使われている関数のループの深さ（再帰の深さの見積もり）で重み付けした合計が大きいものから順に定数レジスタを割り当てる
+
+# ループの深さが1増えるごとに何倍の回数実行されると見積もるか（cfgの実行頻度の見積もりと同じ値を使う）
+LOOP_WEIGHT = cfg.LOOP_WEIGHT
+# 重みの計算で考えるループの深さの上限
+MAX_LOOP_DEPTH = cfg.MAX_LOOP_DEPTH
+
+# constRegで定数レジスタに置き換えられる位置に現れる変数名のリスト
+def substitutableVars (closure_t:closure.Closure_t) -> List[str]:
+    typ = type(closure_t)
+    if typ is closure.Var:
+        return [closure_t.var]
+    elif typ in closure.IF_TYPES or typ in ARITH_TYPES:
+        return [closure_t.var1, closure_t.var2]
+    elif typ is closure.Tuple:
+        return closure_t.vars
+    return []
+
+ARITH_TYPES = {closure.Add, closure.Sub, closure.Mul, closure.Div, closure.FAdd, closure.FSub, closure.FMul, closure.FDiv}
+
+# 関数名 => その関数が呼び出す（クロージャを作る）関数名の集合
+def callGraph (fundefs:List[closure.Fundef]) -> Dict[str, Set[str]]:
+    names = {fundef.name[0] for fundef in fundefs}
+    graph = {}
+    for fundef in fundefs:
+        callees = set()
+        for node in closure.subtrees(fundef.body):
+            typ = type(node)
+            if (typ is closure.AppDir or typ is closure.AppCls) and node.var in names:
+                callees.add(node.var)
+            elif typ is closure.MakeCls and node.closure.entry in names:
+                callees.add(node.closure.entry)
+        graph[fundef.name[0]] = callees
+    return graph
+
+# 関数名 => ループの深さの見積もり
+# 再帰している（呼び出しをたどって自分に戻ってこられる）関数は,それを呼び出す関数より1深いループとみなす
+def loopDepths (fundefs:List[closure.Fundef]) -> Dict[str, int]:
+    graph = callGraph(fundefs)
+
+    # 関数名 => 1回以上呼び出しをたどって到達できる関数名の集合
+    reach = {}
+    for name in graph:
+        visited = set()
+        stack = list(graph[name])
+        while stack != []:
+            callee = stack.pop()
+            if callee not in visited:
+                visited.add(callee)
+                stack.extend(graph[callee])
+        reach[name] = visited
+
+    depths = {name: (1 if name in reach[name] else 0) for name in graph}
+    changed = True
+    while changed:
+        changed = False
+        for caller in graph:
+            for callee in graph[caller]:
+                if caller in reach[callee]: # 同じ再帰の中の関数どうしは同じ深さ
+                    depth = depths[caller]
+                else:
+                    depth = depths[caller] + (1 if callee in reach[callee] else 0)
+                depth = min(depth, MAX_LOOP_DEPTH)
+                if depth > depths[callee]:
+                    depths[callee] = depth
+                    changed = True
+    return depths
+
+# closure_tの中で,定数レジスタに置き換えられる位置で定数が使われる回数をweight倍してcountsに足す
+# counts: ("int"か"float", 値) => 重み付きの使用回数
+def countConstUses (closure_t:closure.Closure_t, weight:int, counts):
+    consts = {} # 定数を束縛している変数名 => ("int"か"float", 値)
+    for node in closure.subtrees(closure_t):
+        typ = type(node)
+        if typ is closure.Let:
+            if type(node.e1) is closure.Int:
+                consts[node.var] = ("int", node.e1.val)
+            elif type(node.e1) is closure.Float and str(node.e1.val) != "-0.0": # -0.0は0.0と区別できないので数えない
+                consts[node.var] = ("float", node.e1.val)
+        for var in substitutableVars(node):
+            if var in consts:
+                key = consts[var]
+                counts[key] = counts.get(key, 0) + weight
+
+# inline.pyで0.0の定数レジスタとの比較に置き換える組み込み関数
+ZERO_COMPARE_FUNCS = {"min_caml_fisneg", "min_caml_fispos", "min_caml_fiszero"}
+
+# progがZERO_COMPARE_FUNCSのどれかを呼び出しているか
+def usesZeroCompare (prog:closure.Prog) -> bool:
+    for body in [fundef.body for fundef in prog.fundefs] + [prog.e]:
+        for node in closure.subtrees(body):
+            if type(node) is closure.AppDir and node.var in ZERO_COMPARE_FUNCS:
+                return True
+    return False
+
+# 重み付きの使用回数が多い順に,整数はint_budget個,小数はfloat_budget個まで定数を選び,
+# ctx.int_const_regs, ctx.float_const_regsと同じ形の表を返す（0はx0があるので常に含め,予算には数えない）
+def chooseConstRegs (prog:closure.Prog, int_budget:int, float_budget:int):
+    depths = loopDepths(prog.fundefs)
+    counts = {}
+    for fundef in prog.fundefs:
+        countConstUses(fundef.body, LOOP_WEIGHT ** depths[fundef.name[0]], counts)
+    countConstUses(prog.e, 1, counts)
+
+    ranked = sorted(counts, key=lambda key: (-counts[key], key))
+    int_vals = [val for (typ, val) in ranked if typ == "int" and val != 0][:min(int_budget, len(reglist.CONST_INT_REGS))]
+    # 0.0はinline.pyでfisneg等の比較に使うので,小数の定数レジスタがあれば必ず割り当てる
+    # fisneg等を呼んでいるときは,float_budgetが0でも0.0のためのレジスタを1つだけ確保する
+    float_budget = max(float_budget, 1 if usesZeroCompare(prog) else 0)
+    float_vals = ([0.0] if float_budget > 0 else []) + [val for (typ, val) in ranked if typ == "float" and val != 0.0]
+    float_vals = float_vals[:min(float_budget, len(reglist.CONST_FLOAT_REGS))]
+
+    int_table = {0: "x0"}
+    for val, reg in zip(int_vals, reglist.CONST_INT_REGS):
+        int_table[val] = reg
+    float_table = {}
+    for val, reg in zip(float_vals, reglist.CONST_FLOAT_REGS):
+        float_table[val] = reg
+    return int_table, float_table
@@ -0,0 +1,131 @@
+#--------------------------------------------------
+#
+# context.py
+# 1つのプログラムをコンパイルする間に使う状態をまとめて持つ
+#
+# virtualの型環境・変数名やラベル名のカウンター，expandのused_regs_set_in_func，
+# 定数レジスタの表とそれに合わせた特別なレジスタの集合・割り当て用のレジスタのリスト，各処理の設定(Options)を持つ
+# これらをモジュールの変数に置かずにCompilationContextに持たせて各処理に渡すことで，
+# 1つのプロセスで複数のプログラムを続けてコンパイルしたり，別々の設定のプログラムを並行して処理したりできる
+#
+#--------------------------------------------------
+
+from typing import Dict, Set, Tuple
+import reglist
+import error
+import lib
+
+# 1回のコンパイルの設定（コマンドライン引数に対応する）
+# コンパイル中には書き換えないので，同じOptionsを複数のコンパイルで共有してよい
+class Options:
+    def __init__ (
+        self,
+        const_regs:str = "fixed",
+        const_int_regs:int = 3,
+        const_float_regs:int = 3,
+        use_explicit_stack:bool = False,
+        spill_update:str = "incremental",
+        coalesce:bool = True,
+        split:bool = True,
+        dce:bool = True,
+        allocator:str = "coloring",
+        linear_scan_threshold:int = 600,
+        liveness_backend:str = "auto",
+        liveness_matrix_threshold:int = 5000,
+        ):
+        # どの定数に定数レジスタを割り当てるか（"fixed": 0-3と0.0/1.0/2.0, "profile": constReg.chooseConstRegsで選ぶ）と，"profile"のときの個数
+        self.const_regs = const_regs
+        self.const_int_regs = const_int_regs
+        self.const_float_regs = const_float_regs
+        # Trueのときはパーサ，constReg，virtualで再帰呼び出しの代わりに明示的なスタックを使って木を辿る
+        self.use_explicit_stack = use_explicit_stack
+        # spillのたびにどうやって生存解析の結果とグラフを作り直すか（regAlloc）
+        #   "incremental": store/restoreを挿入した周辺だけを更新する
+        #   "full": 毎回全体から作り直す
+        #   "check": 周辺だけを更新し，全体から作り直した結果と一致するかを毎回確かめる（デバッグ用）
+        self.spill_update = spill_update
+        # mv/fmvの両辺の変数を合体（coalesce）して，同じレジスタに割り当てるかどうか（regAlloc）
+        self.coalesce = coalesce
+        # 初めてspillする変数の生存区間を関数呼び出しと基本ブロックの境目で分割するかどうか（regAlloc.splitRange）
+        self.split = split
+        # レジスタ割り当ての前に不要な命令を取り除くかどうか（deadCode）
+        self.dce = dce
+        # どちらのレジスタ割り当てを使うか（linearScan.useLinearScan）
+        #   "coloring": regAllocのグラフ彩色
+        #   "linear": 線形走査
+        #   "auto": 命令数がlinear_scan_thresholdを超える関数だけ線形走査
+        self.allocator = allocator
+        self.linear_scan_threshold = linear_scan_threshold
+        # どちらの生存解析を使うか（liveMatrix.useMatrix）
+        #   "python": livenessのPythonの整数によるビット集合
+        #   "numpy": liveMatrixのビット行列（NumPyがなければ"python"と同じ）
+        #   "auto": 有効な命令数がliveness_matrix_thresholdを超える関数だけビット行列
+        self.liveness_backend = liveness_backend
+        self.liveness_matrix_threshold = liveness_matrix_threshold
+
+# 変数の名前から変数の型への写像
+# 特別な用途のレジスタの集合はctxのものを参照する
+class Env:
+    def __init__ (self, ctx:"CompilationContext"):
+        self.env = {}
+        self.ctx = ctx
+    def get (self, arg_name:str) -> str:
+        if arg_name in self.env:
+            return self.env[arg_name]
+        elif arg_name in self.ctx.special_int_regs: # 特別な用途の整数レジスタの名前が来た場合は、envに入っていなくてもintとわかる
+            return "int"
+        elif arg_name in self.ctx.special_float_regs: # 特別な用途の小数レジスタの名前が来た場合は、envに入っていなくてもfloatとわかる
+            return "float"
+        else: # 型が登録されていないレジスタ
+            error.error("Warning: {} is not added to env.".format(arg_name))
+    def set (self, arg_name:str, typ:str):
+        self.env[arg_name] = typ
+
+class CompilationContext:
+    def __init__ (self, options:Options = None):
+        # 各処理の設定
+        self.options = options if options is not None else Options()
+        # 定数レジスタの表と，それに合わせた特別なレジスタの集合・割り当て用のレジスタのリスト（setConstRegsで書き換える）
+        self.setConstRegs(reglist.FIXED_INT_CONST_REGS, reglist.FIXED_FLOAT_CONST_REGS)
+        # virtualで使う型環境
+        self.env = Env(self)
+        # virtualで変数名を一意にするために、以下の変数をカウンターとして利用する
+        self.flt_cnt = 0
+        self.if_cnt = 0
+        self.tuple_cnt = 0
+        self.get_cnt = 0
+        self.put_cnt = 0
+        self.fundef_cnt = 0
+        self.appcls_cnt = 0
+        self.appdir_cnt = 0
+        self.makecls_cnt = 0
+        # expandで使う，関数の中で使われているレジスタの集合（libの関数の分は最初から入れておく）
+        self.used_regs_set_in_func_int: Dict[str, Set[str]] = {
+            x : lib.instrs[x]["used_regs_set_int"] for x in lib.instrs
+        }
+        self.used_regs_set_in_func_float: Dict[str, Set[str]] = {
+            x : lib.instrs[x]["used_regs_set_float"] for x in lib.instrs
+        }
+
+    # カウンターの現在の値を返す（同じ関数をもう一度仮想アセンブリ化するときに，同じ変数名・ラベル名が振られるようにするため）
+    def getCounters (self) -> Tuple[int, ...]:
+        return (self.flt_cnt, self.if_cnt, self.tuple_cnt, self.get_cnt, self.put_cnt, self.fundef_cnt, self.appcls_cnt, self.appdir_cnt, self.makecls_cnt)
+
+    # getCountersで取得した値にカウンターを戻す
+    def setCounters (self, counters:Tuple[int, ...]):
+        self.flt_cnt, self.if_cnt, self.tuple_cnt, self.get_cnt, self.put_cnt, self.fundef_cnt, self.appcls_cnt, self.appdir_cnt, self.makecls_cnt = counters
+
+    # 定数レジスタの割り当てを int_table, float_table（定数 => 定数レジスタ名）にする
+    # 特別なレジスタの集合を作り直し,割り当て用のリストから定数レジスタを取り除く（RESPONSIBLE_IDXもそれに合わせてずらす）
+    # 仮想アセンブリを作る前に呼ぶ（livenessのdef_use_cacheなどは，1回のコンパイル中に特別なレジスタが変わらないことを前提にしている）
+    def setConstRegs (self, int_table:Dict[int, str], float_table:Dict[float, str]):
+        self.int_const_regs = int_table
+        self.float_const_regs = float_table
+        int_regs = [reg for reg in int_table.values() if reg != "x0"]
+        float_regs = list(float_table.values())
+        self.special_int_regs = {'hp', 'x0'} | set(int_regs)
+        self.special_float_regs = set(float_regs)
+        self.int_regs_for_func, self.int_regs_for_func_responsible_idx = reglist.removeRegs(reglist.INT_REGS_FOR_FUNC, reglist.INT_REGS_FOR_FUNC_RESPONSIBLE_IDX, int_regs)
+        self.float_regs_for_func, self.float_regs_for_func_responsible_idx = reglist.removeRegs(reglist.FLOAT_REGS_FOR_FUNC, reglist.FLOAT_REGS_FOR_FUNC_RESPONSIBLE_IDX, float_regs)
+        self.int_regs_for_main, self.int_regs_for_main_responsible_idx = reglist.removeRegs(reglist.INT_REGS_FOR_MAIN, reglist.INT_REGS_FOR_MAIN_RESPONSIBLE_IDX, int_regs)
+        self.float_regs_for_main, self.float_regs_for_main_responsible_idx = reglist.removeRegs(reglist.FLOAT_REGS_FOR_MAIN, reglist.FLOAT_REGS_FOR_MAIN_RESPONSIBLE_IDX, float_regs)
@@ -0,0 +1,109 @@
+#--------------------------------------------------
+#
+# deadCode.py
+# 生存解析による不要な命令（dead code）の削除
+#
+# 実装の方針：
+# 命令iが副作用を持たず（hasSideEffect），定義する変数がどれもその直後に生きていなければ，命令iは取り除ける
+# 各ブロックのlive_outから命令を逆順にたどり，取り除いた命令の使用は生存変数に加えないので，ブロックの中の連鎖（x = ...; y = x + 1 でyが不要）は1回で取り除ける
+# ブロックをまたぐ連鎖は，取り除く命令がなくなるまで生存解析からやり直す
+# 返り値を使わない関数呼び出しは，副作用のない組み込み関数なら取り除き，そうでなければ返り値を受け取らない形（just_call_*）にする
+# レジスタ割り当ての前に行うので，割り当てる変数の数（レジスタの圧力）も減る
+# 割り当ての後に残る，どこでも生きていない変数（removeUnallocated）は，その変数を定義する命令を取り除くか，取り除けなければ変数名をunnecessaryにしてemitでnopにする
+#
+#--------------------------------------------------
+
+import virtual
+import opcodes
+import liveness
+import context
+import cfg
+import inline
+from typing import List, Dict, Tuple
+
+# 定義する変数が使われなくても残す命令のフラグ（メモリへの書き込み，関数呼び出し，制御の移動，ラベルの行）
+SIDE_EFFECT_FLAGS = opcodes.IS_STORE | opcodes.IS_CALL | opcodes.IS_BRANCH | opcodes.IS_JUMP | opcodes.IS_RETURN | opcodes.IS_NOT_INSTR
+# 関数の引数・自由変数の受け取り方を表す命令（expandは自由変数の位置を「* formal_fv」の並びの順番で決める）
+KEEP_OPS = {opcodes.ARGS, opcodes.FORMAL_FV, opcodes.NOT_USED_ARGS}
+# 返り値を受け取る関数呼び出し => 返り値を受け取らない形
+DROP_RET_VAL = {
+    opcodes.RECV_RET_VAL_DIR_INT: opcodes.JUST_CALL_DIR,
+    opcodes.RECV_RET_VAL_DIR_FLOAT: opcodes.JUST_CALL_DIR,
+    opcodes.RECV_RET_VAL_CLS_INT: opcodes.JUST_CALL_CLS,
+    opcodes.RECV_RET_VAL_CLS_FLOAT: opcodes.JUST_CALL_CLS,
+}
+# asmが，定義する変数が使われなくても取り除けない命令かどうか
+# 何も定義しない命令と，hpなど特別な用途のレジスタを定義する命令も取り除かない
+# 関数呼び出しでも，副作用のない組み込み関数（inline.PURE_FUNCS）の呼び出しは取り除ける
+def hasSideEffect (ctx:context.CompilationContext, asm:virtual.Virtual_Asm) -> bool:
+    info = opcodes.INFO[asm.op]
+    if (asm.op == opcodes.RECV_RET_VAL_DIR_INT or asm.op == opcodes.RECV_RET_VAL_DIR_FLOAT) and asm.arg_list[1].name in inline.PURE_FUNCS:
+        return False
+    if info.flags & SIDE_EFFECT_FLAGS or asm.op in KEEP_OPS:
+        return True
+    def_pos, _ = info.defUse(len(asm.arg_list))
+    if not def_pos:
+        return True
+    for k in def_pos:
+        reg = asm.arg_list[k]
+        if reg.name in (ctx.special_float_regs if reg.typ == "float" else ctx.special_int_regs):
+            return True
+    return False
+
+# 1回の生存解析の結果から，取り除ける命令を取り除き，返り値を使わない関数呼び出しを返り値を受け取らない形にする
+# 返り値は新しいlisと，変化があったかどうか
+def sweep (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm]) -> Tuple[List[virtual.Virtual_Asm], bool]:
+    graph = cfg.CFG(lis)
+    live_int, live_float, def_int, use_int, def_float, use_float = liveness.AnalyzeLiveness(ctx, lis, graph)
+    removed = set()
+    replaced = {} # 命令のidx => 置き換える命令
+    for block in graph.blocks:
+        cur_int = set(live_int[block.instrs[-1]])
+        cur_float = set(live_float[block.instrs[-1]])
+        for i in reversed(block.instrs):
+            asm = lis[i]
+            dead = not (def_int[i] & cur_int) and not (def_float[i] & cur_float)
+            if dead and not hasSideEffect(ctx, asm):
+                removed.add(i)
+                continue
+            if dead and asm.op in DROP_RET_VAL and (def_int[i] or def_float[i]):
+                replaced[i] = virtual.Virtual_Asm(DROP_RET_VAL[asm.op], asm.arg_count - 1, asm.arg_list[1:])
+            cur_int = (cur_int - def_int[i]) | use_int[i]
+            cur_float = (cur_float - def_float[i]) | use_float[i]
+    if not removed and not replaced:
+        return lis, False
+    return [replaced.get(i, asm) for i, asm in enumerate(lis) if i not in removed], True
+
+# 取り除ける命令がなくなるまでsweepを繰り返す（ctx.options.dceがFalseなら何もしない）
+def deadCodeElim (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
+    if not ctx.options.dce:
+        return lis
+    changed = True
+    while changed:
+        lis, changed = sweep(ctx, lis)
+    return lis
+
+# レジスタ割り当ての後で，レジスタが割り当てられなかった変数（どこでも生きていない変数）を定義する命令の後始末をする
+# 取り除ける命令は取り除き，取り除けない命令（* formal_fvなど）は変数名をunnecessaryにしておく（emitでnopになる）
+# 変数を使用する命令はunnecessaryにするだけにする（取り除くと，使用していた変数のレジスタが割り当ての後の生存解析でどこでも生きていないことになり，
+# そのレジスタへの書き込みが残っていてもexpandでcallee-saveの対象から外れてしまう）
+def removeUnallocated (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], allocation_int:Dict[str, str], allocation_float:Dict[str, str]) -> Tuple[List[virtual.Virtual_Asm], Dict[str, str], Dict[str, str]]:
+    new_lis = []
+    for asm in lis:
+        if opcodes.INFO[asm.op].flags & opcodes.IS_NOT_INSTR:
+            new_lis.append(asm)
+            continue
+        def_int, use_int, def_float, use_float = liveness.getDefAndUseFromVirtualAsm(ctx, asm)
+        unallocated_int = [name for name in def_int if name not in allocation_int]
+        unallocated_float = [name for name in def_float if name not in allocation_float]
+        if not unallocated_int and not unallocated_float:
+            new_lis.append(asm)
+            continue
+        if len(unallocated_int) == len(def_int) and len(unallocated_float) == len(def_float) and not use_int and not use_float and not hasSideEffect(ctx, asm):
+            continue
+        for name in unallocated_int:
+            allocation_int[name] = "unnecessary"
+        for name in unallocated_float:
+            allocation_float[name] = "unnecessary"
+        new_lis.append(asm)
+    return new_lis, allocation_int, allocation_float
@@ -5,11 +5,14 @@
 #
 #--------------------------------------------------
 
-from typing import List
+from typing import List, Tuple
 import virtual
+import context
+import opcodes
 import peephole
 import spOpt
 import jumpOpt
+import cfg
 import lwStallOpt
 import vector
 
@@ -20,12 +23,24 @@ OPT_LOOP_CNT = 10
 def deleteNop (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
     new_lis = []
     for asm in lis:
-        if asm.instr_name != "nop":
+        if asm.op != opcodes.NOP:
             new_lis.append(asm)
     return new_lis
 
+# 出力されたアセンブリに残っているmv, fmvの数を数える（レジスタ割り当てで合体できなかったmoveの数の目安）
+def countMoves (asm_str:str) -> Tuple[int, int]:
+    mv_cnt = 0
+    fmv_cnt = 0
+    for line in asm_str.split("\n"):
+        words = line.split()
+        if words and words[0] == "mv":
+            mv_cnt += 1
+        elif words and words[0] == "fmv":
+            fmv_cnt += 1
+    return mv_cnt, fmv_cnt
+
 # メイン部分
-def VirtualAsmList2Str (lis:List[virtual.Virtual_Asm]) -> str:
+def VirtualAsmList2Str (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm]) -> str:
     # ここまで実行したきた関数の中で最後に処理するべきものとして残されていたものを処理する
     for j in range(len(lis)):
         virtual_asm = lis[j]
@@ -34,52 +49,55 @@ def VirtualAsmList2Str (lis:List[virtual.Virtual_Asm]) -> str:
             if "cls_address" in virtual_asm.arg_list[i].name:
                 virtual_asm.arg_list[i] = virtual.Reg("a0", "int")
         # negという命令はないので置き換える
-        if virtual_asm.instr_name == "neg":
-            lis[j] = virtual.Virtual_Asm("sub", 3, [virtual_asm.arg_list[0], virtual.Reg("x0", "int"), virtual_asm.arg_list[1]])
+        if virtual_asm.op == opcodes.NEG:
+            lis[j] = virtual.Virtual_Asm(opcodes.SUB, 3, [virtual_asm.arg_list[0], virtual.Reg("x0", "int"), virtual_asm.arg_list[1]])
         # regAllocにおける「不要定義削除」に対する処理
         if len(virtual_asm.arg_list) > 0 and virtual_asm.arg_list[0].name == "unnecessary":
-            lis[j] = virtual.Virtual_Asm("nop", 0, [])
+            lis[j] = virtual.Virtual_Asm(opcodes.NOP, 0, [])
         # swi, fswi, lwi, flwiの置き換え
-        if virtual_asm.instr_name == "swi" or virtual_asm.instr_name == "fswi":
-            lis[j] = virtual.Virtual_Asm(virtual_asm.instr_name.replace('i', ''), 3, [virtual.Reg("x0", "int"), virtual_asm.arg_list[0], virtual_asm.arg_list[1]])
-        if virtual_asm.instr_name == "lwi" or virtual_asm.instr_name == "flwi":
-            lis[j] = virtual.Virtual_Asm(virtual_asm.instr_name.replace('i', ''), 3, [virtual_asm.arg_list[0], virtual.Reg("x0", "int"), virtual_asm.arg_list[1]])
+        if virtual_asm.op == opcodes.SWI or virtual_asm.op == opcodes.FSWI:
+            lis[j] = virtual.Virtual_Asm(opcodes.FROM_IMM_FORM[virtual_asm.op], 3, [virtual.Reg("x0", "int"), virtual_asm.arg_list[0], virtual_asm.arg_list[1]])
+        if virtual_asm.op == opcodes.LWI or virtual_asm.op == opcodes.FLWI:
+            lis[j] = virtual.Virtual_Asm(opcodes.FROM_IMM_FORM[virtual_asm.op], 3, [virtual_asm.arg_list[0], virtual.Reg("x0", "int"), virtual_asm.arg_list[1]])
 
     # 最適化をループ
+    # ラベルの位置を使う最適化には，命令列を作り直すたびに1回だけ作ったラベルの位置の辞書を渡す
     for _ in range(OPT_LOOP_CNT):
         lis = peephole.peepholeOpt(lis) # 覗き穴最適化
-        lis = spOpt.spOpt(lis, 0) # spのaddi命令の最適化
-        lis = jumpOpt.jumpOpt(lis) # 連続するjump命令の最適化
+        lis = spOpt.spOpt(lis, 0, cfg.labelPositions(lis)) # spのaddi命令の最適化
+        lis = jumpOpt.jumpOpt(lis, cfg.labelPositions(lis)) # 連続するjump命令の最適化
         lis = vector.replace(lis) # 連続するlw, swの最適化
         lis = vector.leftAlign(lis)
         lis = deleteNop(lis)
     
     # branchの後に連続するjump命令の最適化
-    lis = jumpOpt.branchOpt(lis)
+    lis = jumpOpt.branchOpt(lis, cfg.labelPositions(lis))
 
     # # lwに連続する命令がストールする問題への対処を行う最適化
-    lis = lwStallOpt.lwStallOpt(lis)
+    lis = lwStallOpt.lwStallOpt(ctx, lis)
 
-    # 文字列化
+    # 文字列化（命令名の文字列はここでだけopcodes.INFOから取り出す）
     ret = ""
     for virtual_asm in lis:
-        if ":" in virtual_asm.instr_name: # labelの中にドットが入っているとまずいのでアンダースコアに変える
-            ret += virtual_asm.instr_name.replace(".", "_")
-        elif "#" in virtual_asm.instr_name: # comment
-            ret += virtual_asm.instr_name
-        elif virtual_asm.instr_name == "fli": # fli命令の第二引数はドットをアンダースコアに変える必要はない
-            ret += "\t" + (virtual_asm.instr_name + "          ")[:10] + virtual_asm.arg_list[0].name.replace(".", "_") + ", " + virtual_asm.arg_list[1].name
-        elif virtual_asm.instr_name == "sw" or virtual_asm.instr_name == "fsw": # storeの命令の形を整える
-            ret += "\t" + (virtual_asm.instr_name + "          ")[:10] + virtual_asm.arg_list[1].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name + "(" + virtual_asm.arg_list[0].name.replace(".", "_") + ")"
-        elif virtual_asm.instr_name == "lw" or virtual_asm.instr_name == "flw": # loadの命令の形を整える
-            ret += "\t" + (virtual_asm.instr_name + "          ")[:10] + virtual_asm.arg_list[0].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name + "(" + virtual_asm.arg_list[1].name.replace(".", "_") + ")"
-        elif virtual_asm.instr_name == "vlw": # vector load命令の形を整える
-            ret += "\t" + (virtual_asm.instr_name + "          ")[:10] + virtual_asm.arg_list[1].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name.replace(".", "_") + ", " + virtual_asm.arg_list[3].name.replace(".", "_") + ", " + virtual_asm.arg_list[4].name.replace(".", "_") + ", " + virtual_asm.arg_list[5].name + "(" + virtual_asm.arg_list[0].name.replace(".", "_") + "), " + virtual_asm.arg_list[6].name
-        elif virtual_asm.instr_name == "vsw": # vector store命令の形を整える
-            ret += "\t" + (virtual_asm.instr_name + "          ")[:10] + virtual_asm.arg_list[1].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name.replace(".", "_") + ", " + virtual_asm.arg_list[3].name.replace(".", "_") + ", " + virtual_asm.arg_list[4].name.replace(".", "_") + ", " + virtual_asm.arg_list[5].name + "(" + virtual_asm.arg_list[0].name.replace(".", "_") + "), " + virtual_asm.arg_list[6].name
-        elif virtual_asm.instr_name == "jalr" and virtual_asm.arg_count == 3: # jalrの命令の形を整える
-            ret += "\t" + (virtual_asm.instr_name + "          ")[:10] + virtual_asm.arg_list[0].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name + "(" + virtual_asm.arg_list[1].name.replace(".", "_") + ")"
+        op = virtual_asm.op
+        instr_name = opcodes.INFO[op].name
+        if op == opcodes.LABEL: # labelの中にドットが入っているとまずいのでアンダースコアに変える
+            ret += virtual_asm.arg_list[0].name.replace(".", "_") + ":"
+        elif op == opcodes.COMMENT: # comment
+            ret += virtual_asm.arg_list[0].name
+        elif op == opcodes.FLI: # fli命令の第二引数はドットをアンダースコアに変える必要はない
+            ret += "\t" + (instr_name + "          ")[:10] + virtual_asm.arg_list[0].name.replace(".", "_") + ", " + virtual_asm.arg_list[1].name
+        elif op == opcodes.SW or op == opcodes.FSW: # storeの命令の形を整える
+            ret += "\t" + (instr_name + "          ")[:10] + virtual_asm.arg_list[1].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name + "(" + virtual_asm.arg_list[0].name.replace(".", "_") + ")"
+        elif op == opcodes.LW or op == opcodes.FLW: # loadの命令の形を整える
+            ret += "\t" + (instr_name + "          ")[:10] + virtual_asm.arg_list[0].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name + "(" + virtual_asm.arg_list[1].name.replace(".", "_") + ")"
+        elif op == opcodes.VLW: # vector load命令の形を整える
+            ret += "\t" + (instr_name + "          ")[:10] + virtual_asm.arg_list[1].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name.replace(".", "_") + ", " + virtual_asm.arg_list[3].name.replace(".", "_") + ", " + virtual_asm.arg_list[4].name.replace(".", "_") + ", " + virtual_asm.arg_list[5].name + "(" + virtual_asm.arg_list[0].name.replace(".", "_") + "), " + virtual_asm.arg_list[6].name
+        elif op == opcodes.VSW: # vector store命令の形を整える
+            ret += "\t" + (instr_name + "          ")[:10] + virtual_asm.arg_list[1].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name.replace(".", "_") + ", " + virtual_asm.arg_list[3].name.replace(".", "_") + ", " + virtual_asm.arg_list[4].name.replace(".", "_") + ", " + virtual_asm.arg_list[5].name + "(" + virtual_asm.arg_list[0].name.replace(".", "_") + "), " + virtual_asm.arg_list[6].name
+        elif op == opcodes.JALR and virtual_asm.arg_count == 3: # jalrの命令の形を整える
+            ret += "\t" + (instr_name + "          ")[:10] + virtual_asm.arg_list[0].name.replace(".", "_") + ", " + virtual_asm.arg_list[2].name + "(" + virtual_asm.arg_list[1].name.replace(".", "_") + ")"
         else:
-            ret += "\t" + (virtual_asm.instr_name + "          ")[:10] + ", ".join([reg.name.replace(".", "_") for reg in virtual_asm.arg_list])
+            ret += "\t" + (instr_name + "          ")[:10] + ", ".join([reg.name.replace(".", "_") for reg in virtual_asm.arg_list])
         ret += "\n"
     return ret
@@ -6,27 +6,46 @@
 #--------------------------------------------------
 
 import virtual
-from typing import List, Tuple
-import copy
-import reglist
-import lib
+import closure
+import inline
+import opcodes
+from typing import List, Dict
+import context
 
-# 関数の中で使われているレジスタの集合
-used_regs_set_in_func_int = {
-    x : lib.instrs[x]["used_regs_set_int"] for x in lib.instrs
-}
-used_regs_set_in_func_float = {
-    x : lib.instrs[x]["used_regs_set_float"] for x in lib.instrs
-}
+# 別の関数を呼び出す命令の集合
+CALL_INSTRS = {opcodes.J, opcodes.JALR, opcodes.CALL, opcodes.RECV_RET_VAL_CLS_INT, opcodes.RECV_RET_VAL_CLS_FLOAT, opcodes.JUST_CALL_CLS_AND_JUMP, opcodes.JUST_CALL_DIR_AND_JUMP, opcodes.JUST_CALL_CLS, opcodes.JUST_CALL_DIR, opcodes.RECV_RET_VAL_DIR_INT, opcodes.RECV_RET_VAL_DIR_FLOAT}
 
-# used_regs_set_in_funcをセットする関数
-def set_used_regs_set_in_func (func_name:str, lis, live_int, live_float):
-    global used_regs_set_in_func_int, used_regs_set_in_func_float
+# 別の関数を呼び出さない関数かどうかを判定する（そのような関数についてのみused_regs_set_in_funcをセットする）
+def isLeafFunc (lis) -> bool:
+    for asm in lis:
+        if asm.op in CALL_INSTRS:
+            return False
+    return True
+
+# isLeafFuncと同じ判定を，仮想アセンブリ化する前のfundefの木で行う
+# 分岐（endifへのj），クロージャ呼び出し，inlineOptで1命令にならない関数の直接呼び出しがあれば葉の関数ではない
+def isLeafFundef (fundef:closure.Fundef) -> bool:
+    for node in closure.subtrees(fundef.body):
+        typ = type(node)
+        if typ in closure.IF_TYPES or typ is closure.AppCls:
+            return False
+        if typ is closure.AppDir and node.var not in inline.PURE_FUNCS:
+            return False
+    return True
+
+# 命令のidx => 生存変数の集合（またはspを動かす語数） の辞書のうち，start <= idx < endの部分をidxをstartだけずらして取り出す
+def sliceLive (live, start:int, end:int):
+    live_slice = {}
+    for key in range(start, end):
+        if key in live:
+            live_slice[key - start] = live[key]
+    return live_slice
 
+# ctxのused_regs_set_in_funcをセットする関数
+def set_used_regs_set_in_func (ctx:context.CompilationContext, func_name:str, lis, live_int, live_float):
     # 関数から別の関数を読んでいる時は追跡が難しいので諦める
-    for asm in lis:
-        if asm.instr_name in {"j", "jalr", "call", "recv_ret_val_cls_int", "recv_ret_val_cls_float", "just_call_cls_and_jump", "just_call_dir_and_jump", "just_call_cls", "just_call_dir", "recv_ret_val_dir_int", "recv_ret_val_dir_float"}:
-            return
+    if not isLeafFunc(lis):
+        return
 
     # live_int, live_floatの中に入っている変数の集合を作る
     live_int_set = set()
@@ -36,22 +55,26 @@ def set_used_regs_set_in_func (func_name:str, lis, live_int, live_float):
     for key in live_float:
         live_float_set |= live_float[key]
     
-    used_regs_set_in_func_int[func_name] = live_int_set
-    used_regs_set_in_func_float[func_name] = live_float_set
+    ctx.used_regs_set_in_func_int[func_name] = live_int_set
+    ctx.used_regs_set_in_func_float[func_name] = live_float_set
 
 
 # isFundef: callee側かどうかを判定するフラグ
-# virtual_stack: store, restoreした変数の情報を保持しておく仮想的なスタック
+# slots: store, restoreする変数名 => spからの位置（stackSlot.assignStackSlots）
+# frame: 関数呼び出しの命令のidx => 呼び出しの前にspを動かす語数（stackSlot.assignStackSlots）
+# label_pos: 関数全体の命令列のCFGのlabel_pos，offset: lisがその命令列の何行目から始まるか（if文の節を処理するときに使う）
 def expand (
+    ctx:context.CompilationContext,
     lis:List[virtual.Virtual_Asm],
-    virtual_stack:List[str],
+    slots:Dict[str, int],
+    frame:Dict[int, int],
     isFundef:bool,
     live_int, live_float,
-    fundef_ret_asm_list=[]
-    ) -> Tuple[List[virtual.Virtual_Asm], List[str]]:
+    label_pos:Dict[str, int],
+    fundef_ret_asm_list=[],
+    offset:int = 0
+    ) -> List[virtual.Virtual_Asm]:
 
-    global used_regs_set_in_func_int, used_regs_set_in_func_float
-    
     new_lis = []
     idx = 0
 
@@ -71,10 +94,10 @@ def expand (
         # 関数内でつかわれてしまっているレジスタの集合を計算
         fundef_virtual_stack_int = []
         fundef_virtual_stack_float = []
-        for item in reglist.INT_REGS_FOR_FUNC[reglist.INT_REGS_FOR_FUNC_RESPONSIBLE_IDX:]:
+        for item in ctx.int_regs_for_func[ctx.int_regs_for_func_responsible_idx:]:
             if item in live_int_set: # callee-saveなレジスタが使われている場合
                 fundef_virtual_stack_int.append(item)
-        for item in reglist.FLOAT_REGS_FOR_FUNC[reglist.FLOAT_REGS_FOR_FUNC_RESPONSIBLE_IDX:]:
+        for item in ctx.float_regs_for_func[ctx.float_regs_for_func_responsible_idx:]:
             if item in live_float_set: # callee-saveなレジスタが使われている場合
                 fundef_virtual_stack_float.append(item)
         
@@ -82,132 +105,106 @@ def expand (
         tmp_sp = 0
         for item in fundef_virtual_stack_int:
             tmp_sp -= 4
-            new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
         for item in fundef_virtual_stack_float:
             tmp_sp -= 4
-            new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
-        new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
+        new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
         
         # callee-saveレジスタの復元のアセンブリを生成（ここでアセンブリを生成しておいて、メインループでretを処理する際、実際に付加する）
         fundef_ret_asm_list = []
-        fundef_ret_asm_list.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
+        fundef_ret_asm_list.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
         for item in reversed(fundef_virtual_stack_float):
-            fundef_ret_asm_list.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+            fundef_ret_asm_list.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
             tmp_sp += 4
         for item in reversed(fundef_virtual_stack_int):
-            fundef_ret_asm_list.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+            fundef_ret_asm_list.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
             tmp_sp += 4
 
         # 自由変数をレジスタに割り当てる
         formal_fv_count = 0
         for asm in lis:
-            if asm.instr_name == "* formal_fv":
+            if asm.op == opcodes.FORMAL_FV:
                 formal_fv_count += 1
                 if asm.arg_list[0].typ == "int":
-                    new_lis.append(virtual.Virtual_Asm("lw", 3, [asm.arg_list[0], virtual.Reg("a0", "int"), virtual.Reg(str(formal_fv_count*4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [asm.arg_list[0], virtual.Reg("a0", "int"), virtual.Reg(str(formal_fv_count*4), "int")]))
                 if asm.arg_list[0].typ == "float":
-                    new_lis.append(virtual.Virtual_Asm("flw", 3, [asm.arg_list[0], virtual.Reg("a0", "int"), virtual.Reg(str(formal_fv_count*4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [asm.arg_list[0], virtual.Reg("a0", "int"), virtual.Reg(str(formal_fv_count*4), "int")]))
 
     # メインループ
     while idx < len(lis):
         asm = lis[idx]
 
-        # storeの展開。ストアした変数の情報はvirtual_stackに保持される
-        if asm.instr_name == "store":
+        # storeの展開。変数の位置はslotsで決まっている
+        if asm.op == opcodes.STORE:
+            pos = slots[asm.arg_list[1].name]
             # アセンブリにswを加える
             if asm.arg_list[0].typ == "int":
-                new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), asm.arg_list[0], virtual.Reg(str(-(len(virtual_stack)+1)*4), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), asm.arg_list[0], virtual.Reg(str(pos), "int")]))
             else:
-                new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), asm.arg_list[0], virtual.Reg(str(-(len(virtual_stack)+1)*4), "int")]))
-            # 変数virtual_stackに保存する
-            virtual_stack.append(asm.arg_list[1].name)
+                new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), asm.arg_list[0], virtual.Reg(str(pos), "int")]))
             idx += 1
         
         # restoreの展開
-        elif asm.instr_name == "restore":
-            # virtual_stackからスタック上の変数のアドレスを計算する
-            i = 0
-            while i < len(virtual_stack):
-                if virtual_stack[i] == asm.arg_list[1].name:
-                    break
-                i += 1
-            pos = -(i + 1) * 4
+        elif asm.op == opcodes.RESTORE:
+            pos = slots[asm.arg_list[1].name]
             # アセンブリにlwを加える
             if asm.arg_list[0].typ == "int":
-                new_lis.append(virtual.Virtual_Asm("lw", 3, [asm.arg_list[0], virtual.Reg("sp", "int"), virtual.Reg(str(pos), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [asm.arg_list[0], virtual.Reg("sp", "int"), virtual.Reg(str(pos), "int")]))
             else:
-                new_lis.append(virtual.Virtual_Asm("flw", 3, [asm.arg_list[0], virtual.Reg("sp", "int"), virtual.Reg(str(pos), "int")])) 
+                new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [asm.arg_list[0], virtual.Reg("sp", "int"), virtual.Reg(str(pos), "int")])) 
             idx += 1
         
         # ブランチ命令
-        elif asm.instr_name == "beq" or asm.instr_name == "bge" or asm.instr_name == "blt" or asm.instr_name == "bfeq" or asm.instr_name == "bfle" or asm.instr_name == "bflt":
-            # labelの末尾についている数字を取り出す
-            if_cnt = asm.arg_list[2].name.replace("then", "")
+        elif opcodes.INFO[asm.op].flags & opcodes.IS_BRANCH:
+            # then節のラベル名と，同じ数字のついたendifのラベル名
+            then_label = asm.arg_list[2].name
+            endif_label = "endif" + then_label.replace("then", "")
             # then節の行のindexを取得
-            then_pos = idx
-            while True:
-                if lis[then_pos].instr_name == "then" + str(if_cnt) + ":":
-                    break
-                then_pos += 1
+            then_pos = label_pos[then_label] - offset
             # ブランチ命令〜then節までのlive情報をスライスする
-            live_int_slice = {}
-            live_float_slice = {}
-            for key in live_int:
-                if idx+1 <= key < then_pos:
-                    live_int_slice[key - (idx+1)] = live_int[key]
-            for key in live_float:
-                if idx+1 <= key < then_pos:
-                    live_float_slice[key - (idx+1)] = live_float[key]
+            live_int_slice = sliceLive(live_int, idx+1, then_pos)
+            live_float_slice = sliceLive(live_float, idx+1, then_pos)
+            frame_slice = sliceLive(frame, idx+1, then_pos)
             # expandの処理
-            else_asm, else_virtual_stack = expand(lis[idx+1:then_pos], copy.deepcopy(virtual_stack), False, live_int_slice, live_float_slice, fundef_ret_asm_list)
+            else_asm = expand(ctx, lis[idx+1:then_pos], slots, frame_slice, False, live_int_slice, live_float_slice, label_pos, fundef_ret_asm_list, offset + idx + 1)
             # thenとendifで囲まれた部分のアセンブリについても上と同様のことを行う
-            endif_pos = then_pos
-            while True:
-                if lis[endif_pos].instr_name == "endif" + str(if_cnt) + ":":
-                    break
-                endif_pos += 1
-            live_int_slice = {}
-            live_float_slice = {}
-            for key in live_int:
-                if then_pos <= key < endif_pos:
-                    live_int_slice[key - then_pos] = live_int[key]
-            for key in live_float:
-                if then_pos <= key < endif_pos:
-                    live_float_slice[key - then_pos] = live_float[key]
-            then_asm, then_virtual_stack = expand(lis[then_pos:endif_pos], copy.deepcopy(virtual_stack), False, live_int_slice, live_float_slice, fundef_ret_asm_list)
+            endif_pos = label_pos[endif_label] - offset
+            live_int_slice = sliceLive(live_int, then_pos, endif_pos)
+            live_float_slice = sliceLive(live_float, then_pos, endif_pos)
+            frame_slice = sliceLive(frame, then_pos, endif_pos)
+            then_asm = expand(ctx, lis[then_pos:endif_pos], slots, frame_slice, False, live_int_slice, live_float_slice, label_pos, fundef_ret_asm_list, offset + then_pos)
             
-            # stackの共通部分をとる
-            virtual_stack = [item for item in else_virtual_stack if item in then_virtual_stack]
             new_lis += [asm] + else_asm + then_asm
             idx = endif_pos
 
         # ret命令
-        elif asm.instr_name == "ret":
+        elif asm.op == opcodes.RET:
             new_lis += [
                 virtual.Virtual_Asm(
-                    "mv",
+                    opcodes.MV,
                     2,
                     [virtual.Reg("a1", "int"), asm.arg_list[0]]
                 ) if asm.arg_list[0].typ == "int"
                 else virtual.Virtual_Asm(
-                    "fmv",
+                    opcodes.FMV,
                     2,
                     [virtual.Reg("fa0", "float"), asm.arg_list[0]]
                 ), # 返り値をレジスタに入れる
             ] + fundef_ret_asm_list + [
-                virtual.Virtual_Asm("ret", 0, [])
+                virtual.Virtual_Asm(opcodes.RET, 0, [])
             ]
             idx += 1
         
         # 返り値がなにもないret命令
-        elif asm.instr_name == "ret_unit":
+        elif asm.op == opcodes.RET_UNIT:
             new_lis += fundef_ret_asm_list + [
-                virtual.Virtual_Asm("ret", 0, [])
+                virtual.Virtual_Asm(opcodes.RET, 0, [])
             ]
             idx += 1
         
         # クロージャではない関数呼び出し
-        elif asm.instr_name == "just_call_dir":
+        elif asm.op == opcodes.JUST_CALL_DIR:
             # 使用する引数レジスタの数に合わせて配列を作る
             func_args_int = []
             func_args_float = []
@@ -221,24 +218,24 @@ def expand (
                     func_args_float.append("fa" + str(float_idx))
                     float_idx += 1
             # spの移動
-            if len(virtual_stack) != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-len(virtual_stack)*4), "int")]))
+            if frame[idx] != 0:
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-frame[idx]*4), "int")]))
             # caller-saveでかつ呼び出す関数内で使われているレジスタをスタックに移動
             call_virtual_stack_int = []
             call_virtual_stack_float = []
             live_int_set = live_int[idx]
             live_float_set = live_float[idx]
 
-            if asm.arg_list[0].name in used_regs_set_in_func_int:
+            if asm.arg_list[0].name in ctx.used_regs_set_in_func_int:
                 caller_regs_used_in_func_int = [
-                    x for x in reglist.INT_REGS_FOR_MAIN[reglist.INT_REGS_FOR_MAIN_RESPONSIBLE_IDX:] if x in used_regs_set_in_func_int[asm.arg_list[0].name]
+                    x for x in ctx.int_regs_for_main[ctx.int_regs_for_main_responsible_idx:] if x in ctx.used_regs_set_in_func_int[asm.arg_list[0].name]
                 ]
                 caller_regs_used_in_func_float = [
-                    x for x in reglist.FLOAT_REGS_FOR_MAIN[reglist.FLOAT_REGS_FOR_MAIN_RESPONSIBLE_IDX:] if x in used_regs_set_in_func_float[asm.arg_list[0].name]
+                    x for x in ctx.float_regs_for_main[ctx.float_regs_for_main_responsible_idx:] if x in ctx.used_regs_set_in_func_float[asm.arg_list[0].name]
                 ]
             else:
-                caller_regs_used_in_func_int = reglist.INT_REGS_FOR_MAIN[reglist.INT_REGS_FOR_MAIN_RESPONSIBLE_IDX:]
-                caller_regs_used_in_func_float = reglist.FLOAT_REGS_FOR_MAIN[reglist.FLOAT_REGS_FOR_MAIN_RESPONSIBLE_IDX:]
+                caller_regs_used_in_func_int = ctx.int_regs_for_main[ctx.int_regs_for_main_responsible_idx:]
+                caller_regs_used_in_func_float = ctx.float_regs_for_main[ctx.float_regs_for_main_responsible_idx:]
 
             for item in caller_regs_used_in_func_int:
                 if item in live_int_set:
@@ -249,53 +246,53 @@ def expand (
             tmp_sp = 0
             for item in call_virtual_stack_int:
                 tmp_sp -= 4
-                new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
             for item in call_virtual_stack_float:
                 tmp_sp -= 4
-                new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
             if tmp_sp != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
             # 引数を引数レジスタに登録する（スタックに一旦保存 → その後取り出す）
             # mv a1, a3; mv a2, a1というときに事故がおこらないようにするため。
             tmp_idx = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             tmp_idx_2 = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx_2].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx_2].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             # 関数呼び出し
-            new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), virtual.Reg("ra", "int"), virtual.Reg("-4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("call", 1, [asm.arg_list[0]]))
-            new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg("ra", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), virtual.Reg("ra", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.CALL, 1, [asm.arg_list[0]]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg("ra", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
             # caller-saveなレジスタをもとに戻す
             if tmp_sp != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
             for item in reversed(call_virtual_stack_float):
-                new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
                 tmp_sp += 4
             for item in reversed(call_virtual_stack_int):
-                new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
                 tmp_sp += 4
             # spをもとに戻す
-            if len(virtual_stack) != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(len(virtual_stack)*4), "int")]))
+            if frame[idx] != 0:
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(frame[idx]*4), "int")]))
             idx += 1
 
-        elif asm.instr_name == "just_call_dir_and_jump":
+        elif asm.op == opcodes.JUST_CALL_DIR_AND_JUMP:
             # 使用する引数レジスタの数に合わせて配列を作る
             func_args_int = []
             func_args_float = []
@@ -313,28 +310,28 @@ def expand (
             tmp_idx = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             tmp_idx_2 = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx_2].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx_2].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             # 関数呼び出し
             new_lis += fundef_ret_asm_list + [
-                virtual.Virtual_Asm("j", 1, [asm.arg_list[0]]) # このあとの命令に戻ってくる必要がないので、ただのjでOK
+                virtual.Virtual_Asm(opcodes.J, 1, [asm.arg_list[0]]) # このあとの命令に戻ってくる必要がないので、ただのjでOK
             ]
             idx += 1
 
-        elif asm.instr_name == "recv_ret_val_dir_int" or asm.instr_name == "recv_ret_val_dir_float":
+        elif asm.op == opcodes.RECV_RET_VAL_DIR_INT or asm.op == opcodes.RECV_RET_VAL_DIR_FLOAT:
             # 使用する引数レジスタの数に合わせて配列を作る
             func_args_int = []
             func_args_float = []
@@ -348,24 +345,24 @@ def expand (
                     func_args_float.append("fa" + str(float_idx))
                     float_idx += 1
             # spの移動
-            if len(virtual_stack) != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-len(virtual_stack)*4), "int")]))
+            if frame[idx] != 0:
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-frame[idx]*4), "int")]))
             # caller-saveでかつ呼び出す関数内で使われているレジスタをスタックに移動
             call_virtual_stack_int = []
             call_virtual_stack_float = []
             live_int_set = live_int[idx]
             live_float_set = live_float[idx]
 
-            if asm.arg_list[1].name in used_regs_set_in_func_int:
+            if asm.arg_list[1].name in ctx.used_regs_set_in_func_int:
                 caller_regs_used_in_func_int = [
-                    x for x in reglist.INT_REGS_FOR_MAIN[reglist.INT_REGS_FOR_MAIN_RESPONSIBLE_IDX:] if x in used_regs_set_in_func_int[asm.arg_list[1].name]
+                    x for x in ctx.int_regs_for_main[ctx.int_regs_for_main_responsible_idx:] if x in ctx.used_regs_set_in_func_int[asm.arg_list[1].name]
                 ]
                 caller_regs_used_in_func_float = [
-                    x for x in reglist.FLOAT_REGS_FOR_MAIN[reglist.FLOAT_REGS_FOR_MAIN_RESPONSIBLE_IDX:] if x in used_regs_set_in_func_float[asm.arg_list[1].name]
+                    x for x in ctx.float_regs_for_main[ctx.float_regs_for_main_responsible_idx:] if x in ctx.used_regs_set_in_func_float[asm.arg_list[1].name]
                 ]
             else:
-                caller_regs_used_in_func_int = reglist.INT_REGS_FOR_MAIN[reglist.INT_REGS_FOR_MAIN_RESPONSIBLE_IDX:]
-                caller_regs_used_in_func_float = reglist.FLOAT_REGS_FOR_MAIN[reglist.FLOAT_REGS_FOR_MAIN_RESPONSIBLE_IDX:]
+                caller_regs_used_in_func_int = ctx.int_regs_for_main[ctx.int_regs_for_main_responsible_idx:]
+                caller_regs_used_in_func_float = ctx.float_regs_for_main[ctx.float_regs_for_main_responsible_idx:]
 
             for item in caller_regs_used_in_func_int:
                 if item in live_int_set:
@@ -373,66 +370,68 @@ def expand (
             for item in caller_regs_used_in_func_float:
                 if item in live_float_set:
                     call_virtual_stack_float.append(item)
+            # 小数の返り値は退避させずに直接返り値を受け取るレジスタに移すので,そのレジスタは元に戻さない（呼び出し前の値は呼び出し後に使われない）
+            # f4は割り当てにも使われるレジスタなので,退避に使うと生きている値を上書きしてしまう
+            if asm.op == opcodes.RECV_RET_VAL_DIR_FLOAT and asm.arg_list[0].name in call_virtual_stack_float:
+                call_virtual_stack_float.remove(asm.arg_list[0].name)
             tmp_sp = 0
             for item in call_virtual_stack_int:
                 tmp_sp -= 4
-                new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
             for item in call_virtual_stack_float:
                 tmp_sp -= 4
-                new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
             if tmp_sp != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
             # 引数を引数レジスタに登録する（スタックに一旦保存 → その後取り出す）
             # mv a1, a3; mv a2, a1というときに事故がおこらないようにするため。
             tmp_idx = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             tmp_idx_2 = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx_2].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx_2].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             # 関数呼び出し
-            new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), virtual.Reg("ra", "int"), virtual.Reg("-4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("call", 1, [asm.arg_list[1]]))
-            new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg("ra", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
-            # 関数が返ってきたら一旦f4 or x4に退避させる
-            if asm.instr_name == "recv_ret_val_dir_int":
-                new_lis.append(virtual.Virtual_Asm("mv", 2, [virtual.Reg("x4", "int"), virtual.Reg("a1", "int")]))
-            elif asm.instr_name == "recv_ret_val_dir_float":
-                new_lis.append(virtual.Virtual_Asm("fmv", 2, [virtual.Reg("f4", "float"), virtual.Reg("fa0", "float")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), virtual.Reg("ra", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.CALL, 1, [asm.arg_list[1]]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg("ra", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
+            # 関数が返ってきたら,整数の返り値は一旦x4に退避させ,小数の返り値は返り値を受け取るレジスタに移す
+            if asm.op == opcodes.RECV_RET_VAL_DIR_INT:
+                new_lis.append(virtual.Virtual_Asm(opcodes.MV, 2, [virtual.Reg("x4", "int"), virtual.Reg("a1", "int")]))
+            elif asm.op == opcodes.RECV_RET_VAL_DIR_FLOAT:
+                new_lis.append(virtual.Virtual_Asm(opcodes.FMV, 2, [asm.arg_list[0], virtual.Reg("fa0", "float")]))
             # caller-saveなレジスタをもとに戻す
             if tmp_sp != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
             for item in reversed(call_virtual_stack_float):
-                new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
                 tmp_sp += 4
             for item in reversed(call_virtual_stack_int):
-                new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
                 tmp_sp += 4
             # spをもとに戻す
-            if len(virtual_stack) != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(len(virtual_stack)*4), "int")]))
+            if frame[idx] != 0:
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(frame[idx]*4), "int")]))
             idx += 1
             # 引数受け取り
-            if asm.instr_name == "recv_ret_val_dir_int":
-                new_lis.append(virtual.Virtual_Asm("mv", 2, [asm.arg_list[0], virtual.Reg("x4", "int")]))
-            elif asm.instr_name == "recv_ret_val_dir_float":
-                new_lis.append(virtual.Virtual_Asm("fmv", 2, [asm.arg_list[0], virtual.Reg("f4", "float")]))
+            if asm.op == opcodes.RECV_RET_VAL_DIR_INT:
+                new_lis.append(virtual.Virtual_Asm(opcodes.MV, 2, [asm.arg_list[0], virtual.Reg("x4", "int")]))
 
-        elif asm.instr_name == "just_call_cls":
+        elif asm.op == opcodes.JUST_CALL_CLS:
             # 使用する引数レジスタの数に合わせて配列を作る
             func_args_int = []
             func_args_float = []
@@ -446,72 +445,72 @@ def expand (
                     func_args_float.append("fa" + str(float_idx))
                     float_idx += 1
             # spの移動
-            if len(virtual_stack) != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-len(virtual_stack)*4), "int")]))
+            if frame[idx] != 0:
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-frame[idx]*4), "int")]))
             # caller-saveなレジスタをスタックに移動
             call_virtual_stack_int = []
             call_virtual_stack_float = []
             live_int_set = live_int[idx]
             live_float_set = live_float[idx]
-            for item in reglist.INT_REGS_FOR_MAIN[reglist.INT_REGS_FOR_MAIN_RESPONSIBLE_IDX:]:
+            for item in ctx.int_regs_for_main[ctx.int_regs_for_main_responsible_idx:]:
                 if item in live_int_set:
                     call_virtual_stack_int.append(item)
-            for item in reglist.FLOAT_REGS_FOR_MAIN[reglist.FLOAT_REGS_FOR_MAIN_RESPONSIBLE_IDX:]:
+            for item in ctx.float_regs_for_main[ctx.float_regs_for_main_responsible_idx:]:
                 if item in live_float_set:
                     call_virtual_stack_float.append(item)
             tmp_sp = 0
             for item in call_virtual_stack_int:
                 tmp_sp -= 4
-                new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
             for item in call_virtual_stack_float:
                 tmp_sp -= 4
-                new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
             if tmp_sp != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
             # 関数のラベルをクロージャから取り出す
-            new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg("x4", "int"), asm.arg_list[0], virtual.Reg("0", "int")]))
-            new_lis.append(virtual.Virtual_Asm("mv", 2, [virtual.Reg("a0", "int"), asm.arg_list[0]]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg("x4", "int"), asm.arg_list[0], virtual.Reg("0", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.MV, 2, [virtual.Reg("a0", "int"), asm.arg_list[0]]))
             # 引数を引数レジスタに登録する（スタックに一旦保存 → その後取り出す）
             # mv a1, a3; mv a2, a1というときに事故がおこらないようにするため。
             tmp_idx = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             tmp_idx_2 = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx_2].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx_2].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             # 関数呼び出し
-            new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), virtual.Reg("ra", "int"), virtual.Reg("-4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("jalr", 2, [virtual.Reg("x4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg("ra", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), virtual.Reg("ra", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.JALR, 2, [virtual.Reg("x4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg("ra", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
             # caller-saveなレジスタをもとに戻す
             if tmp_sp != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
             for item in reversed(call_virtual_stack_float):
-                new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
                 tmp_sp += 4
             for item in reversed(call_virtual_stack_int):
-                new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
                 tmp_sp += 4
             # spをもとに戻す
-            if len(virtual_stack) != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(len(virtual_stack)*4), "int")]))
+            if frame[idx] != 0:
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(frame[idx]*4), "int")]))
             idx += 1
 
-        elif asm.instr_name == "just_call_cls_and_jump":
+        elif asm.op == opcodes.JUST_CALL_CLS_AND_JUMP:
             # 使用する引数レジスタの数に合わせて配列を作る
             func_args_int = []
             func_args_float = []
@@ -525,35 +524,35 @@ def expand (
                     func_args_float.append("fa" + str(float_idx))
                     float_idx += 1
             # 関数のラベルをクロージャから取り出す
-            new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg("x4", "int"), asm.arg_list[0], virtual.Reg("0", "int")]))
-            new_lis.append(virtual.Virtual_Asm("mv", 2, [virtual.Reg("a0", "int"), asm.arg_list[0]]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg("x4", "int"), asm.arg_list[0], virtual.Reg("0", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.MV, 2, [virtual.Reg("a0", "int"), asm.arg_list[0]]))
             # 引数を引数レジスタに登録する（スタックに一旦保存 → その後取り出す）
             # mv a1, a3; mv a2, a1というときに事故がおこらないようにするため。
             tmp_idx = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             tmp_idx_2 = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx_2].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx_2].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             # 関数呼び出し
             new_lis += fundef_ret_asm_list + [
-                virtual.Virtual_Asm("jalr", 3, [virtual.Reg("x0", "int"), virtual.Reg("x4", "int"), virtual.Reg("0", "int")])
+                virtual.Virtual_Asm(opcodes.JALR, 3, [virtual.Reg("x0", "int"), virtual.Reg("x4", "int"), virtual.Reg("0", "int")])
             ]
             idx += 1
 
-        elif asm.instr_name == "recv_ret_val_cls_int" or asm.instr_name == "recv_ret_val_cls_float":
+        elif asm.op == opcodes.RECV_RET_VAL_CLS_INT or asm.op == opcodes.RECV_RET_VAL_CLS_FLOAT:
             # 使用する引数レジスタの数に合わせて配列を作る
             func_args_int = []
             func_args_float = []
@@ -567,81 +566,83 @@ def expand (
                     func_args_float.append("fa" + str(float_idx))
                     float_idx += 1
             # spの移動
-            if len(virtual_stack) != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-len(virtual_stack)*4), "int")]))
+            if frame[idx] != 0:
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-frame[idx]*4), "int")]))
             # caller-saveなレジスタをスタックに移動
             call_virtual_stack_int = []
             call_virtual_stack_float = []
             live_int_set = live_int[idx]
             live_float_set = live_float[idx]
-            for item in reglist.INT_REGS_FOR_MAIN[reglist.INT_REGS_FOR_MAIN_RESPONSIBLE_IDX:]:
+            for item in ctx.int_regs_for_main[ctx.int_regs_for_main_responsible_idx:]:
                 if item in live_int_set:
                     call_virtual_stack_int.append(item)
-            for item in reglist.FLOAT_REGS_FOR_MAIN[reglist.FLOAT_REGS_FOR_MAIN_RESPONSIBLE_IDX:]:
+            for item in ctx.float_regs_for_main[ctx.float_regs_for_main_responsible_idx:]:
                 if item in live_float_set:
                     call_virtual_stack_float.append(item)
+            # 小数の返り値は退避させずに直接返り値を受け取るレジスタに移すので,そのレジスタは元に戻さない（呼び出し前の値は呼び出し後に使われない）
+            # f4は割り当てにも使われるレジスタなので,退避に使うと生きている値を上書きしてしまう
+            if asm.op == opcodes.RECV_RET_VAL_CLS_FLOAT and asm.arg_list[0].name in call_virtual_stack_float:
+                call_virtual_stack_float.remove(asm.arg_list[0].name)
             tmp_sp = 0
             for item in call_virtual_stack_int:
                 tmp_sp -= 4
-                new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "int"), virtual.Reg(str(tmp_sp), "int")]))
             for item in call_virtual_stack_float:
                 tmp_sp -= 4
-                new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), virtual.Reg(item, "float"), virtual.Reg(str(tmp_sp), "int")]))
             if tmp_sp != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
             # 関数のラベルをクロージャから取り出す
-            new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg("x4", "int"), asm.arg_list[1], virtual.Reg("0", "int")]))
-            new_lis.append(virtual.Virtual_Asm("mv", 2, [virtual.Reg("a0", "int"), asm.arg_list[1]]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg("x4", "int"), asm.arg_list[1], virtual.Reg("0", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.MV, 2, [virtual.Reg("a0", "int"), asm.arg_list[1]]))
             # 引数を引数レジスタに登録する（スタックに一旦保存 → その後取り出す）
             # mv a1, a3; mv a2, a1というときに事故がおこらないようにするため。
             tmp_idx = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("fsw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FSW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), asm.arg_list[tmp_idx], virtual.Reg(str(tmp_idx * 4), "int")]))
                 tmp_idx -= 1
             tmp_idx_2 = -1
             for i in range(float_idx):
                 if asm.arg_list[tmp_idx_2].name != "fa" + str(i):
-                    new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(func_args_float[i], "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             for i in range(int_idx-1):
                 if asm.arg_list[tmp_idx_2].name != "a" + str(i+1):
-                    new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
+                    new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(func_args_int[i], "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_idx_2 * 4), "int")]))
                 tmp_idx_2 -= 1
             # 関数呼び出し
-            new_lis.append(virtual.Virtual_Asm("sw", 3, [virtual.Reg("sp", "int"), virtual.Reg("ra", "int"), virtual.Reg("-4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("jalr", 2, [virtual.Reg("x4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("4", "int")]))
-            new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg("ra", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
-            # 関数が返ってきたら一旦f4 or x4に退避させる
-            if asm.instr_name == "recv_ret_val_cls_int":
-                new_lis.append(virtual.Virtual_Asm("mv", 2, [virtual.Reg("x4", "int"), virtual.Reg("a1", "int")]))
-            elif asm.instr_name == "recv_ret_val_cls_float":
-                new_lis.append(virtual.Virtual_Asm("fmv", 2, [virtual.Reg("f4", "float"), virtual.Reg("fa0", "float")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.SW, 3, [virtual.Reg("sp", "int"), virtual.Reg("ra", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.JALR, 2, [virtual.Reg("x4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg("4", "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg("ra", "int"), virtual.Reg("sp", "int"), virtual.Reg("-4", "int")]))
+            # 関数が返ってきたら,整数の返り値は一旦x4に退避させ,小数の返り値は返り値を受け取るレジスタに移す
+            if asm.op == opcodes.RECV_RET_VAL_CLS_INT:
+                new_lis.append(virtual.Virtual_Asm(opcodes.MV, 2, [virtual.Reg("x4", "int"), virtual.Reg("a1", "int")]))
+            elif asm.op == opcodes.RECV_RET_VAL_CLS_FLOAT:
+                new_lis.append(virtual.Virtual_Asm(opcodes.FMV, 2, [asm.arg_list[0], virtual.Reg("fa0", "float")]))
             # caller-saveなレジスタをもとに戻す
             if tmp_sp != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(-tmp_sp), "int")]))
             for item in reversed(call_virtual_stack_float):
-                new_lis.append(virtual.Virtual_Asm("flw", 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FLW, 3, [virtual.Reg(item, "float"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
                 tmp_sp += 4
             for item in reversed(call_virtual_stack_int):
-                new_lis.append(virtual.Virtual_Asm("lw", 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.LW, 3, [virtual.Reg(item, "int"), virtual.Reg("sp", "int"), virtual.Reg(str(tmp_sp), "int")]))
                 tmp_sp += 4
             # spをもとに戻す
-            if len(virtual_stack) != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(len(virtual_stack)*4), "int")]))
+            if frame[idx] != 0:
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(frame[idx]*4), "int")]))
             idx += 1
             # 引数受け取り
-            if asm.instr_name == "recv_ret_val_cls_int":
-                new_lis.append(virtual.Virtual_Asm("mv", 2, [asm.arg_list[0], virtual.Reg("x4", "int")]))
-            elif asm.instr_name == "recv_ret_val_cls_float":
-                new_lis.append(virtual.Virtual_Asm("fmv", 2, [asm.arg_list[0], virtual.Reg("f4", "float")]))
-        elif asm.instr_name == "* args" or asm.instr_name == "* not used args" or asm.instr_name == "* formal_fv":
+            if asm.op == opcodes.RECV_RET_VAL_CLS_INT:
+                new_lis.append(virtual.Virtual_Asm(opcodes.MV, 2, [asm.arg_list[0], virtual.Reg("x4", "int")]))
+        elif asm.op == opcodes.ARGS or asm.op == opcodes.NOT_USED_ARGS or asm.op == opcodes.FORMAL_FV:
             idx += 1
         
         # その他の命令はそのまま
@@ -649,4 +650,4 @@ def expand (
             new_lis.append(asm)
             idx += 1
     
-    return new_lis, virtual_stack
+    return new_lis
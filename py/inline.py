@@ -7,45 +7,61 @@
 
 from typing import List
 import virtual
+import opcodes
+import context
+import error
+
+# inlineOptで1命令に置き換える組み込み関数（副作用がないので，返り値を使わなければ呼び出しごと取り除ける）
+PURE_FUNCS = {
+    "min_caml_float_of_int", "min_caml_fneg", "min_caml_fsqr", "min_caml_fabs", "min_caml_sqrt",
+    "min_caml_int_of_float", "min_caml_fless", "min_caml_fisneg", "min_caml_fispos", "min_caml_fiszero",
+}
+
+# fisneg, fispos, fiszeroの比較に使う0.0の入ったレジスタ
+# レジスタ割り当ての後なので新しいレジスタは使えない（constReg.chooseConstRegsが0.0の定数レジスタを必ず確保する）
+def zeroFloatReg (ctx:context.CompilationContext) -> virtual.Reg:
+    if 0.0 not in ctx.float_const_regs:
+        error.error("No constant register holds 0.0, which min_caml_fisneg, min_caml_fispos and min_caml_fiszero need.")
+    return virtual.Reg(ctx.float_const_regs[0.0], "float")
 
 # 特定の組み込み関数に関して、呼び出しのインライン化を施す
-def inlineOpt (lis:List[virtual.Virtual_Asm]) -> virtual.Virtual_Asm:
+def inlineOpt (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm]) -> virtual.Virtual_Asm:
     new_lis = []
     for asm in lis:
-        if asm.instr_name == "recv_ret_val_dir_float":
+        if asm.op == opcodes.RECV_RET_VAL_DIR_FLOAT:
             if asm.arg_list[1].name == "min_caml_float_of_int":
-                new_lis.append(virtual.Virtual_Asm("fcvt.s.w", 2, [asm.arg_list[0], asm.arg_list[2]]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FCVT_S_W, 2, [asm.arg_list[0], asm.arg_list[2]]))
                 continue
             elif asm.arg_list[1].name == "min_caml_fneg":
-                new_lis.append(virtual.Virtual_Asm("fneg", 2, [asm.arg_list[0], asm.arg_list[2]]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FNEG, 2, [asm.arg_list[0], asm.arg_list[2]]))
                 continue
             elif asm.arg_list[1].name == "min_caml_fsqr":
-                new_lis.append(virtual.Virtual_Asm("fmul", 2, [asm.arg_list[0], asm.arg_list[2], asm.arg_list[2]]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FMUL, 2, [asm.arg_list[0], asm.arg_list[2], asm.arg_list[2]]))
                 continue
             elif asm.arg_list[1].name == "min_caml_fabs":
-                new_lis.append(virtual.Virtual_Asm("fabs", 2, [asm.arg_list[0], asm.arg_list[2]]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FABS, 2, [asm.arg_list[0], asm.arg_list[2]]))
                 continue
             elif asm.arg_list[1].name == "min_caml_sqrt":
-                new_lis.append(virtual.Virtual_Asm("fsqrt", 2, [asm.arg_list[0], asm.arg_list[2]]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FSQRT, 2, [asm.arg_list[0], asm.arg_list[2]]))
                 continue
-        elif asm.instr_name == "recv_ret_val_dir_int":
+        elif asm.op == opcodes.RECV_RET_VAL_DIR_INT:
             if asm.arg_list[1].name == "min_caml_int_of_float":
-                new_lis.append(virtual.Virtual_Asm("fcvt.w.s", 2, [asm.arg_list[0], asm.arg_list[2]]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FCVT_W_S, 2, [asm.arg_list[0], asm.arg_list[2]]))
                 continue
             elif asm.arg_list[1].name == "min_caml_fless":
-                new_lis.append(virtual.Virtual_Asm("flt", 3, [asm.arg_list[0], asm.arg_list[3], asm.arg_list[2]]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.FLT, 3, [asm.arg_list[0], asm.arg_list[3], asm.arg_list[2]]))
                 continue
             elif asm.arg_list[1].name == "min_caml_fisneg":
-                new_lis.append(virtual.Virtual_Asm("fmv.w.x", 3, [virtual.Reg("f4", "float"), virtual.Reg("x0", "int")]))
-                new_lis.append(virtual.Virtual_Asm("flt", 3, [asm.arg_list[0], asm.arg_list[2], virtual.Reg("f4", "float")]))
+                zero = zeroFloatReg(ctx)
+                new_lis.append(virtual.Virtual_Asm(opcodes.FLT, 3, [asm.arg_list[0], asm.arg_list[2], zero]))
                 continue
             elif asm.arg_list[1].name == "min_caml_fispos":
-                new_lis.append(virtual.Virtual_Asm("fmv.w.x", 3, [virtual.Reg("f4", "float"), virtual.Reg("x0", "int")]))
-                new_lis.append(virtual.Virtual_Asm("flt", 3, [asm.arg_list[0], virtual.Reg("f4", "float"), asm.arg_list[2]]))
+                zero = zeroFloatReg(ctx)
+                new_lis.append(virtual.Virtual_Asm(opcodes.FLT, 3, [asm.arg_list[0], zero, asm.arg_list[2]]))
                 continue
             elif asm.arg_list[1].name == "min_caml_fiszero":
-                new_lis.append(virtual.Virtual_Asm("fmv.w.x", 3, [virtual.Reg("f4", "float"), virtual.Reg("x0", "int")]))
-                new_lis.append(virtual.Virtual_Asm("feq", 3, [asm.arg_list[0], virtual.Reg("f4", "float"), asm.arg_list[2]]))
+                zero = zeroFloatReg(ctx)
+                new_lis.append(virtual.Virtual_Asm(opcodes.FEQ, 3, [asm.arg_list[0], zero, asm.arg_list[2]]))
                 continue
         new_lis.append(asm)
     
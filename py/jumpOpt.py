@@ -7,6 +7,7 @@
 
 from typing import List, Union
 import virtual
+import opcodes
 
 # i番目の命令の次の命令がjumpであるかどうかを判定する
 # jumpである場合はそのラベル名を返す，そうでなければFalseを返す
@@ -14,67 +15,46 @@ def isNextInstrJump(lis:List[virtual.Virtual_Asm], i) -> Union[bool, str]:
     # 次の意味のある命令のidxの取得
     i += 1
     while i < len(lis):
-        if ":" in lis[i].instr_name: # ラベルはスキップ
+        if lis[i].op == opcodes.LABEL: # ラベルはスキップ
             i += 1
-        elif lis[i].instr_name == "nop": # nopはスキップ
+        elif lis[i].op == opcodes.NOP: # nopはスキップ
             i += 1
         else:
             break
     # 次の意味のある命令がjumpであるかどうか判定
-    if i < len(lis) and lis[i].instr_name == "j":
+    if i < len(lis) and lis[i].op == opcodes.J:
         return lis[i].arg_list[0].name
     else:
         return False
 
-# 指定されたラベルが入っているidxを見つける
-# みつからなかった場合Falseを返す
-def findLabel(lis:List[virtual.Virtual_Asm], label:str) -> Union[int, bool]:
-    i = 0
-    while i < len(lis) and lis[i].instr_name != label + ":":
-        i += 1
-    if i == len(lis): # Labelが見つからなかった場合
-        return False
-    else:
-        return i
-    
+# labelの行から，次の命令がjumpである限りそのジャンプ先を辿っていき，最後に辿り着いたラベル名を返す
+# label_posはcfg.labelPositions(lis)で，ジャンプ先のラベルがlisにない場合はそこで止まる
+def followJumps(lis:List[virtual.Virtual_Asm], label_pos, label:str) -> str:
+    while True:
+        label_idx = label_pos.get(label)
+        if label_idx is None: # Labelが見つからなかった場合
+            break
+        false_or_jump_label = isNextInstrJump(lis, label_idx)
+        if type(false_or_jump_label) is str: # jump先の次の命令がジャンプだった場合
+            label = false_or_jump_label
+        else: # jump先の次の命令がジャンプではなかった場合
+            break
+    return label
 
-def jumpOpt(lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
+# label_posはcfg.labelPositions(lis)（ジャンプ先を書き換えるだけなので，ラベルの位置は変わらない）
+def jumpOpt(lis:List[virtual.Virtual_Asm], label_pos) -> List[virtual.Virtual_Asm]:
     for asm in lis:
-        if asm.instr_name == "j":
-            label = asm.arg_list[0].name
-            while True:
-                false_or_label_idx = findLabel(lis, label)
-                if type(false_or_label_idx) is int:
-                    label_idx = false_or_label_idx
-                    false_or_jump_label = isNextInstrJump(lis, label_idx)
-                    if type(false_or_jump_label) is str: # jump先の次の命令がジャンプだった場合
-                        label = false_or_jump_label
-                        continue
-                    else: # jump先の次の命令がジャンプではなかった場合
-                        break
-                else:
-                    break
-            asm.arg_list[0].name = label
+        if asm.op == opcodes.J:
+            label = followJumps(lis, label_pos, asm.arg_list[0].name)
+            asm.arg_list[0] = virtual.Reg(label, asm.arg_list[0].typ)
     
     return lis
 
 # jumpと違いbranch命令のラベルはspOpt内で参照されるため，ループのなかではなくループ後に実行される
-def branchOpt(lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
+def branchOpt(lis:List[virtual.Virtual_Asm], label_pos) -> List[virtual.Virtual_Asm]:
     for asm in lis:
-        if asm.instr_name == "beq" or asm.instr_name == "bge" or asm.instr_name == "blt" or asm.instr_name == "bfeq" or asm.instr_name == "bfle" or asm.instr_name == "bflt":
-            label = asm.arg_list[2].name
-            while True:
-                false_or_label_idx = findLabel(lis, label)
-                if type(false_or_label_idx) is int:
-                    label_idx = false_or_label_idx
-                    false_or_jump_label = isNextInstrJump(lis, label_idx)
-                    if type(false_or_jump_label) is str: # jump先の次の命令がジャンプだった場合
-                        label = false_or_jump_label
-                        continue
-                    else: # jump先の次の命令がジャンプではなかった場合
-                        break
-                else:
-                    break
-            asm.arg_list[2].name = label
+        if opcodes.INFO[asm.op].flags & opcodes.IS_BRANCH:
+            label = followJumps(lis, label_pos, asm.arg_list[2].name)
+            asm.arg_list[2] = virtual.Reg(label, asm.arg_list[2].typ)
 
     return lis
\ No newline at end of file
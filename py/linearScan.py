@@ -0,0 +1,172 @@
+#--------------------------------------------------
+#
+# linearScan.py
+# 生存区間の線形走査によるレジスタ割り当て（命令数の多い関数のための速いモード）
+#
+# 実装の方針：
+# regAllocのグラフ彩色はspillのたびにbuildからやり直すので，命令数の多い関数（特にmain）ではコンパイル時間の大部分を占める
+# そこで，干渉グラフを作らずに，命令列の順番で各変数の生存区間を求め，区間の始まりの順にレジスタに詰めていく（second-chance binpacking）
+#   生存区間は命令ごとに 読む位置(2n) と 書く位置(2n+1) の2つの位置を使い，生きている位置の連続した範囲のリストで表す
+#   if/elseの片方の節でしか生きていない変数は，もう片方の節の分だけ区間に穴が空くので，その穴には他の変数を入れられる
+#   最後に使用する命令で定義される変数とは，読む位置と書く位置が重ならないので同じレジスタに入る（regAllocの干渉グラフと同じ）
+# 入るレジスタがなければ，入っている変数を1つ追い出せるレジスタのうち，追い出す変数の区間の終わりが最も遠いものを選ぶ
+# （それが今の変数の区間の終わりより近ければ今の変数をspillする）
+# spillした変数は定義の直後にstore，使用の直前にrestoreを置き，その1つ1つを別の変数として名前を付け直してから走査し直す
+# 名前を付け直した変数の区間はstore/restoreとその隣の命令だけなので，次の走査ではほぼレジスタに入る
+# if/elseの両方の節で定義される変数もspillできる（両方の節のstoreは変数名で決まる同じスロットに入る，stackSlot）
+#
+#--------------------------------------------------
+
+import virtual
+import opcodes
+import liveness
+import regAlloc
+import deadCode
+import context
+import error
+import bisect
+from typing import List, Dict, Set, Tuple
+
+# lisをこのモジュールの線形走査で割り当てるかどうか（ctx.options.allocator, ctx.options.linear_scan_thresholdで決める）
+def useLinearScan (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm]) -> bool:
+    if ctx.options.allocator == "auto":
+        return len(lis) > ctx.options.linear_scan_threshold
+    return ctx.options.allocator == "linear"
+
+# 変数名 => 生きている位置の範囲 [始まり, 終わり] のリスト の辞書を，区間の始まりの順に作る
+# n番目の有効な命令で使用するか，命令の前で生きていれば位置2nを，定義するか，命令の後で生きていれば位置2n+1を区間に含める
+def buildRanges (live:Dict[int, Set[str]], defs:Dict[int, Set[str]], uses:Dict[int, Set[str]]) -> Dict[str, List[List[int]]]:
+    ranges = {}
+    n = 0
+    for i in defs: # defs, uses, liveのキーはどれも有効な命令のidxを昇順に並べたもの
+        live_in = uses[i] | (live[i] - defs[i])
+        for pos, names in ((2 * n, live_in), (2 * n + 1, defs[i] | live[i])):
+            for name in names:
+                lst = ranges.get(name)
+                if lst is None:
+                    ranges[name] = [[pos, pos]]
+                elif lst[-1][1] == pos - 1:
+                    lst[-1][1] = pos
+                else:
+                    lst.append([pos, pos])
+        n += 1
+    return ranges
+
+# 1つのレジスタに入っている範囲（始まりの昇順に並べた，重ならない範囲）
+class RegisterRanges:
+    def __init__ (self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.names: List[str] = []
+
+    # rangesと重なる範囲を持つ変数の集合
+    def conflicts (self, ranges:List[List[int]]) -> Set[str]:
+        names = set()
+        for start, end in ranges:
+            k = bisect.bisect_right(self.starts, end)
+            while k > 0 and self.ends[k-1] >= start:
+                names.add(self.names[k-1])
+                k -= 1
+        return names
+
+    def add (self, name:str, ranges:List[List[int]]):
+        for start, end in ranges:
+            k = bisect.bisect_left(self.starts, start)
+            self.starts.insert(k, start)
+            self.ends.insert(k, end)
+            self.names.insert(k, name)
+
+    def remove (self, name:str, ranges:List[List[int]]):
+        for start, _ in ranges:
+            k = bisect.bisect_left(self.starts, start)
+            del self.starts[k], self.ends[k], self.names[k]
+
+# 区間の始まりの順にregs_listのレジスタに詰めていく
+# 返り値は 変数名 => レジスタ名 の割り当てとspillする変数の集合（unspillableの変数はspillしない）
+def scan (ranges:Dict[str, List[List[int]]], regs_list:List[str], unspillable:Set[str]) -> Tuple[Dict[str, str], Set[str]]:
+    allocation = {}
+    spilled = set()
+    regs = {reg: RegisterRanges() for reg in regs_list}
+    for name in ranges:
+        # 重ならないレジスタがあれば先頭に近いものに入れる
+        victim = None # 追い出す変数
+        victim_reg = None
+        for reg in regs_list:
+            conflicts = regs[reg].conflicts(ranges[name])
+            if not conflicts:
+                victim = None
+                victim_reg = reg
+                break
+            if len(conflicts) == 1:
+                other = conflicts.pop()
+                if other not in unspillable and (victim is None or ranges[other][-1][1] > ranges[victim][-1][1]):
+                    victim = other
+                    victim_reg = reg
+        if victim_reg is not None and victim is None:
+            allocation[name] = victim_reg
+            regs[victim_reg].add(name, ranges[name])
+            continue
+        # 入るレジスタがないので，区間の終わりが最も遠い変数をspillする
+        if name not in unspillable and (victim is None or ranges[victim][-1][1] <= ranges[name][-1][1]):
+            spilled.add(name)
+            continue
+        if victim is None:
+            error.error("Register allocation failed.")
+        spilled.add(victim)
+        regs[victim_reg].remove(victim, ranges[victim])
+        allocation.pop(victim)
+        allocation[name] = victim_reg
+        regs[victim_reg].add(name, ranges[name])
+    return allocation, spilled
+
+# spilled_int, spilled_floatの変数について，定義の直後にstore，使用の直前にrestoreを入れる
+# store/restoreの対象は命令ごとに新しい名前の変数にして，その名前をpiecesに加える
+def insertSpillCode (lis:List[virtual.Virtual_Asm], spilled_int:Set[str], spilled_float:Set[str], pieces:Set[str]) -> List[virtual.Virtual_Asm]:
+    new_lis = []
+    stores = {} # storeを入れる位置 => storeのリスト
+    for i, asm in enumerate(lis):
+        new_lis += stores.pop(i, [])
+        if opcodes.INFO[asm.op].flags & opcodes.IS_NOT_INSTR:
+            new_lis.append(asm)
+            continue
+        def_pos, use_pos = opcodes.INFO[asm.op].defUse(len(asm.arg_list))
+        arg_list = list(asm.arg_list)
+        renamed = {} # この命令で使用する変数 => 新しい名前
+        for pos in use_pos:
+            reg = arg_list[pos]
+            if reg.name in (spilled_int if reg.typ == "int" else spilled_float if reg.typ == "float" else ()):
+                if reg.name not in renamed:
+                    renamed[reg.name] = reg.name + ".r" + str(len(pieces))
+                    pieces.add(renamed[reg.name])
+                    new_lis.append(virtual.Virtual_Asm(opcodes.RESTORE, 2, [virtual.Reg(renamed[reg.name], reg.typ), virtual.Reg(reg.name, 'label')]))
+                arg_list[pos] = virtual.Reg(renamed[reg.name], reg.typ)
+        for pos in def_pos:
+            reg = arg_list[pos]
+            if reg.name in (spilled_int if reg.typ == "int" else spilled_float if reg.typ == "float" else ()):
+                piece = reg.name + ".s" + str(len(pieces))
+                pieces.add(piece)
+                stores.setdefault(regAlloc.storePos(lis, i), []).append(virtual.Virtual_Asm(opcodes.STORE, 2, [virtual.Reg(piece, reg.typ), virtual.Reg(reg.name, 'label')]))
+                arg_list[pos] = virtual.Reg(piece, reg.typ)
+        if arg_list != asm.arg_list:
+            asm = virtual.Virtual_Asm(asm.op, asm.arg_count, arg_list)
+        new_lis.append(asm)
+    new_lis += stores.pop(len(lis), [])
+    return new_lis
+
+# レジスタ割り当て
+# regAlloc.regAllocと同じく，virtual_asmのlistを受け取ってレジスタ割り当て後のvirtual_asmを返す
+def linearScan (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], int_regs:List[str], float_regs:List[str]) -> List[virtual.Virtual_Asm]:
+    lis = regAlloc.findNotUsedArgs(ctx, lis)
+    pieces = set() # spillで名前を付け直した変数
+    while True:
+        live_int, live_float, def_int, use_int, def_float, use_float = liveness.AnalyzeLiveness(ctx, lis)
+        allocation_int, spilled_int = scan(buildRanges(live_int, def_int, use_int), int_regs, pieces)
+        allocation_float, spilled_float = scan(buildRanges(live_float, def_float, use_float), float_regs, pieces)
+        if not spilled_int and not spilled_float:
+            break
+        lis = insertSpillCode(lis, spilled_int, spilled_float, pieces)
+
+    # レジスタが割り当てられなかった（どこでも生きていない）変数を定義する命令を削除する
+    lis, allocation_int, allocation_float = deadCode.removeUnallocated(ctx, lis, allocation_int, allocation_float)
+
+    return regAlloc.applyAllocation(ctx, lis, allocation_int, allocation_float)
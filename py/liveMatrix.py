@@ -0,0 +1,205 @@
+#--------------------------------------------------
+#
+# liveMatrix.py
+# NumPyのビット行列による生存解析と干渉グラフの作成（命令数の非常に多い関数のためのバックエンド）
+#
+# 実装の方針：
+# 機械的に生成された入力では1つの関数が数万命令になり，livenessのビット集合（Pythonの整数）から変数名の集合への変換と，
+# regAlloc.buildの枝張りが大部分の時間を占める
+# そこで，変数 × 命令の生存情報を，1行が1命令，1ビットが1変数のuint64の行列（1行に(変数の数+63)//64語）で持ち，行ごとの操作をまとめて行う
+# - 命令の伝達関数 x -> (x & ~(def|use)) | use を (mask, val) の組で表し，ブロックの末尾からその命令の直前までの合成を，
+#   ブロックの中で 1, 2, 4, ... 命令先の組と合成するのを繰り返して（倍々のscan）全命令分まとめて求める
+#   合成は (mask_i, val_i) ∘ (mask_j, val_j) = (mask_i | mask_j, val_i | (val_j & ~mask_i))
+# - ブロックの先頭の組がそのブロックのgen, killになるので，ブロック単位の方程式はlivenessと同じワークリスト法で解く（ブロック数は命令数よりずっと少ない）
+# - 各命令の直後に生きている変数は，次の命令の組をブロックのlive_outに適用したもので，これも行列の演算1回で求まる
+# - 干渉グラフは，変数 × 変数の行列の 定義される変数の行 に その命令の直後の生存変数の行 をORで足していき（mv/fmvは移動元のビットをANDで落とす），
+#   転置したものとORをとって対称にする
+# - 変数名の集合への変換は，0でない語だけを取り出してビットに展開するので，立っているビットの数に比例する時間で済む
+# NumPyがなければ，livenessとregAllocは今まで通りの純Pythonの実装を使う
+#
+#--------------------------------------------------
+
+from typing import List, Dict, Set, FrozenSet, Tuple
+from collections.abc import Mapping
+import cfg
+import context
+try:
+    import numpy
+except ImportError: # NumPyは必須ではない
+    numpy = None
+
+# 有効な命令がn個の関数でビット行列を使うかどうか（options.liveness_backend, options.liveness_matrix_thresholdで決める）
+def useMatrix (options:context.Options, n:int) -> bool:
+    if numpy is None:
+        return False
+    if options.liveness_backend == "auto":
+        return n > options.liveness_matrix_threshold
+    return options.liveness_backend == "numpy"
+
+# 行列はリトルエンディアンのuint64で持つので，バイトの列として見ると変数の番号の順にビットが並ぶ
+WORD = "<u8"
+
+# 行列matの立っているビットの 行の番号の配列, 列（変数の番号）の配列 を，行の昇順・同じ行なら列の昇順に返す
+# 0でない語，その中の0でないバイトの順に絞ってから，バイトをビットに展開する
+def setBits (mat) -> Tuple:
+    words = numpy.flatnonzero(mat)
+    word_bytes = mat.ravel()[words].view(numpy.uint8)
+    nonzero_bytes = numpy.flatnonzero(word_bytes)
+    bits = numpy.flatnonzero(numpy.unpackbits(word_bytes[nonzero_bytes], bitorder="little"))
+    byte_pos = nonzero_bytes[bits >> 3]
+    rows, word_col = numpy.divmod(words[byte_pos >> 3], max(mat.shape[1], 1))
+    return rows, word_col * 64 + (byte_pos & 7) * 8 + (bits & 7)
+
+# 行列matの (rows[k], cols[k]) のビットを立てる
+def orBits (mat, rows, cols):
+    numpy.bitwise_or.at(mat, (rows, cols >> 6), numpy.left_shift(numpy.uint64(1), (cols & 63).astype(numpy.uint64)))
+
+# 1種類（intかfloat）の生存解析の結果
+# 命令のidx => その命令の直後に生きている変数の集合 の辞書のように振る舞い，変数名の集合への変換は参照されたときに行う
+class LiveMatrix (Mapping):
+    def __init__ (self, blocks:List[cfg.BasicBlock], defs:Dict[int, FrozenSet[str]], uses:Dict[int, FrozenSet[str]]):
+        # 行はブロックの順，ブロックの中は命令の順（cfgのブロックは命令の順に並んでいるので，命令のidxの昇順になる）
+        self.instrs: List[int] = [i for block in blocks for i in block.instrs]
+        self.row: Dict[int, int] = {i : r for r, i in enumerate(self.instrs)}
+        self.names: List[str] = []
+        self.idx: Dict[str, int] = {}
+        self.cache: Dict[int, Set[str]] = {}
+        # 変数に番号を振り，def, useの行列を作る
+        def_r, def_c, use_r, use_c = [], [], [], []
+        for r, i in enumerate(self.instrs):
+            for names, rs, cs in ((defs[i], def_r, def_c), (uses[i], use_r, use_c)):
+                for name in names:
+                    k = self.idx.get(name)
+                    if k is None:
+                        k = len(self.names)
+                        self.idx[name] = k
+                        self.names.append(name)
+                    rs.append(r)
+                    cs.append(k)
+        n = len(self.instrs)
+        self.words = (len(self.names) + 63) // 64
+        mask = numpy.zeros((n, self.words), dtype=WORD)
+        val = numpy.zeros((n, self.words), dtype=WORD)
+        orBits(mask, numpy.array(def_r + use_r, dtype=numpy.int64), numpy.array(def_c + use_c, dtype=numpy.int64))
+        orBits(val, numpy.array(use_r, dtype=numpy.int64), numpy.array(use_c, dtype=numpy.int64))
+        # 各行のブロックの番号，ブロックの中での位置，ブロックの命令数
+        lengths = [len(block.instrs) for block in blocks]
+        self.block_of = numpy.repeat(numpy.arange(len(blocks)), lengths)
+        starts = numpy.cumsum([0] + lengths)
+        self.pos = numpy.arange(n) - starts[self.block_of]
+        self.length = numpy.diff(starts)[self.block_of]
+        self.starts = starts[:-1]
+        # ブロックごとに，ブロックの中で定義・使用される変数の語の範囲 [lo, hi) を求める（それ以外の語はブロックの中で変化しない）
+        pair_blocks = self.block_of[numpy.array(def_r + use_r, dtype=numpy.int64)]
+        pair_words = numpy.array(def_c + use_c, dtype=numpy.int64) >> 6
+        lo = numpy.full(len(blocks), self.words)
+        hi = numpy.zeros(len(blocks), dtype=numpy.int64)
+        numpy.minimum.at(lo, pair_blocks, pair_words)
+        numpy.maximum.at(hi, pair_blocks, pair_words + 1)
+        # 倍々のscanで，各行の (mask, val) をブロックの末尾までの合成にする
+        for b, (start, end, l, h) in enumerate(zip(starts[:-1].tolist(), starts[1:].tolist(), lo.tolist(), hi.tolist())):
+            m = mask[start:end, l:h]
+            v = val[start:end, l:h]
+            step = 1
+            while step < end - start:
+                v[:-step] |= v[step:] & ~m[:-step]
+                m[:-step] |= m[step:]
+                step *= 2
+        self.mask = mask
+        self.val = val
+        self.live = None
+
+    # ブロックごとのgen, killのビット集合（Pythonの整数）のリスト
+    def blockGenKill (self) -> Tuple[List[int], List[int]]:
+        gen = [self.toInt(self.val[r]) for r in self.starts]
+        kill = [self.toInt(self.mask[r]) for r in self.starts]
+        return gen, kill
+
+    # ブロックごとのlive_out（Pythonの整数）から，各命令の直後に生きている変数の行列を求める
+    def setBlockLiveOut (self, live_out:List[int]):
+        out = numpy.zeros((len(live_out), self.words), dtype=WORD)
+        for b, bits in enumerate(live_out):
+            out[b] = numpy.frombuffer(bits.to_bytes(self.words * 8, "little"), dtype=WORD)
+        live = out[self.block_of]
+        k = numpy.nonzero(self.pos + 1 < self.length)[0] # ブロックの最後でない行は，次の行の直前に生きている変数
+        live[k] = (live[k + 1] & ~self.mask[k + 1]) | self.val[k + 1]
+        self.live = live
+        self.mask = self.val = None
+        self.live_bits = None
+
+    # 生存変数の行列の立っているビット（setBits）を1度だけ求める
+    def liveBits (self) -> Tuple:
+        if self.live_bits is None:
+            self.live_bits = setBits(self.live)
+        return self.live_bits
+
+    def toInt (self, row) -> int:
+        return int.from_bytes(row.tobytes(), "little")
+
+    # 行列の各行を変数名の集合にしたリスト（bitsは求めてあればsetBits(mat)）
+    def toSets (self, mat, bits:Tuple = None) -> List[Set[str]]:
+        rows, cols = setBits(mat) if bits is None else bits
+        names = numpy.array(self.names, dtype=object)[cols].tolist()
+        bounds = numpy.searchsorted(rows, numpy.arange(len(mat) + 1)).tolist()
+        return [set(names[bounds[r]:bounds[r+1]]) for r in range(len(mat))]
+
+    def __getitem__ (self, i:int) -> Set[str]:
+        ret = self.cache.get(i)
+        if ret is None:
+            r = self.row[i]
+            ret = self.toSets(self.live[r:r+1])[0]
+            self.cache[i] = ret
+        return ret
+    def __iter__ (self):
+        return iter(self.instrs)
+    def __len__ (self) -> int:
+        return len(self.row)
+
+    # 命令のidx => 生存変数の集合 の辞書（命令のidxの昇順）
+    def toDict (self) -> Dict[int, Set[str]]:
+        sets = self.toSets(self.live, self.liveBits())
+        return {i : sets[r] for r, i in enumerate(self.instrs)}
+
+    # regAlloc.buildと同じ干渉グラフ（頂点の順番はregAlloc.nodeOrderと同じ）
+    # move_src: 命令のidx => mv/fmvの移動元の変数
+    def interference (self, defs:Dict[int, FrozenSet[str]], move_src:Dict[int, str]) -> Dict[str, Set]:
+        n_vars = len(self.names)
+        # どこかで生きている変数だけがグラフの頂点になる
+        rows, cols = self.liveBits()
+        first_row = numpy.full(n_vars, len(self.instrs))
+        numpy.minimum.at(first_row, cols, rows)
+        is_node = first_row < len(self.instrs)
+        # 定義される変数ごとに，定義する命令の直後に生きている変数の行をORで足す
+        def_rows, def_vars, move_vars = [], [], []
+        for r, i in enumerate(self.instrs):
+            for name in defs[i]:
+                k = self.idx[name]
+                if not is_node[k]:
+                    continue
+                src = self.idx.get(move_src.get(i)) # 移動元が特別な用途のレジスタなら番号はない
+                def_rows.append(r)
+                def_vars.append(k)
+                move_vars.append(-1 if src is None else src)
+        adj = numpy.zeros((n_vars, self.words), dtype=WORD)
+        if def_rows:
+            order = numpy.argsort(def_vars, kind="stable")
+            def_vars = numpy.array(def_vars)[order]
+            move_vars = numpy.array(move_vars)[order]
+            contrib = self.live[numpy.array(def_rows)[order]]
+            # mv/fmvの移動先と移動元の間には枝を張らない
+            moves = numpy.flatnonzero(move_vars >= 0)
+            contrib[moves, move_vars[moves] >> 6] &= ~numpy.left_shift(numpy.uint64(1), (move_vars[moves] & 63).astype(numpy.uint64))
+            heads = numpy.flatnonzero(numpy.r_[True, def_vars[1:] != def_vars[:-1]])
+            if len(heads) == len(def_vars): # どの変数も1回しか定義されない
+                adj[def_vars] = contrib
+            else:
+                adj[def_vars[heads]] = numpy.bitwise_or.reduceat(contrib, heads, axis=0)
+        # 自分自身との枝を落として，転置したものとORをとる
+        diag = numpy.arange(n_vars)
+        adj[diag, diag >> 6] &= ~numpy.left_shift(numpy.uint64(1), (diag & 63).astype(numpy.uint64))
+        rows, cols = setBits(adj)
+        orBits(adj, cols, rows)
+        sets = self.toSets(adj)
+        # 頂点は初めて生きている命令の順，同じ命令なら名前の順
+        nodes = sorted(numpy.nonzero(is_node)[0].tolist(), key=lambda k: (first_row[k], self.names[k]))
+        return {self.names[k] : sets[k] for k in nodes}
@@ -6,210 +6,209 @@
 # 実装の方針：
 # 命令iが定義する変数の集合をdef[i]、命令iが使用する変数の集合をuse[i]としたときに、各命令iについて次の式で生存変数live[i]を計算する：
 # live[i] = ∪_{j in succ(i)} (live[j] \ def[j]) ∪ use[j]
-# 全てのlive[i]が収束するまで繰り返し計算する。succ(i)は命令iの後続命令の集合である。
+# succ(i)は命令iの後続命令の集合である。
+# 命令ごとに集合を更新していくと遅いので，命令列を基本ブロックに分け（cfg.CFG），ブロック単位で計算する：
+# - 変数に0から順に番号を振り，変数の集合はその番号のビットを立てた整数（ビット集合）で表す
+# - ブロックbについて，ブロック内で定義より先に使われる変数の集合gen[b]と，ブロック内で定義される変数の集合kill[b]を先に計算しておく
+# - live_in[b] = gen[b] ∪ (live_out[b] \ kill[b]), live_out[b] = ∪_{c in succ(b)} live_in[c] を，
+#   後続ブロックから先に処理する順（CFGの後順）に並べたワークリストで，live_inが変化したブロックの先行ブロックだけを再計算しながら収束させる
+# - 各命令のlive[i]は，最後にブロックのlive_outから命令を逆順にたどって求め，変数名の集合への変換は参照されたときに行う
+# 命令数の非常に多い関数では，NumPyがあればgen, killと各命令のlive[i]をビット行列でまとめて求める（liveMatrix）
 #
 #--------------------------------------------------
 
-from typing import List, Set, Tuple, Dict
+from typing import List, Set, FrozenSet, Tuple, Dict
+from collections.abc import Mapping
 import virtual
-import re
-import reglist
+import context
 import error
+import opcodes
+import cfg
+import liveMatrix
 
 # regのtypを判別して、対応するdef集合にregを追加する
-def AddToDef (reg:virtual.Reg, def_int:Set[str], def_float:Set[str]):
+def AddToDef (ctx:context.CompilationContext, reg:virtual.Reg, def_int:Set[str], def_float:Set[str]):
     if reg.typ == "float":
-        if reg.name in reglist.SPECIAL_FLOAT_REGS: # 定数レジスタなど特別な用途を持つレジスタは解析に含めない
+        if reg.name in ctx.special_float_regs: # 定数レジスタなど特別な用途を持つレジスタは解析に含めない
             return
         def_float.add(reg.name)
     elif reg.typ == "label":
         pass
     else:
-        if reg.name in reglist.SPECIAL_INT_REGS: # 定数レジスタなど特別な用途を持つレジスタは解析に含めない
+        if reg.name in ctx.special_int_regs: # 定数レジスタなど特別な用途を持つレジスタは解析に含めない
             return
         def_int.add(reg.name)
 
 # regのtypを判別して、対応するuse集合にregを追加する
-def AddToUse (reg:virtual.Reg, use_int:Set[str], use_float:Set[str]):
+# 即値の引数はopcodesの表で役割がROLE_IMMになっているので，ここには来ない
+def AddToUse (ctx:context.CompilationContext, reg:virtual.Reg, use_int:Set[str], use_float:Set[str]):
     if reg.typ == "float":
-        if reg.name in reglist.SPECIAL_FLOAT_REGS: # 定数レジスタなど特別な用途を持つレジスタは解析に含めない
+        if reg.name in ctx.special_float_regs: # 定数レジスタなど特別な用途を持つレジスタは解析に含めない
             return
         use_float.add(reg.name)
     elif reg.typ == "label":
         pass
     else:
-        if reg.name in reglist.SPECIAL_INT_REGS: # 定数レジスタなど特別な用途を持つレジスタは解析に含めない
-            return
-        if re.compile(r'^-?\d+$').search(reg.name): # 即値レジスタは解析に含めない
+        if reg.name in ctx.special_int_regs: # 定数レジスタなど特別な用途を持つレジスタは解析に含めない
             return
         use_int.add(reg.name)
 
 # 1つのvirtual.Virtual_Asmから，その命令が定義する整数変数の集合def_int, その命令が使用する整数変数の集合use_int,
 # その命令が定義する小数変数の集合def_float, その命令が使用する小数変数の集合use_floatをこの順で返す。
-def getDefAndUseFromVirtualAsm (asm:virtual.Virtual_Asm) -> Tuple[Set[str]]:
-    def_int, use_int, def_float, use_float = set(), set(), set(), set()
+# どの引数が定義・使用されるかはopcodesの表の引数の役割で決まる
+# 結果は命令のdef_use_cacheに置いておき，opとarg_listが変わっていなければそれを返す（共有されるのでfrozensetで返す）
+# ctx.special_*_regsは仮想アセンブリを作る前のsetConstRegsで決まり，1回のコンパイル中は変わらないことを前提にしている
+def getDefAndUseFromVirtualAsm (ctx:context.CompilationContext, asm:virtual.Virtual_Asm) -> Tuple[FrozenSet[str]]:
+    cache = asm.def_use_cache
+    if cache is not None and cache[0] == asm.op and cache[1] == asm.arg_list:
+        return cache[2]
 
-    # a := bの形式の命令
-    if asm.instr_name in {"lw", "flw", "mv", "fmv", "fmv.w.x", "fneg", "fabs", "fsqrt", "addi", "slli", "srli", "neg", "fcvt.s.w", "fcvt.w.s"}:
-        AddToDef(asm.arg_list[0], def_int, def_float)
-        AddToUse(asm.arg_list[1], use_int, use_float)
-    
-    # a := b + cの形式の命令
-    elif asm.instr_name in {"add", "sub", "fadd", "fsub", "fmul", "fdiv", "feq", "fle", "flt", "sll", "srl", "fsgnj", "fsgnjx", "fsgnjn"}:
-        AddToDef(asm.arg_list[0], def_int, def_float)
-        AddToUse(asm.arg_list[1], use_int, use_float)
-        AddToUse(asm.arg_list[2], use_int, use_float)
-    
-    # b + cの形式の命令
-    elif asm.instr_name in {"sw", "fsw", "beq", "bge", "blt", "bfeq", "bfle", "bflt"}:
-        AddToUse(asm.arg_list[0], use_int, use_float)
-        AddToUse(asm.arg_list[1], use_int, use_float)
-    
-    # a := 何らかの値 の形式の命令
-    elif asm.instr_name in {"li", "fli", "restore", "* args", "la", "* formal_fv", "lwi", "flwi"}:
-        AddToDef(asm.arg_list[0], def_int, def_float)
-    
-    # a の形式の命令
-    elif asm.instr_name in {"j", "ret", "store", "jalr", "* not used args", "swi", "fswi"}:
-        if len(asm.arg_list) > 0:
-            AddToUse(asm.arg_list[0], use_int, use_float)
-
-    elif asm.instr_name in {"ret_unit"}:
-        pass
-
-    # a := b1, b2, ... , bnの形式の命令
-    elif asm.instr_name in {"recv_ret_val_cls_int", "recv_ret_val_cls_float", "recv_ret_val_dir_int", "recv_ret_val_dir_float"}:
-        AddToDef(asm.arg_list[0], def_int, def_float)
-        for i in range(1, len(asm.arg_list)):
-            AddToUse(asm.arg_list[i], use_int, use_float)
-    
-    # b1, b2, ... , bnの形式の命令
-    elif asm.instr_name in {"just_call_cls", "just_call_dir", "just_call_dir_and_jump", "just_call_cls_and_jump"}:
-        for i in range(len(asm.arg_list)):
-            AddToUse(asm.arg_list[i], use_int, use_float)
-    
-    # a1 := b , a2 := b , an := bの形式の命令
-    elif asm.instr_name in {"vlw"}:
-        for i in range(1, len(asm.arg_list) - 1):
-            AddToDef(asm.arg_list[i], def_int, def_float)
-        AddToUse(asm.arg_list[0], use_int, use_float)
-    
-    # 全てuseする形式の命令
-    elif asm.instr_name in {"vsw"}:
-        for i in range(len(asm.arg_list) - 1):
-            AddToUse(asm.arg_list[i], use_int, use_float)
-
-    elif ":" in asm.instr_name: # labelは生存解析に含めない
-        pass
-    elif asm.instr_name in {"nop", "call"}: # 生存解析に含めない命令
-        pass
-    else:
-        error.error("Invalid instruction: {}.".format(asm.instr_name))
+    def_int, use_int, def_float, use_float = set(), set(), set(), set()
 
+    info = opcodes.INFO[asm.op]
+    if info.flags & opcodes.IS_UNRESOLVED: # virtualの途中でしか現れない命令
+        error.error("Invalid instruction: {}.".format(info.name))
+    def_pos, use_pos = info.defUse(len(asm.arg_list))
+    for i in def_pos:
+        AddToDef(ctx, asm.arg_list[i], def_int, def_float)
+    for i in use_pos:
+        AddToUse(ctx, asm.arg_list[i], use_int, use_float)
+
+    ret = (frozenset(def_int), frozenset(use_int), frozenset(def_float), frozenset(use_float))
+    asm.def_use_cache = (asm.op, list(asm.arg_list), ret)
+    return ret
+
+# 有効な命令それぞれのdef, useの集合を，命令のidx => 集合 の辞書def_int, use_int, def_float, use_floatにまとめて返す
+def getDefAndUse (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], instr_idx_list:List[int] = None) -> Tuple[Dict[int, FrozenSet[str]]]:
+    if instr_idx_list is None:
+        instr_idx_list = cfg.getInstrIdxList(lis)
+    def_int, use_int, def_float, use_float = {}, {}, {}, {}
+    for i in instr_idx_list:
+        def_int[i], use_int[i], def_float[i], use_float[i] = getDefAndUseFromVirtualAsm(ctx, lis[i])
     return def_int, use_int, def_float, use_float
 
-# ラベルの行やコメントアウトの行はskipしたうえで、now_idxの直後の命令のidxを返す
-def getImmediatelySuccInstrIdx (now_idx:int, asm_length:int, lis:List[virtual.Virtual_Asm]) -> List[int]:
-    j = now_idx + 1
-    while j < asm_length and ((":" in lis[j].instr_name) or ("#" in lis[j].instr_name)): # ラベルの行やコメントアウトの行はskip
-        j += 1
-    if j == asm_length: # lisの最後に達している
-        return []
-    else:
-        return [j]
-
-# List[virtual.Virtual_Asm]のそれぞれのVirtual_Asmに対して、後続命令を計算する
-# 返り値は
-#   命令のidx => 後続命令のidxの配列
-# という要素が入った辞書succ_instrs
-def getSuccInstrsFromVirtualAsms (lis:List[virtual.Virtual_Asm]) -> Dict[int, List[int]]:
-    asm_length = len(lis)
-
-    # ラベルがどこにあるかを先に計算しておく
-    label_pos = {}
-    for i in range(asm_length):
-        asm = lis[i]
-        if ":" in asm.instr_name:
-            label_pos[asm.instr_name] = i
-
-    # 後続の命令の計算
-    succ_instrs = {}
-    for i in range(asm_length):
-        asm = lis[i]
-        if ":" in asm.instr_name: # ラベルの行に関しては無視
-            continue
-        elif "#" in asm.instr_name: # コメントアウトの行に関しては無視
-            continue
-        if asm.instr_name in {"beq", "bge", "blt", "bfeq", "bfle", "bflt"}: # 2通りの後続命令がある命令
-            label_name = asm.arg_list[2].name
-            label_idx = label_pos[label_name + ":"]
-            succ_instrs[i] = getImmediatelySuccInstrIdx(i, asm_length, lis) + getImmediatelySuccInstrIdx(label_idx, asm_length, lis)
-        elif asm.instr_name in {"j"}: # ジャンプ命令
-            label_name = asm.arg_list[0].name
-            label_idx = label_pos[label_name + ":"]
-            succ_instrs[i] = getImmediatelySuccInstrIdx(label_idx, asm_length, lis)
-        else: # 次の命令に進むだけの命令
-            succ_instrs[i] = getImmediatelySuccInstrIdx(i, asm_length, lis)
-
-    return succ_instrs
-
-# ラベルやコメントアウトの行以外の有効な命令のidxのリストの取得
-def getInstrIdxList (lis:List[virtual.Virtual_Asm]) -> List[int]:
-    instr_idx_list = []
-    asm_length = len(lis)
-    for i in range(asm_length):
-        asm = lis[i]
-        if (":" not in asm.instr_name) and ("#" not in asm.instr_name):
-            instr_idx_list.append(i)
-    return instr_idx_list
+# 変数名 <=> 番号 の対応（変数の集合をビット集合で表すために使う）
+class VarIndex:
+    def __init__ (self):
+        self.idx: Dict[str, int] = {}
+        self.names: List[str] = []
+    # 変数の集合をビット集合に変換する（番号が振られていない変数には新しく番号を振る）
+    def toBits (self, names:Set[str]) -> int:
+        bits = 0
+        for name in names:
+            i = self.idx.get(name)
+            if i is None:
+                i = len(self.names)
+                self.idx[name] = i
+                self.names.append(name)
+            bits |= 1 << i
+        return bits
+    # ビット集合を変数の集合に変換する
+    def toSet (self, bits:int) -> Set[str]:
+        ret = set()
+        names = self.names
+        while bits:
+            low = bits & -bits
+            ret.add(names[low.bit_length() - 1])
+            bits ^= low
+        return ret
+
+# 命令のidx => 生存変数の集合 の辞書のように振る舞うもの
+# 中身はビット集合で持っておき，参照されたときに初めて変数名の集合に変換する
+class LiveSets (Mapping):
+    def __init__ (self, bits:Dict[int, int], var_index:VarIndex):
+        self.bits = bits
+        self.var_index = var_index
+        self.cache: Dict[int, Set[str]] = {}
+    def __getitem__ (self, i:int) -> Set[str]:
+        ret = self.cache.get(i)
+        if ret is None:
+            ret = self.var_index.toSet(self.bits[i])
+            self.cache[i] = ret
+        return ret
+    def __iter__ (self):
+        return iter(self.bits)
+    def __len__ (self) -> int:
+        return len(self.bits)
+
+# ブロック単位のワークリスト法でlive_in, live_outを計算する
+# gen, killはブロックごとのビット集合のリスト，返り値はブロックごとのlive_outのビット集合のリスト
+def solveLiveOut (blocks:List[cfg.BasicBlock], order:List[int], gen:List[int], kill:List[int]) -> List[int]:
+    n = len(blocks)
+    live_in = [0] * n
+    live_out = [0] * n
+    worklist = list(reversed(order)) # popで末尾から取り出すので，orderの先頭から処理されるように逆にしておく
+    in_worklist = [True] * n
+    while worklist:
+        b = worklist.pop()
+        in_worklist[b] = False
+        out = 0
+        for c in blocks[b].succs:
+            out |= live_in[c]
+        live_out[b] = out
+        new_in = gen[b] | (out & ~kill[b])
+        if new_in != live_in[b]:
+            live_in[b] = new_in
+            for p in blocks[b].preds:
+                if not in_worklist[p]:
+                    in_worklist[p] = True
+                    worklist.append(p)
+    return live_out
+
+# 命令ごとの def, use の集合から，命令のidx => その命令の直後に生きている変数の集合 を求める（ビット集合による計算）
+# orderはcfg.postOrder(blocks)
+def solveLiveSets (blocks:List[cfg.BasicBlock], order:List[int], instr_idx_list:List[int], defs:Dict[int, FrozenSet[str]], uses:Dict[int, FrozenSet[str]]) -> LiveSets:
+    var_index = VarIndex()
+    def_bits = {i : var_index.toBits(defs[i]) for i in instr_idx_list}
+    use_bits = {i : var_index.toBits(uses[i]) for i in instr_idx_list}
+    # ブロックごとのgen, killを計算
+    gen = []
+    kill = []
+    for block in blocks:
+        g = 0
+        k = 0
+        for i in reversed(block.instrs):
+            g = (g & ~def_bits[i]) | use_bits[i]
+            k |= def_bits[i]
+        gen.append(g)
+        kill.append(k)
+    live_out = solveLiveOut(blocks, order, gen, kill)
+    # ブロックのlive_outから命令を逆順にたどって，各命令の直後に生きている変数を求める
+    live_bits = {}
+    for b in range(len(blocks)):
+        cur = live_out[b]
+        for i in reversed(blocks[b].instrs):
+            live_bits[i] = cur
+            cur = (cur & ~def_bits[i]) | use_bits[i]
+    return LiveSets({i : live_bits[i] for i in instr_idx_list}, var_index)
 
 # 生存解析
-def AnalyzeLiveness (lis:List[virtual.Virtual_Asm]) -> Tuple[Dict[int, List[str]]]:
-    # ラベルやコメントアウトの行以外の有効な命令のidxのリスト
-    instr_idx_list = getInstrIdxList(lis)
-
-    length_instrs = len(instr_idx_list)
-    if length_instrs == 0: # 有効な命令がなければ空を返す
-        return {}, {}
+# 返り値のlive_int, live_floatは 命令のidx => その命令の直後に生きている変数の集合 の辞書として使える
+# graphにlisのCFGを渡すとそれを使う（省略したときは作る）
+def AnalyzeLiveness (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], graph:cfg.CFG=None) -> Tuple[Dict[int, List[str]]]:
+    # 有効な命令のidxのリストと基本ブロック
+    if graph is None:
+        graph = cfg.CFG(lis)
+    instr_idx_list = graph.instr_idx_list
+    blocks = graph.blocks
+
+    if len(instr_idx_list) == 0: # 有効な命令がなければ空を返す
+        return {}, {}, {}, {}, {}, {}
+
+    # 生存解析に必要なdef,useの集合を取得
+    def_int, use_int, def_float, use_float = getDefAndUse(ctx, lis, instr_idx_list)
+    order = cfg.postOrder(blocks)
+
+    # int, floatそれぞれについて，ブロック単位で解いてから命令ごとの生存変数を求める
+    ret = []
+    use_matrix = liveMatrix.useMatrix(ctx.options, len(instr_idx_list))
+    for defs, uses in ((def_int, use_int), (def_float, use_float)):
+        if use_matrix: # 命令数が多ければNumPyのビット行列で解く
+            matrix = liveMatrix.LiveMatrix(blocks, defs, uses)
+            matrix.setBlockLiveOut(solveLiveOut(blocks, order, *matrix.blockGenKill()))
+            ret.append(matrix)
+            continue
+        ret.append(solveLiveSets(blocks, order, instr_idx_list, defs, uses))
+    live_int, live_float = ret
 
-    # 生存解析に必要なdef,useの集合や後続命令の集合を取得
-    def_int, use_int, def_float, use_float = {}, {}, {}, {}
-    for i in instr_idx_list:
-        asm = lis[i]
-        def_int[i], use_int[i], def_float[i], use_float[i] = getDefAndUseFromVirtualAsm(asm)
-    succ_instrs = getSuccInstrsFromVirtualAsms(lis)
-
-    # 実際の生存変数の計算
-    live_int = {
-        i : set() for i in instr_idx_list # 初期化
-    }
-    live_float = {
-        i : set() for i in instr_idx_list # 初期化
-    }
-    idx = length_instrs - 1 # 逆順で計算するため、instr_idx_listの最後の要素のidxを最初にとって、ループ内でデクリメントしていく
-    no_change_int_count = 0 # live_intが変化しなかった連続の回数
-    no_change_float_count = 0 # live_floatが変化しなかった連続の回数
-
-    while not (no_change_int_count == length_instrs and no_change_float_count == length_instrs): # 更新式に従って更新しても、liveが変わらないのがlength_instrs回続いたら解析終了
-        # instr_idxはぐるぐるinstr_idx_listの中を回り続ける
-        instr_idx = instr_idx_list[idx]
-        # 計算式に従ってliveを更新
-        pre_live_int_of_instr_idx = live_int[instr_idx]
-        pre_live_float_of_instr_idx = live_float[instr_idx]
-        for succ_instr_idx in succ_instrs[instr_idx]:
-            live_int[instr_idx] |= (live_int[succ_instr_idx] - def_int[succ_instr_idx]) | use_int[succ_instr_idx]
-            live_float[instr_idx] |= (live_float[succ_instr_idx] - def_float[succ_instr_idx]) | use_float[succ_instr_idx]
-        # 更新によってliveが変わっていなければcountをインクリメント
-        if pre_live_int_of_instr_idx == live_int[instr_idx]:
-            no_change_int_count += 1
-        else:
-            no_change_int_count = 0
-        if pre_live_float_of_instr_idx == live_float[instr_idx]:
-            no_change_float_count += 1
-        else:
-            no_change_float_count = 0
-        # idxをデクリメント
-        idx -= 1
-        idx = idx % length_instrs
-    
     return live_int, live_float, def_int, use_int, def_float, use_float
@@ -7,15 +7,17 @@
 
 import virtual
 import liveness
+import context
+import opcodes
 from typing import List
 
 # asm1, asm2が依存している（= 入れ替えると意味がかわってしまう）かどうかを判定する
 # 依存するならTrueを返す
-def isDependent (asm1, asm2):
-    def_int, use_int, def_float, use_float = liveness.getDefAndUseFromVirtualAsm(asm1)
+def isDependent (ctx:context.CompilationContext, asm1, asm2):
+    def_int, use_int, def_float, use_float = liveness.getDefAndUseFromVirtualAsm(ctx, asm1)
     asm1_def_set = def_int.union(def_float)
     asm1_use_set = use_int.union(use_float)
-    def_int, use_int, def_float, use_float = liveness.getDefAndUseFromVirtualAsm(asm2)
+    def_int, use_int, def_float, use_float = liveness.getDefAndUseFromVirtualAsm(ctx, asm2)
     asm2_def_set = def_int.union(def_float)
     asm2_use_set = use_int.union(use_float)
 
@@ -41,7 +43,12 @@ def isDependent (asm1, asm2):
     
     return dependentFlag
 
-def lwStallOpt (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
+# 入れ替えの対象にしない特殊な命令（分岐・ジャンプ・関数呼び出し・return・nop・ストア・ラベル）かどうかを判定する
+SPECIFIC_FLAGS = opcodes.IS_BRANCH | opcodes.IS_JUMP | opcodes.IS_CALL | opcodes.IS_RETURN | opcodes.IS_STORE | opcodes.IS_NOT_INSTR
+def isSpecific (asm:virtual.Virtual_Asm) -> bool:
+    return asm.op == opcodes.NOP or (opcodes.INFO[asm.op].flags & SPECIFIC_FLAGS) != 0
+
+def lwStallOpt (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
     i = 0
     len_lis = len(lis)
     while i < len_lis - 1:
@@ -49,28 +56,22 @@ def lwStallOpt (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
         former = lis[i]
         latter = lis[i+1]
 
-        # former, latterがジャンプ等の特殊な命令でないことを確認
+        # former, latterがジャンプ等の特殊な命令やラベルでないことを確認
         # swもメモリの読み書きで依存が生じてしまうことがあるので除外
-        specific_instrs = {"beq", "bge", "blt", "bfeq", "bfle", "bflt", "j", "ret", "jalr", "ret_unit", "nop", "call", "sw", "fsw", "vsw"}
-        if (
-            (former.instr_name in specific_instrs) or
-            (latter.instr_name in specific_instrs) or
-            (":" in former.instr_name) or
-            (":" in latter.instr_name)
-        ):
+        if isSpecific(former) or isSpecific(latter):
             i += 1
             continue
 
         # lwでロードしたレジスタを直後の命令で使っていないか判定
         is_target = False
-        def_int, _, def_float, _ = liveness.getDefAndUseFromVirtualAsm(former)
+        def_int, _, def_float, _ = liveness.getDefAndUseFromVirtualAsm(ctx, former)
         former_def_set = def_int.union(def_float)
-        _, use_int, _, use_float = liveness.getDefAndUseFromVirtualAsm(latter)
+        _, use_int, _, use_float = liveness.getDefAndUseFromVirtualAsm(ctx, latter)
         latter_use_set = use_int.union(use_float)
 
         for def_reg in former_def_set:
             # formerがlwでありlatterでロードしたレジスタを使っている場合
-            if (former.instr_name in {"lw", "flw", "vlw"}) and (def_reg in latter_use_set):
+            if (former.op in {opcodes.LW, opcodes.FLW, opcodes.VLW}) and (def_reg in latter_use_set):
                 is_target = True
                 break
         
@@ -78,10 +79,7 @@ def lwStallOpt (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
         if is_target:
             # まず，formerがformerの一個前の命令と入れ替えることができないか確かめ，できる場合はする
             # formerの前の命令が特殊な命令なら諦める
-            if i - 1 >= 0 and not isDependent(lis[i-1], former) and not (
-                (lis[i-1].instr_name in specific_instrs) or
-                (":" in lis[i-1].instr_name)
-            ):
+            if i - 1 >= 0 and not isDependent(ctx, lis[i-1], former) and not isSpecific(lis[i-1]):
                 tmp = lis[i-1]
                 lis[i-1] = former
                 lis[i] = tmp
@@ -89,10 +87,7 @@ def lwStallOpt (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
             
             # 次に，latterがlatterの一個前の命令と入れ替えることができないか確かめ，できる場合はする
             # latterの後の命令が特殊な命令なら諦める
-            elif i + 1 < len(lis) and not isDependent(latter, lis[i+1]) and not (
-                (lis[i+1].instr_name in specific_instrs) or
-                (":" in lis[i+1].instr_name)
-            ):
+            elif i + 1 < len(lis) and not isDependent(ctx, latter, lis[i+1]) and not isSpecific(lis[i+1]):
                 tmp = lis[i+1]
                 lis[i+1] = latter
                 lis[i] = tmp
@@ -8,120 +8,301 @@
 import re
 import lib
 import reglist
+import error
 import closure
+import closureBin
+import context
+import progCache
 import constReg
 import virtual
+import opcodes
 import constFold
 import peephole
+import deadCode
 import liveness
+import cfg
 import regAlloc
+import linearScan
 import tail
 import inline
 import expand
+import stackSlot
 import emit
 import argparse
 import sys
+import os
+import struct
+from typing import List, Tuple
 
-def main ():
-    sys.setrecursionlimit(10 ** 9)
-    
-    # 実行時引数の設定
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-f", "--file", help="choose a file (in 'test' directory) to compile, the default file is 'test/test'")
-    args = parser.parse_args()
+# バイナリ形式(.bin)を優先して読み,無い場合や.txtより古い場合はテキスト形式(.txt)を読む
+# テキスト形式を読むときは,use_cacheならintermediate/cache/にあるパース済みのProgを使う(progCache.py参照)
+# 木を辿る処理はuse_explicit_stackで選ぶ
+def loadIntermediate (path:str, format:str, use_cache:bool=False, use_explicit_stack:bool=False) -> closure.Prog:
+    if format == "bin" or (format == "auto" and os.path.exists(path + '.bin') and (not os.path.exists(path + '.txt') or os.path.getmtime(path + '.bin') >= os.path.getmtime(path + '.txt'))):
+        return closureBin.loadProg(path + '.bin', use_explicit_stack)
 
-    # ファイル読み込み
-    if not args.file:
-        args.file = "test" # defaultはintermediate/testを読みに行く
-    f = open('intermediate/' + args.file + '.txt', 'r')
-    text = f.read()
+    f = open(path + '.txt', 'rb')
+    data = f.read()
     f.close()
+    if use_cache:
+        key = progCache.cacheKey(data)
+        prog = progCache.lookup(key, use_explicit_stack)
+        if prog is not None:
+            return prog
 
-    # パース
+    text = data.decode()
     first_hp = int(re.search(r'first_hp : (.*?)\n', text).group(1))
     fundef_list = re.search(r'fundef list:\n(.*?)\n', text).group(1)
     e = re.search(r'\nt:\n(.*)', text).group(1)
-    prog = closure.Prog(closure.str2Fundef_list(fundef_list), closure.str2Closure_t(e), first_hp)
+    prog = closure.Prog(closure.str2Fundef_list(fundef_list, use_explicit_stack), closure.str2Closure_t(e, use_explicit_stack), first_hp)
+    if use_cache:
+        progCache.store(key, prog)
+    return prog
 
-    # 定数レジスタ埋め込み
-    for fundef in prog.fundefs:
-        fundef.body = constReg.constReg(fundef.body, {})
-    prog.e = constReg.constReg(prog.e, {})
-
-    # 仮想アセンブリ化
-    fundefs_asm = virtual.Fundefs2VirtualAsm(prog.fundefs)
-    body_asm = [
+# mainの先頭に置く命令列
+def mainPreamble (ctx:context.CompilationContext, first_hp:int) -> List[virtual.Virtual_Asm]:
+    return [
         # mainタグ
-        virtual.Virtual_Asm("main:", 0, []),
+        virtual.makeLabel("main"),
         # global変数のヒープ領域分を確保
-        virtual.Virtual_Asm("addi", 3, [virtual.Reg("hp", "int"), virtual.Reg("hp", "int"), virtual.Reg(str(first_hp), "int")]),
-        # 定数レジスタの値の格納
-        virtual.Virtual_Asm("li", 2, [virtual.Reg("x27", "int"), virtual.Reg("0", "int")]), # 0.0
-        virtual.Virtual_Asm("fmv.w.x", 2, [virtual.Reg("f25", "float"), virtual.Reg("x27", "int")]),
-        virtual.Virtual_Asm("li", 2, [virtual.Reg("x27", "int"), virtual.Reg("1065353216", "int")]), # 1.0
-        virtual.Virtual_Asm("fmv.w.x", 2, [virtual.Reg("f26", "float"), virtual.Reg("x27", "int")]),
-        virtual.Virtual_Asm("li", 2, [virtual.Reg("x27", "int"), virtual.Reg("1073741824", "int")]), # 2.0
-        virtual.Virtual_Asm("fmv.w.x", 2, [virtual.Reg("f27", "float"), virtual.Reg("x27", "int")]),
-        virtual.Virtual_Asm("li", 2, [virtual.Reg("x0", "int"), virtual.Reg("0", "int")]),
-        virtual.Virtual_Asm("li", 2, [virtual.Reg("x25", "int"), virtual.Reg("1", "int")]),
-        virtual.Virtual_Asm("li", 2, [virtual.Reg("x26", "int"), virtual.Reg("2", "int")]),
-        virtual.Virtual_Asm("li", 2, [virtual.Reg("x27", "int"), virtual.Reg("3", "int")]),
-    ] + virtual.Closure_t2VirtualAsm(prog.e, prog.fundefs)
-
-    # 整数の定数畳み込み
-    for i in range(len(fundefs_asm)):
-        fundefs_asm[i] = constFold.constFold(fundefs_asm[i])
-    body_asm = constFold.constFold(body_asm)
+        virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("hp", "int"), virtual.Reg("hp", "int"), virtual.Reg(str(first_hp), "int")]),
+    ] + constRegsPreamble(ctx)
 
-    # peephole最適化
-    for i in range(len(fundefs_asm)):
-        fundefs_asm[i] = peephole.peepholeOpt(fundefs_asm[i])
-    body_asm = peephole.peepholeOpt(body_asm)
+# 定数レジスタの値の格納（ctx.int_const_regs, ctx.float_const_regsから作る）
+# 小数の定数はビット列を整数レジスタに入れてからfmv.w.xで移す。そのための一時レジスタには最後に値を入れる整数の定数レジスタを使う
+def constRegsPreamble (ctx:context.CompilationContext) -> List[virtual.Virtual_Asm]:
+    int_items = list(ctx.int_const_regs.items())
+    tmp_reg = int_items[-1][1] if int_items[-1][1] != "x0" else "const.tmp" # 整数の定数レジスタが無ければ仮想レジスタを使う
+    lis = []
+    for val, reg in ctx.float_const_regs.items():
+        bits = struct.unpack("<i", struct.pack("<f", val))[0]
+        lis.append(virtual.Virtual_Asm(opcodes.LI, 2, [virtual.Reg(tmp_reg, "int"), virtual.Reg(str(bits), "int")]))
+        lis.append(virtual.Virtual_Asm(opcodes.FMV_W_X, 2, [virtual.Reg(reg, "float"), virtual.Reg(tmp_reg, "int")]))
+    for val, reg in int_items:
+        lis.append(virtual.Virtual_Asm(opcodes.LI, 2, [virtual.Reg(reg, "int"), virtual.Reg(str(val), "int")]))
+    return lis
 
-    # レジスタ割り当て
-    for i in range(len(fundefs_asm)):
-        fundefs_asm[i] = regAlloc.regAlloc(fundefs_asm[i], reglist.INT_REGS_FOR_FUNC, reglist.FLOAT_REGS_FOR_FUNC)
-        fundefs_asm[i] = regAlloc.optimizeAllocOfArgs(fundefs_asm[i])
-    body_asm = regAlloc.regAlloc(body_asm, reglist.INT_REGS_FOR_MAIN, reglist.FLOAT_REGS_FOR_MAIN)
-    body_asm = regAlloc.optimizeAllocOfArgs(body_asm)
+# アセンブリファイルの先頭部分（libの外部関数を含む）
+def asmHeader () -> str:
+    asm_str = ".globl main\n\n.text\n\n"
+    for key in lib.instrs:
+        instr = lib.instrs[key]["body"]
+        asm_str += instr + "\n"
+    return asm_str
 
-    # 末尾呼び出し最適化をかける
-    for i in range(len(fundefs_asm)):
-        fundefs_asm[i] = tail.tailCallOpt(fundefs_asm[i])
-    body_asm = tail.tailCallOpt(body_asm)
+# 1関数分の仮想アセンブリに対して，定数畳み込みからインライン最適化までを行う
+# 返り値は処理後の命令列とそのCFG（生存解析・スタックスロットの割り当て・expandで使い回す）
+# CFGはレジスタ割り当ての後に1回だけ作る。末尾呼び出し最適化とインライン最適化は命令を1つずつ置き換えるだけで，
+# ラベル・分岐・ジャンプは変えないので，命令のidxを付け替えるだけで済む（cfg.CFG.updateInstrs）
+def optimizeAndAlloc (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], int_regs:List[str], float_regs:List[str]) -> Tuple[List[virtual.Virtual_Asm], cfg.CFG]:
+    lis = constFold.constFold(lis)
+    lis = peephole.peepholeOpt(lis)
+    lis = deadCode.deadCodeElim(ctx, lis)
+    if linearScan.useLinearScan(ctx, lis):
+        lis = linearScan.linearScan(ctx, lis, int_regs, float_regs)
+    else:
+        lis = regAlloc.regAlloc(ctx, lis, int_regs, float_regs)
+    lis = regAlloc.optimizeAllocOfArgs(lis)
+    graph = cfg.CFG(lis)
+    lis = tail.tailCallOpt(lis, graph.label_pos)
+    lis = inline.inlineOpt(ctx, lis)
+    graph.updateInstrs(lis, {j : j for j in range(len(lis))})
+    return lis, graph
 
-    # インライン最適化
-    for i in range(len(fundefs_asm)):
-        fundefs_asm[i] = inline.inlineOpt(fundefs_asm[i])
-    body_asm = inline.inlineOpt(body_asm)
+# 1関数分の仮想アセンブリを最後まで処理してアセンブリの文字列にする
+def compileFundef (ctx:context.CompilationContext, fundef:closure.Fundef, fundefs:List[closure.Fundef], setUsedRegs:bool) -> str:
+    lis, graph = optimizeAndAlloc(ctx, virtual.Fundef2VirtualAsm(ctx, fundef, fundefs), ctx.int_regs_for_func, ctx.float_regs_for_func)
+    live_int, live_float, _, _, _, _ = liveness.AnalyzeLiveness(ctx, lis, graph)
+    if setUsedRegs:
+        expand.set_used_regs_set_in_func(ctx, lis[0].arg_list[0].name, lis, live_int, live_float)
+    slots, frame = stackSlot.assignStackSlots(lis, graph)
+    lis = expand.expand(ctx, lis, slots, frame, True, live_int, live_float, graph.label_pos)
+    return emit.VirtualAsmList2Str(ctx, lis)
 
-    f.close()
+# mainの本体を最後まで処理してアセンブリの文字列にする
+def compileMain (ctx:context.CompilationContext, prog:closure.Prog) -> str:
+    body_asm = mainPreamble(ctx, prog.first_hp) + virtual.Closure_t2VirtualAsm(ctx, prog.e, prog.fundefs)
+    body_asm, graph = optimizeAndAlloc(ctx, body_asm, ctx.int_regs_for_main, ctx.float_regs_for_main)
+    live_int, live_float, _, _, _, _ = liveness.AnalyzeLiveness(ctx, body_asm, graph)
+    slots, frame = stackSlot.assignStackSlots(body_asm, graph)
+    body_asm = expand.expand(ctx, body_asm, slots, frame, False, live_int, live_float, graph.label_pos)
+    return emit.VirtualAsmList2Str(ctx, body_asm)
+
+# 関数ごとにパイプラインの最後まで処理し，できたアセンブリをすぐにファイルに書き出す
+# 関数をまたいで保持するのは，expandが使うused_regs_set_in_funcと，各関数の処理を始めるときのカウンターの値だけにする
+#   1周目: 木を辿るだけで仮想アセンブリ化はしない。各関数のカウンターの増分（virtual.counterIncrements）から処理を始めるときの値を求め，
+#          別の関数を呼ばない関数（expand.isLeafFundef, used_regs_set_in_funcの対象）を見つける
+#   2周目: 別の関数を呼ばない関数を処理して書き出す（呼び出し側より先に処理して，used_regs_set_in_funcに登録しておく）
+#   3周目: 残りの関数を元の順番に処理して書き出す
+# カウンターは関数ごとに1周目で求めた値に戻すので，関数の出力順が変わっても変数名・ラベル名はcompileWholeと同じになる
+# 1周目の見積もりが仮想アセンブリ化で実際に増えた値と違えば，変数名・ラベル名が重なりうるので，関数ごとに確かめてエラーにする
+# 定数レジスタは処理する直前の関数にだけ埋め込むので，progは書き換えない
+def compileStreaming (ctx:context.CompilationContext, prog:closure.Prog, out):
+    out.write(asmHeader())
+
+    # counters[i]: i番目の関数の処理を始めるときのカウンターの値（counters[len(prog.fundefs)]はmainの処理を始めるときの値）
+    counters = [ctx.getCounters()]
+    leaf_idx_list = []
+    for i, fundef in enumerate(prog.fundefs):
+        ctx.env.set(fundef.name[0], fundef.name[1])
+        embedded = embedConstRegsInFundef(ctx, fundef)
+        counters.append(tuple(c + d for c, d in zip(counters[i], virtual.counterIncrements(embedded))))
+        if expand.isLeafFundef(embedded):
+            leaf_idx_list.append(i)
+
+    leaf_idx_set = set(leaf_idx_list)
+    for i in leaf_idx_list + [i for i in range(len(prog.fundefs)) if i not in leaf_idx_set]:
+        fundef = prog.fundefs[i]
+        ctx.setCounters(counters[i])
+        out.write(compileFundef(ctx, embedConstRegsInFundef(ctx, fundef), prog.fundefs, i in leaf_idx_set))
+        if ctx.getCounters() != counters[i + 1]:
+            error.error("Counters after lowering {} are {}, but virtual.counterIncrements predicted {}.".format(fundef.name[0], ctx.getCounters(), counters[i + 1]))
+
+    ctx.setCounters(counters[len(prog.fundefs)])
+    out.write(compileMain(ctx, closure.Prog(prog.fundefs, embedConstRegsInBody(ctx, prog.e), prog.first_hp)))
+    out.write("\n\tebreak\n")
+
+# プログラム全体をまとめて処理してアセンブリの文字列にする
+def compileWhole (ctx:context.CompilationContext, prog:closure.Prog) -> str:
+    # 仮想アセンブリ化
+    fundefs_asm = virtual.Fundefs2VirtualAsm(ctx, prog.fundefs)
+    body_asm = mainPreamble(ctx, prog.first_hp) + virtual.Closure_t2VirtualAsm(ctx, prog.e, prog.fundefs)
 
-    # store/restore展開,関数呼び出しの展開
+    # 整数の定数畳み込み,peephole最適化,レジスタ割り当て,末尾呼び出し最適化,インライン最適化
+    graphs = [None] * len(fundefs_asm)
     for i in range(len(fundefs_asm)):
-        live_int, live_float, _, _, _, _ = liveness.AnalyzeLiveness(fundefs_asm[i])
-        expand.set_used_regs_set_in_func(fundefs_asm[i][0].instr_name.replace(":", ""), fundefs_asm[i], live_int, live_float)
+        fundefs_asm[i], graphs[i] = optimizeAndAlloc(ctx, fundefs_asm[i], ctx.int_regs_for_func, ctx.float_regs_for_func)
+    body_asm, graph = optimizeAndAlloc(ctx, body_asm, ctx.int_regs_for_main, ctx.float_regs_for_main)
+
+    # store/restore展開,関数呼び出しの展開（生存解析の結果はused_regs_set_in_funcの登録とexpandで使い回す）
+    lives = [None] * len(fundefs_asm)
+    for i in range(len(fundefs_asm)):
+        live_int, live_float, _, _, _, _ = liveness.AnalyzeLiveness(ctx, fundefs_asm[i], graphs[i])
+        expand.set_used_regs_set_in_func(ctx, fundefs_asm[i][0].arg_list[0].name, fundefs_asm[i], live_int, live_float)
+        lives[i] = (live_int, live_float)
     for i in range(len(fundefs_asm)):
-        live_int, live_float, _, _, _, _ = liveness.AnalyzeLiveness(fundefs_asm[i])
-        fundefs_asm[i], _ = expand.expand(fundefs_asm[i], [], True, live_int, live_float)
-    live_int, live_float, _, _, _, _ = liveness.AnalyzeLiveness(body_asm)
-    body_asm, _ = expand.expand(body_asm, [], False, live_int, live_float)
+        live_int, live_float = lives[i]
+        slots, frame = stackSlot.assignStackSlots(fundefs_asm[i], graphs[i])
+        fundefs_asm[i] = expand.expand(ctx, fundefs_asm[i], slots, frame, True, live_int, live_float, graphs[i].label_pos)
+    live_int, live_float, _, _, _, _ = liveness.AnalyzeLiveness(ctx, body_asm, graph)
+    slots, frame = stackSlot.assignStackSlots(body_asm, graph)
+    body_asm = expand.expand(ctx, body_asm, slots, frame, False, live_int, live_float, graph.label_pos)
 
     # 最終アセンブリ出力
-    asm_str = ".globl main\n\n.text\n\n"
-    # libの外部関数の読み出し
-    for key in lib.instrs:
-        instr = lib.instrs[key]["body"]
-        asm_str += instr + "\n"
+    asm_str = asmHeader()
     for fundef_asm in fundefs_asm:
-        asm_str += emit.VirtualAsmList2Str(fundef_asm)
-    asm_str += emit.VirtualAsmList2Str(body_asm)
+        asm_str += emit.VirtualAsmList2Str(ctx, fundef_asm)
+    asm_str += emit.VirtualAsmList2Str(ctx, body_asm)
     asm_str += "\n\tebreak\n"
+    return asm_str
 
-    # ファイル書き込み
-    f = open('asm/' + args.file + '.s', 'w')
-    f.write(asm_str)
-    f.close()
+# 定数レジスタを選んで（ctx.options.const_regs: "fixed" or "profile"）ctxに設定する
+def chooseConstRegs (ctx:context.CompilationContext, prog:closure.Prog):
+    options = ctx.options
+    if options.const_regs == "profile":
+        int_table, float_table = constReg.chooseConstRegs(prog, options.const_int_regs, options.const_float_regs)
+    else:
+        int_table, float_table = reglist.FIXED_INT_CONST_REGS, reglist.FIXED_FLOAT_CONST_REGS
+    ctx.setConstRegs(int_table, float_table)
+
+# ctxの定数レジスタを木に埋め込む（constRegは元の木を書き換えずに新しい木を作る）
+# 木を辿る処理はctx.options.use_explicit_stackに合わせる
+def embedConstRegsInBody (ctx:context.CompilationContext, closure_t:closure.Closure_t) -> closure.Closure_t:
+    if ctx.options.use_explicit_stack:
+        return constReg.constReg_iter(ctx, closure_t, {})
+    return constReg.constReg(ctx, closure_t, {})
+
+def embedConstRegsInFundef (ctx:context.CompilationContext, fundef:closure.Fundef) -> closure.Fundef:
+    return closure.Fundef(fundef.name, fundef.args, fundef.formal_fv, embedConstRegsInBody(ctx, fundef.body))
+
+# progの全体に定数レジスタを埋め込んだ新しいProgを返す
+def embedConstRegs (ctx:context.CompilationContext, prog:closure.Prog) -> closure.Prog:
+    fundefs = [embedConstRegsInFundef(ctx, fundef) for fundef in prog.fundefs]
+    return closure.Prog(fundefs, embedConstRegsInBody(ctx, prog.e), prog.first_hp)
+
+# ライブラリとして使うときの入口
+# progを最後までコンパイルしてアセンブリの文字列を返す（outを渡したときは関数ごとにoutに書き出してNoneを返す）
+# 設定はoptions（省略したときはcontext.Options()の既定値）で渡す
+# 定数レジスタの表を含め，コンパイル中の状態と設定はすべて呼び出しごとに作るCompilationContextに持つので，
+# 同じプロセスで何回続けて呼んでも，別々の設定で並行して呼んでもよい
+# progは書き換えないので，同じprogを何回コンパイルしてもよい
+# outを渡したときに同時に持つのは，progと処理中の1関数分の仮想アセンブリだけになる
+def compileProg (prog:closure.Prog, options:context.Options=None, out=None) -> str:
+    ctx = context.CompilationContext(options)
+    chooseConstRegs(ctx, prog)
+    if out is not None:
+        compileStreaming(ctx, prog, out)
+        return None
+    return compileWhole(ctx, embedConstRegs(ctx, prog))
+
+def main ():
+    # 実行時引数の設定（既定値はcontext.Optionsの既定値に合わせる）
+    defaults = context.Options()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--file", help="choose a file (in 'test' directory) to compile, the default file is 'test/test'")
+    parser.add_argument("--format", choices=["auto", "bin", "text"], default="auto", help="format of the intermediate file to read, 'auto' reads intermediate/<file>.bin if it is up to date and falls back to intermediate/<file>.txt")
+    parser.add_argument("--stream", action="store_true", help="compile one function at a time and write its assembly immediately, so that peak memory follows the largest function")
+    parser.add_argument("--walker", choices=["recursive", "iterative"], default="recursive", help="how to walk Closure_t in the parser, constReg and virtual; 'iterative' uses explicit stacks and does not depend on the recursion limit")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the cache of parsed programs in intermediate/cache (the cache is only used when the text format is read, .bin input is loaded directly)")
+    parser.add_argument("--clear-cache", action="store_true", help="remove every entry of the cache of parsed text-format programs before compiling")
+    parser.add_argument("--const-regs", choices=["fixed", "profile"], default="fixed", help="which constants get dedicated registers, 'fixed' uses 0-3 and 0.0/1.0/2.0, 'profile' picks the most used constants weighted by loop depth")
+    parser.add_argument("--const-int-regs", type=int, default=3, help="number of int constant registers for --const-regs profile (besides x0)")
+    parser.add_argument("--const-float-regs", type=int, default=3, help="number of float constant registers for --const-regs profile (0.0 always gets one if fisneg, fispos or fiszero is called)")
+    parser.add_argument("--spill-update", choices=["incremental", "full", "check"], default="incremental", help="how register allocation updates liveness and the interference graphs after inserting spill code, 'check' updates incrementally and compares with a full rebuild every time (for debugging)")
+    parser.add_argument("--allocator", choices=["coloring", "linear", "auto"], default="coloring", help="register allocator, 'coloring' is graph coloring, 'linear' is linear scan (faster, more spills), 'auto' uses linear scan only for functions longer than --linear-scan-threshold instructions")
+    parser.add_argument("--linear-scan-threshold", type=int, default=defaults.linear_scan_threshold, help="number of instructions above which --allocator auto uses linear scan")
+    parser.add_argument("--no-coalesce", action="store_true", help="do not coalesce the operands of mv/fmv in register allocation")
+    parser.add_argument("--liveness-backend", choices=["python", "numpy", "auto"], default=defaults.liveness_backend, help="how liveness and the interference graphs are computed, 'numpy' uses packed bit matrices (falls back to 'python' when NumPy is not installed), 'auto' uses them only for functions longer than --liveness-matrix-threshold instructions")
+    parser.add_argument("--liveness-matrix-threshold", type=int, default=defaults.liveness_matrix_threshold, help="number of instructions above which --liveness-backend auto uses bit matrices")
+    parser.add_argument("--no-split", action="store_true", help="spill a variable everywhere (store after every definition, restore before every use) instead of first splitting its live range at calls and basic block boundaries")
+    parser.add_argument("--no-dce", action="store_true", help="do not remove instructions whose results are never used before register allocation")
+    parser.add_argument("--move-stats", action="store_true", help="print the number of mv/fmv left in the output assembly to stderr")
+    args = parser.parse_args()
+
+    # 設定
+    options = context.Options(
+        const_regs=args.const_regs,
+        const_int_regs=args.const_int_regs,
+        const_float_regs=args.const_float_regs,
+        use_explicit_stack=(args.walker == "iterative"),
+        spill_update=args.spill_update,
+        coalesce=not args.no_coalesce,
+        split=not args.no_split,
+        dce=not args.no_dce,
+        allocator=args.allocator,
+        linear_scan_threshold=args.linear_scan_threshold,
+        liveness_backend=args.liveness_backend,
+        liveness_matrix_threshold=args.liveness_matrix_threshold,
+    )
+    if not options.use_explicit_stack:
+        sys.setrecursionlimit(10 ** 9)
+
+    # ファイル読み込み・パース
+    if not args.file:
+        args.file = "test" # defaultはintermediate/testを読みに行く
+    if args.clear_cache:
+        progCache.clear()
+    prog = loadIntermediate('intermediate/' + args.file, args.format, not args.no_cache, options.use_explicit_stack)
+
+    # 定数レジスタ埋め込みから最終アセンブリ出力まで
+    if args.stream:
+        f = open('asm/' + args.file + '.s', 'w')
+        compileProg(prog, options, f)
+        f.close()
+    else:
+        asm_str = compileProg(prog, options)
+
+        # ファイル書き込み
+        f = open('asm/' + args.file + '.s', 'w')
+        f.write(asm_str)
+        f.close()
+
+    # 残ったmv, fmvの数の出力
+    if args.move_stats:
+        f = open('asm/' + args.file + '.s', 'r')
+        mv_cnt, fmv_cnt = emit.countMoves(f.read())
+        f.close()
+        print("mv: {}, fmv: {}".format(mv_cnt, fmv_cnt), file=sys.stderr)
 
     return
 
@@ -0,0 +1,180 @@
+#--------------------------------------------------
+#
+# opcodes.py
+# 仮想アセンブリの命令の種類を表す整数（オペコード）と，オペコードごとの性質の表
+#
+# 実装の方針：
+# 命令の種類を文字列で持つと，各パスで命令を判別するたびに文字列のハッシュ計算や部分文字列の探索（":" in ...など）が必要になる。
+# そこで命令の種類は小さい整数opで表し，各パスはopの比較か，表INFO[op]に入っている引数の役割・フラグを引いて判別する。
+# 命令名の文字列はINFO[op].nameにだけ持ち，emitで文字列化するときにだけ使う。
+#
+# 引数の役割は，先頭の引数の役割head，末尾の引数の役割tail，その間の任意個の引数の役割restで表す。
+# 例えばvlwは [基準レジスタ(use), ロード先(def) × 4, オフセット(即値), マスク(即値)] なので head=(ROLE_USE,), rest=ROLE_DEF, tail=(ROLE_IMM, ROLE_IMM) となる。
+# ラベルの行はop=LABELで，ラベル名はarg_list[0]に型"label"のRegとして持つ。
+#
+#--------------------------------------------------
+
+from typing import Dict, List, Tuple
+
+# 引数の役割
+ROLE_NONE = 0   # 解析に含めない引数
+ROLE_DEF = 1    # 定義されるレジスタ
+ROLE_USE = 2    # 使用されるレジスタ
+ROLE_LABEL = 3  # ラベル名
+ROLE_IMM = 4    # 即値
+
+# 定義されるレジスタの種類
+CLS_INT = 1
+CLS_FLOAT = 2
+CLS_ANY = 3 # 引数のRegの型によって決まるもの
+
+# 命令の性質を表すフラグ
+IS_BRANCH = 1 << 0     # 条件分岐（最後の引数が分岐先のラベル）
+IS_JUMP = 1 << 1       # 無条件ジャンプ
+IS_CALL = 1 << 2       # 関数呼び出し
+IS_RETURN = 1 << 3     # 関数から返る
+IS_LOAD = 1 << 4       # メモリからの読み出し
+IS_STORE = 1 << 5      # メモリへの書き込み
+IS_MEMORY = IS_LOAD | IS_STORE
+IS_VIRTUAL = 1 << 6    # expandやemitで実際の命令に置き換えられる仮想的な命令
+IS_NOT_INSTR = 1 << 7  # ラベルやコメントの行（命令ではない）
+IS_UNRESOLVED = 1 << 8 # 代入先が決まっておらず，virtualの途中でしか現れない命令
+
+# オペコードごとの性質
+class OpInfo:
+    __slots__ = ("name", "head", "rest", "tail", "reg_class", "flags", "def_use_cache")
+    def __init__ (self, name:str, head:Tuple[int, ...], rest:int, tail:Tuple[int, ...], reg_class:int, flags:int):
+        self.name = name
+        self.head = head
+        self.rest = rest
+        self.tail = tail
+        self.reg_class = reg_class
+        self.flags = flags
+        self.def_use_cache = {}
+
+    # 引数がn個のときの各引数の役割
+    def roles (self, n:int) -> Tuple[int, ...]:
+        if n <= len(self.head): # ret, jalrのように引数の数が少ない形もある
+            return self.head[:n]
+        n_rest = max(0, n - len(self.head) - len(self.tail))
+        return (self.head + (self.rest,) * n_rest + self.tail)[:n]
+
+    # 引数がn個のときの，定義される引数の位置のタプルと使用される引数の位置のタプルを返す（引数の数ごとに一度だけ計算する）
+    def defUse (self, n:int) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        ret = self.def_use_cache.get(n)
+        if ret is None:
+            roles = self.roles(n)
+            ret = (
+                tuple(i for i in range(n) if roles[i] == ROLE_DEF),
+                tuple(i for i in range(n) if roles[i] == ROLE_USE),
+            )
+            self.def_use_cache[n] = ret
+        return ret
+
+# op => OpInfo の表
+INFO: List[OpInfo] = []
+
+# 命令名 => op の表（命令名からopを引く必要があるときのため）
+NAME2OP: Dict[str, int] = {}
+
+# オペコードを1つ定義してそのopを返す
+def define (name:str, head:Tuple[int, ...], rest:int = ROLE_NONE, tail:Tuple[int, ...] = (), reg_class:int = None, flags:int = 0) -> int:
+    op = len(INFO)
+    INFO.append(OpInfo(name, head, rest, tail, reg_class, flags))
+    NAME2OP[name] = op
+    return op
+
+# a := b の形式の命令
+LW = define("lw", (ROLE_DEF, ROLE_USE, ROLE_IMM), reg_class=CLS_INT, flags=IS_LOAD)
+FLW = define("flw", (ROLE_DEF, ROLE_USE, ROLE_IMM), reg_class=CLS_FLOAT, flags=IS_LOAD)
+MV = define("mv", (ROLE_DEF, ROLE_USE), reg_class=CLS_INT)
+FMV = define("fmv", (ROLE_DEF, ROLE_USE), reg_class=CLS_FLOAT)
+FMV_W_X = define("fmv.w.x", (ROLE_DEF, ROLE_USE), reg_class=CLS_FLOAT)
+FNEG = define("fneg", (ROLE_DEF, ROLE_USE), reg_class=CLS_FLOAT)
+FABS = define("fabs", (ROLE_DEF, ROLE_USE), reg_class=CLS_FLOAT)
+FSQRT = define("fsqrt", (ROLE_DEF, ROLE_USE), reg_class=CLS_FLOAT)
+ADDI = define("addi", (ROLE_DEF, ROLE_USE, ROLE_IMM), reg_class=CLS_INT)
+SLLI = define("slli", (ROLE_DEF, ROLE_USE, ROLE_IMM), reg_class=CLS_INT)
+SRLI = define("srli", (ROLE_DEF, ROLE_USE, ROLE_IMM), reg_class=CLS_INT)
+NEG = define("neg", (ROLE_DEF, ROLE_USE), reg_class=CLS_INT, flags=IS_VIRTUAL) # emitでsubに置き換える
+FCVT_S_W = define("fcvt.s.w", (ROLE_DEF, ROLE_USE), reg_class=CLS_FLOAT)
+FCVT_W_S = define("fcvt.w.s", (ROLE_DEF, ROLE_USE), reg_class=CLS_INT)
+
+# a := b + c の形式の命令
+ADD = define("add", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_INT)
+SUB = define("sub", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_INT)
+FADD = define("fadd", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_FLOAT)
+FSUB = define("fsub", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_FLOAT)
+FMUL = define("fmul", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_FLOAT)
+FDIV = define("fdiv", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_FLOAT)
+FEQ = define("feq", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_INT)
+FLE = define("fle", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_INT)
+FLT = define("flt", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_INT)
+SLL = define("sll", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_INT)
+SRL = define("srl", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_INT)
+FSGNJ = define("fsgnj", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_FLOAT)
+FSGNJX = define("fsgnjx", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_FLOAT)
+FSGNJN = define("fsgnjn", (ROLE_DEF, ROLE_USE, ROLE_USE), reg_class=CLS_FLOAT)
+
+# b + c の形式の命令
+SW = define("sw", (ROLE_USE, ROLE_USE, ROLE_IMM), flags=IS_STORE)
+FSW = define("fsw", (ROLE_USE, ROLE_USE, ROLE_IMM), flags=IS_STORE)
+BEQ = define("beq", (ROLE_USE, ROLE_USE, ROLE_LABEL), flags=IS_BRANCH)
+BGE = define("bge", (ROLE_USE, ROLE_USE, ROLE_LABEL), flags=IS_BRANCH)
+BLT = define("blt", (ROLE_USE, ROLE_USE, ROLE_LABEL), flags=IS_BRANCH)
+BFEQ = define("bfeq", (ROLE_USE, ROLE_USE, ROLE_LABEL), flags=IS_BRANCH)
+BFLE = define("bfle", (ROLE_USE, ROLE_USE, ROLE_LABEL), flags=IS_BRANCH)
+BFLT = define("bflt", (ROLE_USE, ROLE_USE, ROLE_LABEL), flags=IS_BRANCH)
+
+# a := 何らかの値 の形式の命令
+LI = define("li", (ROLE_DEF, ROLE_IMM), reg_class=CLS_INT)
+FLI = define("fli", (ROLE_DEF, ROLE_IMM), reg_class=CLS_FLOAT)
+LA = define("la", (ROLE_DEF, ROLE_LABEL), reg_class=CLS_INT)
+RESTORE = define("restore", (ROLE_DEF, ROLE_LABEL), reg_class=CLS_ANY, flags=IS_LOAD | IS_VIRTUAL)
+ARGS = define("* args", (ROLE_DEF,), reg_class=CLS_ANY, flags=IS_VIRTUAL)
+FORMAL_FV = define("* formal_fv", (ROLE_DEF,), reg_class=CLS_ANY, flags=IS_VIRTUAL)
+LWI = define("lwi", (ROLE_DEF, ROLE_IMM), reg_class=CLS_INT, flags=IS_LOAD | IS_VIRTUAL) # emitでx0を基準にしたlwに置き換える
+FLWI = define("flwi", (ROLE_DEF, ROLE_IMM), reg_class=CLS_FLOAT, flags=IS_LOAD | IS_VIRTUAL)
+
+# a の形式の命令
+J = define("j", (ROLE_LABEL,), flags=IS_JUMP)
+RET = define("ret", (ROLE_USE,), flags=IS_RETURN)
+STORE = define("store", (ROLE_USE, ROLE_LABEL), flags=IS_STORE | IS_VIRTUAL)
+JALR = define("jalr", (ROLE_USE,), flags=IS_CALL) # 引数3つの形（jalr x0, x4, 0）でも解析に含めるのは先頭だけ
+NOT_USED_ARGS = define("* not used args", (ROLE_USE,), flags=IS_VIRTUAL)
+SWI = define("swi", (ROLE_USE, ROLE_IMM), flags=IS_STORE | IS_VIRTUAL)
+FSWI = define("fswi", (ROLE_USE, ROLE_IMM), flags=IS_STORE | IS_VIRTUAL)
+RET_UNIT = define("ret_unit", (), flags=IS_RETURN | IS_VIRTUAL)
+
+# a := b1, b2, ... , bn の形式の命令（b1は呼び出す関数のラベルかクロージャ）
+RECV_RET_VAL_CLS_INT = define("recv_ret_val_cls_int", (ROLE_DEF,), ROLE_USE, reg_class=CLS_INT, flags=IS_CALL | IS_VIRTUAL)
+RECV_RET_VAL_CLS_FLOAT = define("recv_ret_val_cls_float", (ROLE_DEF,), ROLE_USE, reg_class=CLS_FLOAT, flags=IS_CALL | IS_VIRTUAL)
+RECV_RET_VAL_DIR_INT = define("recv_ret_val_dir_int", (ROLE_DEF,), ROLE_USE, reg_class=CLS_INT, flags=IS_CALL | IS_VIRTUAL)
+RECV_RET_VAL_DIR_FLOAT = define("recv_ret_val_dir_float", (ROLE_DEF,), ROLE_USE, reg_class=CLS_FLOAT, flags=IS_CALL | IS_VIRTUAL)
+
+# b1, b2, ... , bn の形式の命令
+JUST_CALL_CLS = define("just_call_cls", (), ROLE_USE, flags=IS_CALL | IS_VIRTUAL)
+JUST_CALL_DIR = define("just_call_dir", (), ROLE_USE, flags=IS_CALL | IS_VIRTUAL)
+JUST_CALL_CLS_AND_JUMP = define("just_call_cls_and_jump", (), ROLE_USE, flags=IS_CALL | IS_RETURN | IS_VIRTUAL)
+JUST_CALL_DIR_AND_JUMP = define("just_call_dir_and_jump", (), ROLE_USE, flags=IS_CALL | IS_RETURN | IS_VIRTUAL)
+
+# ベクトル命令（[基準レジスタ, レジスタ × VECTOR_LENGTH, オフセット, マスク]）
+VLW = define("vlw", (ROLE_USE,), ROLE_DEF, (ROLE_IMM, ROLE_IMM), reg_class=CLS_ANY, flags=IS_LOAD)
+VSW = define("vsw", (ROLE_USE,), ROLE_USE, (ROLE_IMM, ROLE_IMM), flags=IS_STORE)
+
+# 解析に含めない命令
+CALL = define("call", (ROLE_LABEL,), flags=IS_CALL)
+NOP = define("nop", ())
+
+# virtualの途中でだけ現れる命令（返り値の受け取り方が決まった時点で別の命令に置き換わる）
+LW_OR_FLW = define("lw_or_flw", (ROLE_DEF, ROLE_USE, ROLE_IMM), reg_class=CLS_ANY, flags=IS_LOAD | IS_VIRTUAL | IS_UNRESOLVED)
+APP_CLS = define("app_cls", (ROLE_DEF,), ROLE_USE, reg_class=CLS_ANY, flags=IS_CALL | IS_VIRTUAL | IS_UNRESOLVED)
+APP_DIR = define("app_dir", (ROLE_DEF,), ROLE_USE, reg_class=CLS_ANY, flags=IS_CALL | IS_VIRTUAL | IS_UNRESOLVED)
+
+# ラベルの行とコメントの行（arg_list[0]にラベル名・コメントの文字列を持つ）
+LABEL = define("label", (ROLE_LABEL,), flags=IS_NOT_INSTR)
+COMMENT = define("comment", (ROLE_NONE,), flags=IS_NOT_INSTR)
+
+# 即値をアドレスとする形（constFoldで作る）と，基準レジスタを使う形の対応
+TO_IMM_FORM = {LW: LWI, FLW: FLWI, SW: SWI, FSW: FSWI}
+FROM_IMM_FORM = {LWI: LW, FLWI: FLW, SWI: SW, FSWI: FSW}
@@ -7,15 +7,16 @@
 
 from typing import List
 import virtual
+import opcodes
 
 def peepholeOpt (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
     for j in range(len(lis)):
         virtual_asm = lis[j]
-        if virtual_asm.instr_name == "mv" or virtual_asm.instr_name == "fmv":
+        if virtual_asm.op == opcodes.MV or virtual_asm.op == opcodes.FMV:
             if virtual_asm.arg_list[0].name == virtual_asm.arg_list[1].name: # 同一レジスタへの不要なmoveを削除
-                lis[j] = virtual.Virtual_Asm("nop", 0, [])
-            elif j + 1 < len(lis) and (lis[j+1].instr_name == "mv" or lis[j+1].instr_name == "fmv") and (lis[j].arg_list[0].name == lis[j+1].arg_list[1].name and lis[j].arg_list[1].name == lis[j+1].arg_list[0].name): # 2つのレジスタを不要にmoveし合うのを片方削除
-                lis[j+1] = virtual.Virtual_Asm("nop", 0, [])
+                lis[j] = virtual.Virtual_Asm(opcodes.NOP, 0, [])
+            elif j + 1 < len(lis) and (lis[j+1].op == opcodes.MV or lis[j+1].op == opcodes.FMV) and (lis[j].arg_list[0].name == lis[j+1].arg_list[1].name and lis[j].arg_list[1].name == lis[j+1].arg_list[0].name): # 2つのレジスタを不要にmoveし合うのを片方削除
+                lis[j+1] = virtual.Virtual_Asm(opcodes.NOP, 0, [])
 
         # addi a1, a3, 16
         # fsw fa0, 0(a1)
@@ -23,12 +24,12 @@ def peepholeOpt (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
         # addi a1, a3, 16
         # fsw fa0, 16(a3)
         # のように置き換えることで最適化（addiが消えることも望める）
-        elif virtual_asm.instr_name == "addi" and virtual_asm.arg_list[0].name != "sp" and virtual_asm.arg_list[1].name != "sp":
-            if j+1 < len(lis) and (lis[j+1].instr_name == "sw" or lis[j+1].instr_name == "fsw"):
+        elif virtual_asm.op == opcodes.ADDI and virtual_asm.arg_list[0].name != "sp" and virtual_asm.arg_list[1].name != "sp":
+            if j+1 < len(lis) and (lis[j+1].op == opcodes.SW or lis[j+1].op == opcodes.FSW):
                 if lis[j+1].arg_list[0].name == virtual_asm.arg_list[0].name:
                     lis[j+1].arg_list[0] = virtual_asm.arg_list[1]
                     lis[j+1].arg_list[2] = virtual.Reg(str(int(lis[j+1].arg_list[2].name)+int(virtual_asm.arg_list[2].name)), "int")
-            elif j+1 < len(lis) and (lis[j+1].instr_name == "lw" or lis[j+1].instr_name == "flw"):
+            elif j+1 < len(lis) and (lis[j+1].op == opcodes.LW or lis[j+1].op == opcodes.FLW):
                 if lis[j+1].arg_list[1].name == virtual_asm.arg_list[0].name:
                     lis[j+1].arg_list[1] = virtual_asm.arg_list[1]
                     lis[j+1].arg_list[2] = virtual.Reg(str(int(lis[j+1].arg_list[2].name)+int(virtual_asm.arg_list[2].name)), "int")
@@ -39,7 +40,7 @@ def peepholeOpt (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
     new_lis = []
     for j in range(len(lis)):
         asm = lis[j]
-        if asm.instr_name == "addi" and asm.arg_list[0].name == asm.arg_list[1].name and asm.arg_list[2].name == str(0):
+        if asm.op == opcodes.ADDI and asm.arg_list[0].name == asm.arg_list[1].name and asm.arg_list[2].name == str(0):
             continue
         else:
             new_lis.append(asm)
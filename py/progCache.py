@@ -0,0 +1,105 @@
+#--------------------------------------------------
+#
+# progCache.py
+# パース済みのProgをintermediate/cache/にキャッシュする
+#
+# フロントエンドの出力(intermediate/<file>.txt)が前回と同じなら,パースをせずにキャッシュから読む
+# テキスト形式を読むときにだけ使う（バイナリ形式(.bin)はそのままmmapで読めるので,キャッシュしても速くならない）
+# キャッシュのキーは「中間ファイルの中身のハッシュ」と「バックエンドのバージョン」の組で,
+# 中身はclosureBinのバイナリ形式で保存するので,mmapでそのまま読み込める
+# 使われた順(ファイルの更新時刻)を記録しておき,合計サイズか個数が上限を超えたら古いものから削除する
+# 複数のコンパイルが同時に走る(make -jなど)と,読もうとしたファイルが他のプロセスに削除されていることがあるので,
+# ファイルが無いことはエラーにせず,キャッシュに無かったものとして扱う
+# 空・途中で切れている・壊れているなど読めないファイルも,削除してキャッシュに無かったものとして扱う（テキストをパースし直す）
+#
+#--------------------------------------------------
+
+import hashlib
+import os
+import struct
+import closure
+import closureBin
+
+CACHE_DIR = "intermediate/cache"
+CACHE_SUFFIX = ".pycb"
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+MAX_CACHE_ENTRIES = 32
+
+# バックエンドのバージョン
+# パーサ(closure.py)かバイナリ形式(closureBin.py)が変わると,同じ中間ファイルでも結果が変わりうるので,
+# これらのソースの中身から作ったハッシュをバージョンとして使う
+def backendVersion () -> str:
+    h = hashlib.sha256()
+    h.update(str(closureBin.VERSION).encode())
+    for module in [closure, closureBin]:
+        f = open(module.__file__, 'rb')
+        h.update(f.read())
+        f.close()
+    return h.hexdigest()
+
+# 中間ファイルの中身とバックエンドのバージョンからキャッシュのキーを作る
+def cacheKey (text:bytes) -> str:
+    h = hashlib.sha256()
+    h.update(backendVersion().encode())
+    h.update(text)
+    return h.hexdigest()
+
+def cachePath (key:str) -> str:
+    return os.path.join(CACHE_DIR, key + CACHE_SUFFIX)
+
+# キャッシュにあればProgを返し,なければNoneを返す（use_explicit_stackはclosureBin.readProgに渡す）
+def lookup (key:str, use_explicit_stack:bool = False):
+    path = cachePath(key)
+    try:
+        os.utime(path) # 使われた時刻を更新する(LRU用)
+        return closureBin.readProg(path, use_explicit_stack)
+    except FileNotFoundError:
+        return None
+    except (closureBin.FormatError, ValueError, IndexError, struct.error, OSError): # 読めないファイルは削除する
+        removeIfExists(path)
+        return None
+
+# pathのファイルを削除する（他のプロセスがすでに削除していてもよい）
+def removeIfExists (path:str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Progをキャッシュに保存し,上限を超えた分を削除する
+def store (key:str, prog:closure.Prog):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cachePath(key)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    closureBin.dumpProg(prog, tmp_path)
+    try:
+        os.replace(tmp_path, path) # 書き込み途中のファイルが読まれないようにする
+    except FileNotFoundError: # 書き込み途中のファイルを他のプロセスのclearが削除した場合は,保存しない
+        return
+    evict()
+
+# 使われた時刻が古いものから,合計サイズと個数が上限に収まるまで削除する
+def evict ():
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(CACHE_SUFFIX):
+            try:
+                stat = os.stat(os.path.join(CACHE_DIR, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+    entries.sort(reverse=True)
+    total = 0
+    for i, (_, size, name) in enumerate(entries):
+        total += size
+        if i > 0 and (total > MAX_CACHE_BYTES or i >= MAX_CACHE_ENTRIES):
+            removeIfExists(os.path.join(CACHE_DIR, name))
+            total -= size
+
+# キャッシュをすべて削除する
+def clear ():
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(CACHE_SUFFIX) or name.endswith(".tmp"):
+            removeIfExists(os.path.join(CACHE_DIR, name))
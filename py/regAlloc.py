@@ -6,93 +6,521 @@
 # 実装の方針：
 # 以下の状態遷移図に従ってレジスタ割り当てを行う
 #
-#  build →→→ simplify →→→ spill →→→ select
-#    ↑           ↑          ↓         ↓
-#    ↑           ←←←←←←←←←←←←         ↓
-#    ←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←
+#  build →→→ simplify →→→ coalesce →→→ freeze →→→ spill →→→ select
+#    ↑           ↑            ↓           ↓          ↓         ↓
+#    ↑           ←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←         ↓
+#    ←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←
 #
-# build: livenessの情報から、「変数x,yが同じ命令内で生きている」 iff 「x,yの間に枝がある」となるような、変数全体を頂点に持つグラフを形成する
-# simplify: limit（引数として与えられるレジスタの最大数）未満の隣接頂点を持つ頂点をスタックに移動していく
+# build: livenessの情報から、各命令で定義される変数とその直後に生きている変数の間に枝を張って、変数全体を頂点に持つグラフを形成する（mv/fmvの両辺の間には枝を張らない）
+# simplify: limit（引数として与えられるレジスタの最大数）未満の隣接頂点を持つ頂点をスタックに移動していく（mv/fmvに関わる頂点は合体のために残しておく）
+# coalesce: simplifyできる頂点がなくなったら，mv/fmvの両辺の変数を1つの頂点に合体する（George/Appelのiterated register coalescing）
+#           彩色できなくならないことが保証できる場合（Briggs/Georgeの条件）だけ合体し，合体した変数には同じレジスタを割り当てるのでmvが不要になる
+# freeze: simplifyも合体もできなければ，moveに関わる頂点のうち隣接頂点の少ないものの合体をあきらめてsimplifyの対象にする
 # spill: simplifyでスタックに移動できなかった変数の中から候補を選択する
+#        候補は spillのコスト / 現在の隣接頂点の数 が最小の変数とする（Chaitin/Briggs）
+#        コストは定義・使用の回数をcfgの実行頻度の見積もりで重み付けした和で，li/fli/la（と定数レジスタからのaddi）だけで定義される変数は作り直しやすいので安く見積もる
 # select: スタックから頂点をとりながら、順にレジスタを割り当てていく。色付け不能なものがあれば、spillで候補として用意していた変数をメモリに割り当てする命令を挿入し、buildからやり直し
 #
+# 初めてspillする変数は，定義の直後にstore・使用の直前ごとにrestoreする（spill everywhere）代わりに，生存区間を基本ブロックと関数呼び出しの境目で分割する（splitRange）
+#   定義した区間の中ではレジスタに置いたまま使い，他の区間では最初の使用の前に1回だけrestoreする。分割してできた変数をさらにspillするときは使用の直前ごとにrestoreする（spillPiece）
+# spillする変数がどこで定義しても同じ値を定義するli/fli/la/addi（定数レジスタから）だけで定義されるなら，storeもrestoreもせずに，その命令を使用の前に作り直す（rematerialization）
+# spill後のbuildは，生存解析とグラフを全体から作り直さず，挿入したstore/restoreの周辺だけを更新する（updateAfterSpill）
+# store/restoreはspillした変数（分割してできた変数）以外を定義も使用もしないので，他の変数の生存区間は元の命令の位置では変わらない
+# 変わるのは，spillした変数の生存区間（定義の直後のstoreまでと，restoreから使用まで）と，挿入した命令の位置の生存変数だけである
+#
 #--------------------------------------------------
 
 import virtual
+import opcodes
 import liveness
-from typing import List, Dict, Set, Tuple, Union
-import itertools
-import copy
-import reglist
+import liveMatrix
+import cfg
+import deadCode
+from typing import List, Dict, Set, FrozenSet, Tuple, Union
+import heapq
+import context
 import error
 
+# spillのたびの生存解析の結果とグラフの作り直し方（ctx.options.spill_update），mv/fmvの合体（ctx.options.coalesce），
+# 生存区間の分割（ctx.options.split）の設定はcontext.Optionsを参照
+
+# 生存変数の集合に現れる変数を，初めて生きている命令の順（同じ命令なら名前の順）に並べる
+# グラフの頂点はこの順にする（simplify, spillで辿る順になる）
+def nodeOrder (live:Dict[int, Set[str]], instr_idx_list) -> List[str]:
+    order = []
+    seen = set()
+    for i in instr_idx_list:
+        new = live[i] - seen
+        if new:
+            new = sorted(new)
+            order += new
+            seen.update(new)
+    return order
+
+# 命令のidx => mv（floatならfmv）の移動元の変数 の辞書を作る
+def moveSources (lis:List[virtual.Virtual_Asm], instr_idx_list, op:int) -> Dict[int, str]:
+    move_src = {}
+    for i in instr_idx_list:
+        if lis[i].op == op:
+            move_src[i] = lis[i].arg_list[1].name
+    return move_src
+
+# 各命令で定義される変数と，その命令の直後に生きている変数の間に枝を張る
+# 同時に生きている2つの変数は，どちらかが定義される位置でもう一方が生きているので，これで全ての干渉が分かる
+# mv/fmvの移動先と移動元の間には枝を張らない（同じ値なので同じレジスタでよく，合体の対象になる）
+# グラフの頂点にない変数（どこでも生きていない，使用されない定義）の枝は張らない
+def addDefEdges (graph:Dict[str, Set], live:Dict[int, Set[str]], defs:Dict[int, FrozenSet[str]], move_src:Dict[int, str]):
+    for i in live:
+        for name in defs[i]:
+            adj = graph.get(name)
+            if adj is None:
+                continue
+            src = move_src.get(i)
+            for other in live[i]:
+                if other != name and other != src:
+                    adj.add(other)
+                    graph[other].add(name)
+
 # liveness情報からグラフを作成する
 # グラフは 変数の名前 : {edgeを共有する変数の名前}
 # という要素を持つ辞書
-def build (lis:List[virtual.Virtual_Asm]) -> Tuple[Dict[str, Set]]:
+# 生存変数の集合live_int, live_floatは，spill後にupdateAfterSpillで更新できるように 命令のidx => 集合 の辞書にして返す
+# flowにlisのCFGを渡すとそれを使う（省略したときは作る）
+def build (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], flow:cfg.CFG=None) -> Tuple[Dict]:
     graph_int, graph_float = {}, {}
 
     # 生存解析
-    live_int, live_float, def_int, use_int, def_float, use_float = liveness.AnalyzeLiveness(lis)
-
-    # グラフ生成
-    for live_set in live_int.values(): # intのグラフ生成
-        for name in live_set:
-            if name not in graph_int:
-                graph_int[name] = set()
-        if len(live_set) >= 2:
-            for edge in itertools.combinations(live_set, 2):
-                graph_int[edge[0]].add(edge[1])
-                graph_int[edge[1]].add(edge[0])
-    for live_set in live_float.values(): # floatのグラフ生成
-        for name in live_set:
-            if name not in graph_float:
-                graph_float[name] = set()
-        if len(live_set) >= 2:
-            for edge in itertools.combinations(live_set, 2):
-                graph_float[edge[0]].add(edge[1])
-                graph_float[edge[1]].add(edge[0])
-
-    return graph_int, graph_float, def_int, use_int, def_float, use_float
+    live_int, live_float, def_int, use_int, def_float, use_float = liveness.AnalyzeLiveness(ctx, lis, flow)
 
-# limit未満の隣接ノードを持つノードを削除してスタックに移動する
-def simplify (graph:Dict[str, Set], limit:int, stk:List[str]) -> Tuple[Dict[str, Set], List[str]]:
-    while True: # 変化がでなくなるまでループする
-        names = list(graph.keys())
-        change_flag = False # 変化があったかを判定するフラグ
+    # グラフ生成（生存解析がビット行列で行われていれば，グラフもビット行列から作る）
+    ret = []
+    for live, defs, op in ((live_int, def_int, opcodes.MV), (live_float, def_float, opcodes.FMV)):
+        if isinstance(live, liveMatrix.LiveMatrix):
+            graph = live.interference(defs, moveSources(lis, live, op))
+            live = live.toDict()
+        else:
+            live = dict(live.items())
+            graph = {name : set() for name in nodeOrder(live, live)}
+            addDefEdges(graph, live, defs, moveSources(lis, live, op))
+        ret += [graph, live]
+    graph_int, live_int, graph_float, live_float = ret
+
+    return graph_int, graph_float, live_int, live_float, def_int, use_int, def_float, use_float
+
+# 1種類（intかfloat）について，spill後の生存変数の集合とグラフを返す（graphは書き換えて使い回す）
+# old_live: spill前の 命令のidx => 生存変数の集合，old_idx: spill後の命令のidx => spill前の命令のidx（挿入した命令は含まない）
+# inserted: 挿入した命令のidxのリスト，node: この種類でspillした変数（なければNone），move_src: spill後の命令のidx => mv/fmvの移動元
+# names: 生存区間と枝を求め直す変数（nodeをそのままspillしたなら[node]，分割したなら分割後の変数のリスト）
+def updateLiveAndGraph (
+    old_live:Dict[int, Set[str]],
+    graph:Dict[str, Set],
+    node:str,
+    names:List[str],
+    instr_idx_list:List[int],
+    old_idx:Dict[int, int],
+    inserted:List[int],
+    defs:Dict[int, FrozenSet[str]],
+    uses:Dict[int, FrozenSet[str]],
+    succ_instrs:Dict[int, List[int]],
+    preds:Dict[int, List[int]],
+    move_src:Dict[int, str],
+    ) -> Tuple[Dict[int, Set[str]], Dict[str, Set]]:
+    # 元の命令の位置では，node以外の生存変数は変わらない
+    live = {}
+    for j in old_idx:
+        live_set = old_live[old_idx[j]]
+        if node in live_set:
+            live_set = live_set - {node}
+        live[j] = live_set
+    # 挿入した命令の直後に生きている変数は，次の命令の直前に生きている変数（後ろから順に求める）
+    for j in reversed(inserted):
+        live_set = set()
+        for k in succ_instrs[j]:
+            live_set |= (live[k] - defs[k]) | uses[k]
+        live_set.discard(node)
+        live_set.difference_update(names)
+        live[j] = live_set
+
+    if node is not None:
+        # namesのそれぞれについて，使用する命令から，定義する命令に当たるまで先行命令を遡り，生きている位置を求める
+        live_idx = {}
         for name in names:
-            if len(graph[name]) < limit:
-                stk.append(name)
-                graph.pop(name) # グラフからノードを削除
-                for key in graph: # 削除したノードを一端にもつ枝を削除
-                    if name in graph[key]:
-                        graph[key].remove(name)
-                change_flag = True
-        if change_flag:
-            continue
-        else: # グラフ内のどの変数をみても隣接ノード数がlimit以上になったのでループから抜ける
+            live_idx[name] = []
+            worklist = [j for j in instr_idx_list if name in uses[j]]
+            while worklist:
+                j = worklist.pop()
+                for p in preds[j]:
+                    if name not in live[p]:
+                        live[p].add(name)
+                        live_idx[name].append(p)
+                        if name not in defs[p]:
+                            worklist.append(p)
+        # nodeとnamesの枝を張り直す（buildと同じく，定義される変数とその直後に生きている変数の間の枝）
+        # 挿入したstoreは何も定義せず，restoreはnamesのどれかを定義するだけなので，それ以外の枝は変わらない
+        for name in graph.pop(node, ()):
+            graph[name].discard(node)
+        for name in names:
+            if live_idx[name]:
+                graph[name] = set()
+        for name in names:
+            if not live_idx[name]:
+                continue
+            adj = graph[name]
+            # nameが生きている位置で定義される変数との枝
+            for j in live_idx[name]:
+                for other in defs[j]:
+                    if other != name and other in graph and move_src.get(j) != name:
+                        graph[other].add(name)
+                        adj.add(other)
+            # nameを定義する位置で生きている変数との枝
+            for j in instr_idx_list:
+                if name in defs[j]:
+                    for other in live[j]:
+                        if other != name and other != move_src.get(j):
+                            graph[other].add(name)
+                            adj.add(other)
+
+    # 頂点の順番をbuildと同じにする
+    ordered_graph = {name : graph[name] for name in nodeOrder(live, instr_idx_list)}
+
+    return {j : live[j] for j in instr_idx_list}, ordered_graph
+
+# memoryAlloc, splitRange, spillPieceでold_lisにstore/restoreを挿入してできたnew_lisについて，元からある行の new_lisでのidx => old_lisでのidx の辞書を返す
+# 元からある行は同じオブジェクト（変数名を付け替えたものは元の命令，renamed: 変数名を付け替えた命令のid => 元の命令）なので，それで新旧のidxを対応させる
+def matchLines (old_lis:List[virtual.Virtual_Asm], new_lis:List[virtual.Virtual_Asm], renamed:Dict[int, virtual.Virtual_Asm]) -> Dict[int, int]:
+    pos = {id(asm) : i for i, asm in enumerate(old_lis)}
+    line_idx = {}
+    for j, asm in enumerate(new_lis):
+        i = pos.get(id(renamed.get(id(asm), asm)))
+        if i is not None:
+            line_idx[j] = i
+    return line_idx
+
+# new_lisについて，buildと同じものを周辺の更新だけで作る
+# 渡したgraph_int, graph_float, live_int, live_floatの中身は書き換えられる
+# names_int, names_float: updateLiveAndGraphのnames，line_idx: matchLinesの返り値，flow: new_lisのCFG
+def updateAfterSpill (
+    ctx:context.CompilationContext,
+    new_lis:List[virtual.Virtual_Asm],
+    line_idx:Dict[int, int],
+    flow:cfg.CFG,
+    graph_int:Dict[str, Set],
+    graph_float:Dict[str, Set],
+    live_int:Dict[int, Set[str]],
+    live_float:Dict[int, Set[str]],
+    node_int:str,
+    node_float:str,
+    names_int:List[str],
+    names_float:List[str],
+    ) -> Tuple[Dict]:
+    instr_idx_list = flow.instr_idx_list
+    def_int, use_int, def_float, use_float = liveness.getDefAndUse(ctx, new_lis, instr_idx_list)
+    succ_instrs = flow.succ_instrs
+    preds = flow.predInstrs()
+
+    old_idx = {}
+    inserted = []
+    for j in instr_idx_list:
+        i = line_idx.get(j)
+        if i is None:
+            inserted.append(j)
+        else:
+            old_idx[j] = i
+
+    live_int, graph_int = updateLiveAndGraph(live_int, graph_int, node_int, names_int, instr_idx_list, old_idx, inserted, def_int, use_int, succ_instrs, preds, moveSources(new_lis, instr_idx_list, opcodes.MV))
+    live_float, graph_float = updateLiveAndGraph(live_float, graph_float, node_float, names_float, instr_idx_list, old_idx, inserted, def_float, use_float, succ_instrs, preds, moveSources(new_lis, instr_idx_list, opcodes.FMV))
+
+    return graph_int, graph_float, live_int, live_float, def_int, use_int, def_float, use_float
+
+# updateAfterSpillの結果とupdateInstrsで更新したCFGが，全体から作り直したものと一致するかを確かめる（ctx.options.spill_update == "check"のとき）
+def checkUpdate (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], flow:cfg.CFG, updated:Tuple[Dict]):
+    rebuilt = cfg.CFG(lis)
+    if [(block.instrs, block.succs, block.preds) for block in flow.blocks] != [(block.instrs, block.succs, block.preds) for block in rebuilt.blocks]:
+        error.error("Incremental update of the CFG after spill differs from full rebuild.")
+    if flow.instrFrequencies() != rebuilt.instrFrequencies():
+        error.error("Loop depths of the CFG updated after spill differ from full rebuild.")
+    expected = build(ctx, lis)
+    names = ("graph_int", "graph_float", "live_int", "live_float")
+    for name, got, want in zip(names, updated, expected):
+        if got != want:
+            diff = [key for key in set(got) | set(want) if got.get(key) != want.get(key)]
+            error.error("Incremental update after spill differs from full rebuild: {} at {}.".format(name, diff[:10]))
+
+# simplify/coalesce/freeze/spillで使うグラフ
+# 隣接ノードの集合adjは元のグラフと共有し，合体で書き換えるノードの分だけコピーする（元のグラフはspill後の更新で使い回すので書き換えない）
+# ノードを取り除くときは枝を消さずに，隣接ノードの次数（取り除いていない隣接ノードの数）を減らすだけにする
+# 取り除いていないノードは次数で2つのバケットに分ける
+#   次数がlimit未満のノード: simplifyで取り出す。ノードの番号（元のグラフの順番）のヒープで，次数がlimit未満になったときに入れる
+#     次数がlimit以上に戻ったり取り除かれたりしたノードはヒープに残しておき，取り出すときに読み飛ばす
+#     moveに関わるノードは合体の対象なので，合体か凍結で関わらなくなるまで入れない
+#   次数がlimit以上のノード: simplifyできなくなったときにspillの候補になる
+#     spillのコスト / 次数 のヒープで，初めてspillするときに作る。次数は取り除くたびに減るので値は大きくなる一方である
+#     そこで，入れたときの次数と今の次数が違うものが先頭に来たら入れ直し，同じものが先頭に来たらそれを取り出す（合体で次数が増えたノードはその時に入れ直す）
+class WorkGraph:
+    def __init__ (self, graph:Dict[str, Set], limit:int):
+        self.adj: Dict[str, Set] = dict(graph) # 合体を反映した全ノードのグラフ（selectで使う）
+        self.owned: Set[str] = set() # adjの中でコピー済みの（書き換えてよい）集合のノード
+        self.limit = limit
+        self.names: List[str] = list(graph)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self.remaining: Dict[str, None] = dict.fromkeys(graph) # まだ取り除いていないノード（元のグラフの順）
+        self.degree: Dict[str, int] = {name: len(graph[name]) for name in graph}
+        self.low: List[int] = [i for i, name in enumerate(self.names) if self.degree[name] < limit] # 次数がlimit未満のノードの番号のヒープ（番号順なのでそのままヒープになっている）
+        self.move_related: Set[str] = set()
+        self.spill_heap: List[Tuple[float, int, int]] = None # (spillのコスト / 次数, ノードの番号, 入れたときの次数) のヒープ
+        self.costs: Dict[str, float] = None
+
+    # 次数がlimit未満のnameをヒープに入れる
+    def push (self, name:str):
+        if self.degree[name] < self.limit and name in self.remaining and name not in self.move_related:
+            heapq.heappush(self.low, self.index[name])
+
+    # 次数がlimit未満でmoveに関わらないノードのうち，元のグラフで最も先のものを返す（なければNone）
+    # （次数の小さい順に取り出すより，元のグラフの順に取り出す方がspillが少なかった）
+    def popLow (self) -> str:
+        low = self.low
+        while low:
+            name = self.names[heapq.heappop(low)]
+            if self.degree[name] < self.limit and name in self.remaining and name not in self.move_related:
+                return name
+        return None
+
+    # nameをグラフから取り除き，隣接ノードの次数を減らす
+    def remove (self, name:str):
+        del self.remaining[name]
+        degree = self.degree
+        remaining = self.remaining
+        border = self.limit - 1
+        for t in self.adj[name]:
+            if t in remaining:
+                degree[t] -= 1
+                if degree[t] == border: # ちょうど次数がlimit未満になった
+                    self.push(t)
+
+    # spillのコスト / 次数 が最小のもの（同じ値なら元のグラフで先のもの）を返す（already_spilledのノードは選ばない。なければNone）
+    def popSpill (self, costs:Dict[str, float], already_spilled:Set[str]) -> str:
+        if self.spill_heap is None:
+            self.costs = costs
+            self.spill_heap = [self.spillEntry(name) for name in self.remaining if name not in already_spilled]
+            heapq.heapify(self.spill_heap)
+        heap = self.spill_heap
+        while heap:
+            _, i, d = heap[0]
+            name = self.names[i]
+            if name not in self.remaining or name in already_spilled:
+                heapq.heappop(heap)
+            elif d != self.degree[name]: # 入れた後に次数が変わっているので入れ直す
+                heapq.heapreplace(heap, self.spillEntry(name))
+            else:
+                heapq.heappop(heap)
+                return name
+        return None
+
+    def spillEntry (self, name:str) -> Tuple[float, int, int]:
+        d = self.degree[name]
+        return (self.costs.get(name, 0) / max(d, 1), self.index[name], d)
+
+    # 取り除いていない隣接ノード
+    def neighbors (self, name:str) -> List[str]:
+        return [t for t in self.adj[name] if t in self.remaining]
+
+    # nameの隣接ノードの集合を書き換えられるようにする
+    def own (self, name:str) -> Set[str]:
+        if name not in self.owned:
+            self.adj[name] = set(self.adj[name])
+            self.owned.add(name)
+        return self.adj[name]
+
+    # moveに関わるノードの集合を更新し，関わらなくなったノードをバケットに入れる
+    def setMoveRelated (self, move_related:Set[str]):
+        released = sorted(self.move_related - move_related, key=self.index.get)
+        self.move_related = move_related
+        for name in released:
+            self.push(name)
+
+# limit未満の隣接ノードを持つノードを削除してスタックに移動する
+# moveに関わるノード（まだ合体できる可能性のあるもの）は残しておく
+def simplify (graph:WorkGraph, stk:List[str]) -> List[str]:
+    while True:
+        name = graph.popLow()
+        if name is None: # どのノードも隣接ノード数がlimit以上かmoveに関わるのでループから抜ける
             break
-    return graph, stk
+        stk.append(name)
+        graph.remove(name) # グラフからノードを削除
+    return stk
+
+# 合体した変数の代表（グラフに残っている方の変数）を返す
+def getAlias (alias:Dict[str, str], name:str) -> str:
+    while name in alias:
+        name = alias[name]
+    return name
+
+# mv（floatならfmv）のうち，両辺が割り当ての対象で異なる変数であるものを (移動先, 移動元) のリストにする
+def findMoves (lis:List[virtual.Virtual_Asm], graph:Dict[str, Set], op:int) -> List[Tuple[str, str]]:
+    moves = []
+    for asm in lis:
+        if asm.op == op:
+            dst = asm.arg_list[0].name
+            src = asm.arg_list[1].name
+            if dst != src and dst in graph and src in graph:
+                moves.append((dst, src))
+    return moves
+
+# まだ合体できる可能性のあるmoveに関わる変数（の代表）の集合
+def moveRelated (moves:List[Tuple[str, str]], alias:Dict[str, str]) -> Set[str]:
+    names = set()
+    for dst, src in moves:
+        names.add(getAlias(alias, dst))
+        names.add(getAlias(alias, src))
+    return names
+
+# Briggsの条件: 合体後の頂点の隣接ノードのうち，limit以上の隣接ノードを持つものがlimit個未満
+def briggs (graph:WorkGraph, u:str, v:str) -> bool:
+    high_degree_cnt = 0
+    adj_u = graph.adj[u]
+    for t in adj_u:
+        if t in graph.remaining and graph.degree[t] >= graph.limit:
+            high_degree_cnt += 1
+    for t in graph.adj[v]:
+        if t not in adj_u and t in graph.remaining and graph.degree[t] >= graph.limit:
+            high_degree_cnt += 1
+    return high_degree_cnt < graph.limit
+
+# Georgeの条件: vの隣接ノードはどれも，limit未満の隣接ノードしか持たないか，すでにuと隣接している
+def george (graph:WorkGraph, u:str, v:str) -> bool:
+    adj_u = graph.adj[u]
+    for t in graph.adj[v]:
+        if t in graph.remaining and graph.degree[t] >= graph.limit and t not in adj_u:
+            return False
+    return True
+
+# 頂点vを頂点uに合体する
+def combine (graph:WorkGraph, alias:Dict[str, str], u:str, v:str):
+    alias[v] = u
+    adj_u = graph.own(u)
+    for t in graph.adj.pop(v):
+        adj_t = graph.own(t)
+        adj_t.discard(v)
+        if t in adj_u: # uとvの両方に隣接していたtは隣接ノードが1つ減る
+            if t in graph.remaining:
+                graph.degree[t] -= 1
+                graph.push(t)
+        else:
+            adj_t.add(u)
+            adj_u.add(t)
+    del graph.remaining[v]
+    graph.degree[u] = len(graph.neighbors(u))
+    graph.push(u)
+    if graph.spill_heap is not None:
+        heapq.heappush(graph.spill_heap, graph.spillEntry(u))
+
+# movesの両辺を，彩色できなくならない（Briggs/Georgeの条件を満たす）ものから合体していく
+# 合体したものと，干渉しているので合体できないものはmovesから除く
+# movesが減ったかどうかを返す（減っていればsimplifyできる頂点が増えている可能性がある）
+def coalesceMoves (graph:WorkGraph, moves:List[Tuple[str, str]], alias:Dict[str, str]) -> bool:
+    remaining = []
+    for dst, src in moves:
+        u = getAlias(alias, dst)
+        v = getAlias(alias, src)
+        if u == v: # すでに合体済み
+            continue
+        if u not in graph.remaining or v not in graph.remaining or v in graph.adj[u]: # 干渉しているので合体できない
+            continue
+        if briggs(graph, u, v) or george(graph, u, v):
+            combine(graph, alias, u, v)
+        elif george(graph, v, u):
+            combine(graph, alias, v, u)
+        else:
+            remaining.append((dst, src))
+    change_flag = len(remaining) != len(moves)
+    moves[:] = remaining
+    graph.setMoveRelated(moveRelated(moves, alias))
+    return change_flag
+
+# nameに関わるmoveを合体の対象から外す（freeze）
+def freezeMoves (graph:WorkGraph, moves:List[Tuple[str, str]], alias:Dict[str, str], name:str):
+    moves[:] = [(dst, src) for dst, src in moves if getAlias(alias, dst) != name and getAlias(alias, src) != name]
+    graph.setMoveRelated(moveRelated(moves, alias))
+
+# simplifyも合体もできないとき，limit未満の隣接ノードを持つmoveに関わる頂点を1つ選んで，そのmoveをあきらめる
+# 選べたかどうかを返す
+def freeze (graph:WorkGraph, moves:List[Tuple[str, str]], alias:Dict[str, str]) -> bool:
+    for name in sorted(graph.move_related, key=graph.index.get):
+        if name in graph.remaining and graph.degree[name] < graph.limit:
+            freezeMoves(graph, moves, alias, name)
+            return True
+    return False
+
+# 定数を置くだけの命令（この命令だけで定義される変数は，spillせずに作り直しやすい）
+REMAT_OPS = {opcodes.LI, opcodes.FLI, opcodes.LA}
+# 作り直しやすい変数のコストに掛ける値
+REMAT_COST_RATIO = 0.5
+
+# asmが，いつ実行しても同じ値を定義する命令（li/fli/laか，値の変わらない特別な用途のレジスタからのaddi）かどうか
+# hpは値が変わるので含めない
+def isRemat (ctx:context.CompilationContext, asm:virtual.Virtual_Asm) -> bool:
+    if asm.op in REMAT_OPS:
+        return True
+    return asm.op == opcodes.ADDI and asm.arg_list[1].name != 'hp' and asm.arg_list[1].name in ctx.special_int_regs
+
+# 変数node（型typ）を定義する命令がすべて同じ値を定義するisRematの命令なら，そのうちの1つを返す（そうでなければNone）
+# 返した命令をrematCopyで作り直せば，storeもrestoreもせずに使用の直前で値を作れる
+def rematTemplate (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], node:str, typ:str) -> virtual.Virtual_Asm:
+    template = None
+    for asm in lis:
+        if opcodes.INFO[asm.op].flags & opcodes.IS_NOT_INSTR:
+            continue
+        def_pos, _ = opcodes.INFO[asm.op].defUse(len(asm.arg_list))
+        if not any(asm.arg_list[k].name == node and asm.arg_list[k].typ == typ for k in def_pos):
+            continue
+        if not isRemat(ctx, asm):
+            return None
+        if template is None:
+            template = asm
+        elif asm.op != template.op or asm.arg_list[1:] != template.arg_list[1:]:
+            return None
+    return template
+
+# templateと同じ値を変数name（型typ）に定義する命令
+def rematCopy (template:virtual.Virtual_Asm, name:str, typ:str) -> virtual.Virtual_Asm:
+    return virtual.Virtual_Asm(template.op, template.arg_count, [virtual.Reg(name, typ)] + list(template.arg_list[1:]))
+
+# 変数名 => spillしたときに増えるメモリアクセスの見積もり の辞書を作る
+# 定義・使用する命令ごとにその命令の実行頻度を足していく
+def spillCosts (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], freq:Dict[int, int], defs:Dict[int, FrozenSet[str]], uses:Dict[int, FrozenSet[str]]) -> Dict[str, float]:
+    costs = {}
+    not_remat = set()
+    for i in defs:
+        for name in defs[i]:
+            costs[name] = costs.get(name, 0) + freq[i]
+            if not isRemat(ctx, lis[i]):
+                not_remat.add(name)
+    for i in uses:
+        for name in uses[i]:
+            costs[name] = costs.get(name, 0) + freq[i]
+    for name in costs:
+        if name not in not_remat:
+            costs[name] *= REMAT_COST_RATIO
+    return costs
 
 # メモリ上に保持する（spillする）可能性のある変数を選ぶ
-# 返り値は 与えられたgraphそのまま、spillする可能性のある変数の名前、spillする可能性のある変数を加えたスタック
-def spill (graph:Dict[str, Set], stk:List[str], already_spilled:List[str]) -> Tuple[Dict[str, Set], str, List[str]]:
-    if graph == {}:
-        return graph, None, stk
-    names = list(graph.keys())
-    for name in names: # 適当に一番最初を選択（todo: 最適化）
-        if name not in already_spilled: # すでにspillしたことのある変数は無限ループに陥る可能性があるのでダメ
-            break
+# 返り値はspillする可能性のある変数の名前と，それを加えたスタック
+def spill (graph:WorkGraph, stk:List[str], already_spilled:List[str], costs:Dict[str, float]) -> Tuple[str, List[str]]:
+    if not graph.remaining:
+        return None, stk
+    # spillのコスト / 隣接ノード数 が最小のものを選択（同じ値ならグラフの先頭に近いもの）
+    # すでにspillしたことのある変数は無限ループに陥る可能性があるのでダメ
+    name = graph.popSpill(costs, already_spilled)
+    if name is None: # すべてspillしたことのある変数なら最後のものを選ぶ
+        name = next(reversed(graph.remaining))
     stk.append(name)
-    graph.pop(name) # グラフからノードを削除
-    for key in graph: # 削除したノードを一端にもつ枝を削除
-        if name in graph[key]:
-            graph[key].remove(name)
-    return graph, name, stk
+    graph.remove(name) # グラフからノードを削除
+    return name, stk
 
 # スタックからノードをポップしながら割り当てしていく
 # 成功したらallocation(dict)を，失敗したらnode(str, メモリ上に保持する変数の候補)を返す
-def select (graph:Dict[str, Set], stk:List[str], potential_spill:List[str], regs_list:List[str]) -> Union[Dict[str, Set], str]:
+# 合体した変数には代表と同じレジスタを割り当てる
+def select (graph:Dict[str, Set], stk:List[str], potential_spill:List[str], regs_list:List[str], alias:Dict[str, str]) -> Union[Dict[str, Set], str]:
     # 最終的に返す割り当て結果
     allocation = {}
     while stk:
@@ -116,48 +544,18 @@ def select (graph:Dict[str, Set], stk:List[str], potential_spill:List[str], regs
                 return node
             else:
                 error.error("Register allocation failed.")
+    for name in alias:
+        allocation[name] = allocation[getAlias(alias, name)]
     return allocation
 
-# 即値レジスタかどうかを判別
-def isImmediate (name:str):
-    for letter in name:
-        if letter.isalpha():
-            return False
-    return True
-
-# defされているがuseされていない命令は不要なので、のちに削除できるように変数名をunnecessaryにしておく
-def removeUnnecessaryInstr (lis:List[virtual.Virtual_Asm], allocation_or_node_int, allocation_or_node_float):
-    _, _, def_int, use_int, def_float, use_float = build(lis)
-    # use_int, use_floatの中に入っている変数の集合
-    use_int_set = set()
-    use_float_set = set()
-    for key in use_int:
-        use_int_set |= use_int[key]
-    for key in use_float:
-        use_float_set |= use_float[key]
-
-    # defのなかのitemがuseに入っていなければ、unnecessaryになる
-    for key in def_int:
-        if len(def_int[key]) > 0:
-            def_item = list(def_int[key])[0]
-            if def_item not in use_int_set:
-                allocation_or_node_int[def_item] = "unnecessary"
-    for key in def_float:
-        if len(def_float[key]) > 0:
-            def_item = list(def_float[key])[0]
-            if def_item not in use_float_set:
-                allocation_or_node_float[def_item] = "unnecessary"
-    
-    return allocation_or_node_int, allocation_or_node_float
-    
 # regAllocの前処理として，関数の「* args」のうち，使われていないargを「* not used args」として加え，use_int, use_floatに無理やり含まれるようにする
-# （そうでないと前の関数のunnecessaryの対象になってしまう）
-def findNotUsedArgs (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
-    if lis[1].instr_name != "* args": # 引数がないのでスルー
+# （そうでないとどこでも生きていない変数になり，deadCode.removeUnallocatedの対象になってしまう）
+def findNotUsedArgs (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
+    if lis[1].op != opcodes.ARGS: # 引数がないのでスルー
         return lis
     
     # use_int, use_floatの中に入っている変数の集合を作る
-    _, _, _, use_int, _, use_float = build(lis)
+    _, use_int, _, use_float = liveness.getDefAndUse(ctx, lis)
     use_int_set = set()
     use_float_set = set()
     for key in use_int:
@@ -168,7 +566,7 @@ def findNotUsedArgs (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]
     # argsのリストを作る
     args_list = []
     for asm in lis:
-        if asm.instr_name == "* args":
+        if asm.op == opcodes.ARGS:
             args_list.append(asm.arg_list[0])
     # 使われていないargsのリストを作る
     not_used_args_list = []
@@ -178,15 +576,26 @@ def findNotUsedArgs (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]
     # 使われていないargsを「* not used args」として加える
     idx = 1
     while True:
-        if lis[idx].instr_name == "* args":
+        if lis[idx].op == opcodes.ARGS:
             idx += 1
         else:
             break
     return lis[:idx] + [
-        virtual.Virtual_Asm("* not used args", 1, [reg]) for reg in not_used_args_list
+        virtual.Virtual_Asm(opcodes.NOT_USED_ARGS, 1, [reg]) for reg in not_used_args_list
     ] + lis[idx:]
 
+# def_idx行目で定義された変数のstoreを挿入する位置を返す
+# 「* args」で定義された場合は「* args」「* not used args」の並びの直後に置く
+# （途中に置くと引数同士が干渉しなくなり，同じレジスタが割り当てられてしまう）
+def storePos (lis:List[virtual.Virtual_Asm], def_idx:int) -> int:
+    pos = def_idx + 1
+    if lis[def_idx].op == opcodes.ARGS:
+        while pos < len(lis) and (lis[pos].op == opcodes.ARGS or lis[pos].op == opcodes.NOT_USED_ARGS):
+            pos += 1
+    return pos
+
 # 与えられた変数をメモリに割り当てるロード，ストア命令をlisの中に埋め込む
+# remat_int, remat_floatが与えられたら（rematTemplate），storeはせず，定義する命令を取り除いて使用の直前ごとにその命令で作り直す
 def memoryAlloc (
     lis:List[virtual.Virtual_Asm],
     node_int:str = None,
@@ -195,7 +604,10 @@ def memoryAlloc (
     node_float:str = None,
     def_float = None,
     use_float = None,
+    remat_int:virtual.Virtual_Asm = None,
+    remat_float:virtual.Virtual_Asm = None,
     ) -> List[virtual.Virtual_Asm]:
+    removed = set() # 作り直すので取り除く命令の位置
     # int
     store_pos_int = []
     restore_pos_int = []
@@ -204,7 +616,10 @@ def memoryAlloc (
         for def_int_key in def_int:
             def_int_item = def_int[def_int_key]
             if node_int in def_int_item:
-                store_pos_int.append(def_int_key + 1)
+                if remat_int is not None:
+                    removed.add(def_int_key)
+                else:
+                    store_pos_int.append(storePos(lis, def_int_key))
         # restoreを挿入する位置を計算。挿入する位置はnode_intが使用されている部分の直前
         for use_int_key in use_int:
             use_int_item = use_int[use_int_key]
@@ -219,7 +634,10 @@ def memoryAlloc (
             for def_float_key in def_float:
                 def_float_item = def_float[def_float_key]
                 if node_float in def_float_item:
-                    store_pos_float.append(def_float_key + 1)
+                    if remat_float is not None:
+                        removed.add(def_float_key)
+                    else:
+                        store_pos_float.append(storePos(lis, def_float_key))
         # restoreを挿入する位置を計算
         if use_float is not None:
             for use_float_key in use_float:
@@ -238,33 +656,144 @@ def memoryAlloc (
     restore_pos_float_length = len(restore_pos_float)
     for i in range(len(lis)):
         if store_pos_int_idx < store_pos_int_length and store_pos_int[store_pos_int_idx] == i:
-            new_lis.append(virtual.Virtual_Asm("store", 2, [virtual.Reg(node_int, "int"), virtual.Reg(node_int, 'label')]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.STORE, 2, [virtual.Reg(node_int, "int"), virtual.Reg(node_int, 'label')]))
             store_pos_int_idx += 1
         if restore_pos_int_idx < restore_pos_int_length and restore_pos_int[restore_pos_int_idx] == i:
-            new_lis.append(virtual.Virtual_Asm("restore", 2, [virtual.Reg(node_int, "int"), virtual.Reg(node_int, 'label')]))
+            if remat_int is not None:
+                new_lis.append(rematCopy(remat_int, node_int, "int"))
+            else:
+                new_lis.append(virtual.Virtual_Asm(opcodes.RESTORE, 2, [virtual.Reg(node_int, "int"), virtual.Reg(node_int, 'label')]))
             restore_pos_int_idx += 1
         if store_pos_float_idx < store_pos_float_length and store_pos_float[store_pos_float_idx] == i:
-            new_lis.append(virtual.Virtual_Asm("store", 2, [virtual.Reg(node_float, "float"), virtual.Reg(node_float, 'label')]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.STORE, 2, [virtual.Reg(node_float, "float"), virtual.Reg(node_float, 'label')]))
             store_pos_float_idx += 1
         if restore_pos_float_idx < restore_pos_float_length and restore_pos_float[restore_pos_float_idx] == i:
-            new_lis.append(virtual.Virtual_Asm("restore", 2, [virtual.Reg(node_float, "float"), virtual.Reg(node_float, 'label')]))
+            if remat_float is not None:
+                new_lis.append(rematCopy(remat_float, node_float, "float"))
+            else:
+                new_lis.append(virtual.Virtual_Asm(opcodes.RESTORE, 2, [virtual.Reg(node_float, "float"), virtual.Reg(node_float, 'label')]))
             restore_pos_float_idx += 1
-        new_lis.append(lis[i])
+        if i not in removed:
+            new_lis.append(lis[i])
     
     return new_lis
     
+# 生存区間を分割するときの区切り: 関数呼び出しの前後と，分岐・ジャンプ・returnの後（ラベルの前でも区切る）
+SPLIT_FLAGS = opcodes.IS_CALL | opcodes.IS_BRANCH | opcodes.IS_JUMP | opcodes.IS_RETURN
+
+# 初めてspillする変数nodeの生存区間を，基本ブロックを関数呼び出しで区切った区間ごとに分割する
+# 定義した区間の中では値をそのままレジスタに置き（定義の直後にstoreはする），それ以外の区間では最初に使用する命令の直前に1回だけrestoreする
+# （関数呼び出しで使用する値は呼び出しの前の区間に，関数呼び出しで定義される値は後の区間に含める）
+# 分割した変数には新しい名前を付けて，slotsに 新しい名前 => スタック上の場所の名前（nodeの名前） を記録する
+# remat（rematTemplate）が与えられたら，storeはせず，restoreの代わりにその命令で値を作り直す
+# 返り値は 新しいlis，分割した変数のリスト，spillしても生存区間が短くならない変数のリスト
+# どの使用も定義と同じ区間にある（分割しても変わらない）ときはNoneを返す
+def splitRange (
+    lis:List[virtual.Virtual_Asm],
+    node:str,
+    typ:str,
+    slots:Dict[str, str],
+    renamed:Dict[int, virtual.Virtual_Asm],
+    remat:virtual.Virtual_Asm = None,
+    ) -> Tuple[List[virtual.Virtual_Asm], List[str], List[str]]:
+    new_lis = []
+    stores = {} # storeを入れる位置 => storeのリスト
+    pieces = []
+    use_count = {} # 分割した変数 => それを使用する命令の数
+    defined = set() # 命令で定義される（restoreで定義されない）分割した変数
+    cur = None # 今の区間でnodeの値を持っている変数
+    new_renamed = {}
+    for i, asm in enumerate(lis):
+        new_lis += stores.pop(i, [])
+        info = opcodes.INFO[asm.op]
+        if info.flags & opcodes.IS_NOT_INSTR:
+            if asm.op == opcodes.LABEL:
+                cur = None
+            new_lis.append(asm)
+            continue
+        def_pos, use_pos = info.defUse(len(asm.arg_list))
+        arg_list = None
+        for k in use_pos:
+            if asm.arg_list[k].name == node and asm.arg_list[k].typ == typ:
+                if cur is None:
+                    cur = node + ".r" + str(len(slots) + len(pieces))
+                    pieces.append(cur)
+                    use_count[cur] = 0
+                    if remat is not None:
+                        new_lis.append(rematCopy(remat, cur, typ))
+                    else:
+                        new_lis.append(virtual.Virtual_Asm(opcodes.RESTORE, 2, [virtual.Reg(cur, typ), virtual.Reg(node, 'label')]))
+                if arg_list is None:
+                    arg_list = list(asm.arg_list)
+                    use_count[cur] += 1
+                arg_list[k] = virtual.Reg(cur, typ)
+        if info.flags & SPLIT_FLAGS:
+            cur = None
+        for k in def_pos:
+            if asm.arg_list[k].name == node and asm.arg_list[k].typ == typ:
+                cur = node + ".s" + str(len(slots) + len(pieces))
+                pieces.append(cur)
+                use_count[cur] = 0
+                defined.add(cur)
+                if remat is None:
+                    stores.setdefault(storePos(lis, i), []).append(virtual.Virtual_Asm(opcodes.STORE, 2, [virtual.Reg(cur, typ), virtual.Reg(node, 'label')]))
+                if arg_list is None:
+                    arg_list = list(asm.arg_list)
+                arg_list[k] = virtual.Reg(cur, typ)
+        if info.flags & SPLIT_FLAGS & ~opcodes.IS_CALL:
+            cur = None
+        if arg_list is not None:
+            new_asm = virtual.Virtual_Asm(asm.op, asm.arg_count, arg_list)
+            new_renamed[id(new_asm)] = asm
+            asm = new_asm
+        new_lis.append(asm)
+    new_lis += stores.pop(len(lis), [])
+    if all(piece in defined for piece in pieces): # restoreが1つもない
+        return None
+    for key, asm in new_renamed.items(): # 既に付け替えた命令をもう一度付け替えたなら，元の命令に対応させる
+        renamed[key] = renamed.pop(id(asm), asm)
+    for piece in pieces:
+        slots[piece] = node
+    # 定義した区間で使用しない変数と，1つの命令でしか使用しないrestoreした変数は，spillしても使用の直前にrestoreするだけになる
+    minimal = [piece for piece in pieces if use_count[piece] == 0 or (piece not in defined and use_count[piece] == 1)]
+    return new_lis, pieces, minimal
+
+# splitRangeで分割した変数nodeをspillするときは，使用する命令の直前ごとにrestoreする
+# 値は定義の直後かrestoreで既にスタック上の場所にあるのでstoreは入れず，nodeを定義していたrestoreは使われなくなるので取り除く
+# remat（rematTemplate）が与えられたら，nodeを定義する命令をすべて取り除き，使用する命令の直前ごとにその命令で値を作り直す
+def spillPiece (lis:List[virtual.Virtual_Asm], node:str, typ:str, slot:str, remat:virtual.Virtual_Asm = None) -> List[virtual.Virtual_Asm]:
+    new_lis = []
+    for asm in lis:
+        if asm.op == opcodes.RESTORE and asm.arg_list[0].name == node and asm.arg_list[0].typ == typ:
+            continue
+        if asm.op != opcodes.STORE and not opcodes.INFO[asm.op].flags & opcodes.IS_NOT_INSTR:
+            def_pos, use_pos = opcodes.INFO[asm.op].defUse(len(asm.arg_list))
+            if remat is not None and any(asm.arg_list[k].name == node and asm.arg_list[k].typ == typ for k in def_pos):
+                continue
+            if any(asm.arg_list[k].name == node and asm.arg_list[k].typ == typ for k in use_pos):
+                if remat is not None:
+                    new_lis.append(rematCopy(remat, node, typ))
+                else:
+                    new_lis.append(virtual.Virtual_Asm(opcodes.RESTORE, 2, [virtual.Reg(node, typ), virtual.Reg(slot, 'label')]))
+        new_lis.append(asm)
+    return new_lis
+
 # レジスタ割り当て
 # virtual_asmのlistを受け取ってレジスタ割り当て後のvirtual_asmを返す
-def regAlloc (lis:List[virtual.Virtual_Asm], int_regs, float_regs) -> List[virtual.Virtual_Asm]:
+def regAlloc (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], int_regs, float_regs) -> List[virtual.Virtual_Asm]:
     # regAllocの前処理
-    lis = findNotUsedArgs(lis)
+    lis = findNotUsedArgs(ctx, lis)
 
     # 一度spillしたものは二度とspillしないようにするために，spillしたものを記憶しておく
     already_spilled_int = set()
     already_spilled_float = set()
+    # 生存区間を分割してできた変数 => スタック上の場所の名前
+    slots = {}
+    # build: virtual_asmのリストからliveness情報を持つグラフを受け取る
+    # lisのCFG（flow）は，lisを書き換えるまで生存解析と実行頻度の見積もりで使い回す
+    flow = cfg.CFG(lis)
+    graph_int, graph_float, live_int, live_float, def_int, use_int, def_float, use_float = build(ctx, lis, flow)
     while True:
-        # build: virtual_asmのリストからliveness情報を持つグラフを受け取る
-        graph_int, graph_float, def_int, use_int, def_float, use_float = build(lis)
 
         # spillされる可能性のあるものを格納する
         potential_spill_int = set()
@@ -272,64 +801,136 @@ def regAlloc (lis:List[virtual.Virtual_Asm], int_regs, float_regs) -> List[virtu
         # その他以下のループで使われる変数の初期化
         stk_int = []
         stk_float = []
-        simplified_graph_int = copy.deepcopy(graph_int)
-        simplified_graph_float = copy.deepcopy(graph_float)
+        # simplifyなどで使うグラフ（graph_int, graph_floatはspill後の更新で使い回すので書き換えない）
+        work_graph_int = WorkGraph(graph_int, len(int_regs))
+        work_graph_float = WorkGraph(graph_float, len(float_regs))
+        costs_int = costs_float = None # spillのコスト（spillが必要になったときに初めて計算する）
+        # 合体の対象のmoveと，合体した変数 => 合体先の変数
+        moves_int = findMoves(lis, graph_int, opcodes.MV) if ctx.options.coalesce else []
+        moves_float = findMoves(lis, graph_float, opcodes.FMV) if ctx.options.coalesce else []
+        alias_int = {}
+        alias_float = {}
+        work_graph_int.setMoveRelated(moveRelated(moves_int, alias_int))
+        work_graph_float.setMoveRelated(moveRelated(moves_float, alias_float))
         # simplify: limit未満の隣接ノードを持つノードを削除してスタックに移動する
+        # coalesce: moveの両辺を合体する
+        # freeze: 合体をあきらめてsimplifyできるようにする
         # spill: メモリ上に保持する可能性のある変数を選ぶ
         while True:
             # simplify
-            simplified_graph_int, stk_int = simplify(simplified_graph_int, len(int_regs), stk_int)
-            simplified_graph_float, stk_float = simplify(simplified_graph_float, len(float_regs), stk_float)
+            stk_int = simplify(work_graph_int, stk_int)
+            stk_float = simplify(work_graph_float, stk_float)
             # 全てのノードがスタックに移動できたら終了
-            if simplified_graph_int == {} and simplified_graph_float == {}:
+            if not work_graph_int.remaining and not work_graph_float.remaining:
                 break
+            # coalesce
+            coalesced_int = coalesceMoves(work_graph_int, moves_int, alias_int)
+            coalesced_float = coalesceMoves(work_graph_float, moves_float, alias_float)
+            if coalesced_int or coalesced_float:
+                continue
+            # freeze
+            frozen_int = freeze(work_graph_int, moves_int, alias_int)
+            frozen_float = freeze(work_graph_float, moves_float, alias_float)
+            if frozen_int or frozen_float:
+                continue
             # spill
-            simplified_graph_int, name_int, stk_int = spill(simplified_graph_int, stk_int, already_spilled_int)
+            if costs_int is None:
+                freq = flow.instrFrequencies()
+                costs_int = spillCosts(ctx, lis, freq, def_int, use_int)
+                costs_float = spillCosts(ctx, lis, freq, def_float, use_float)
+            name_int, stk_int = spill(work_graph_int, stk_int, already_spilled_int, costs_int)
             if name_int is not None:
                 potential_spill_int.add(name_int)
-            simplified_graph_float, name_float, stk_float = spill(simplified_graph_float, stk_float, already_spilled_float)
+                freezeMoves(work_graph_int, moves_int, alias_int, name_int)
+            name_float, stk_float = spill(work_graph_float, stk_float, already_spilled_float, costs_float)
             if name_float is not None:
                 potential_spill_float.add(name_float)
+                freezeMoves(work_graph_float, moves_float, alias_float, name_float)
         
         # select: スタックからノードをポップしながら割り当てしていく
-        allocation_or_node_int = select(graph_int, stk_int, potential_spill_int, int_regs)
-        allocation_or_node_float = select(graph_float, stk_float, potential_spill_float, float_regs)
+        allocation_or_node_int = select(work_graph_int.adj, stk_int, potential_spill_int, int_regs, alias_int)
+        allocation_or_node_float = select(work_graph_float.adj, stk_float, potential_spill_float, float_regs, alias_float)
 
         if type(allocation_or_node_int) is not str and type(allocation_or_node_float) is not str:
             break # allocation_or_node_int, allocation_or_node_floatが答えになっている
-        elif type(allocation_or_node_int) is not str: # floatだけまだallocが終わっていない
-            already_spilled_float.add(allocation_or_node_float)
-            lis = memoryAlloc(lis, node_float=allocation_or_node_float, def_float=def_float, use_float=use_float)
-        elif type(allocation_or_node_float) is not str: # intだけまだallocが終わっていない
-            already_spilled_int.add(allocation_or_node_int)
-            lis = memoryAlloc(lis, node_int=allocation_or_node_int, def_int=def_int, use_int=use_int)
-        else:
-            already_spilled_int.add(allocation_or_node_int)
-            already_spilled_float.add(allocation_or_node_float)
-            lis = memoryAlloc(
-                lis,
-                node_int=allocation_or_node_int,
+        spilled_int = allocation_or_node_int if type(allocation_or_node_int) is str else None
+        spilled_float = allocation_or_node_float if type(allocation_or_node_float) is str else None
+        if spilled_int is not None:
+            already_spilled_int.add(spilled_int)
+        if spilled_float is not None:
+            already_spilled_float.add(spilled_float)
+        # 分割してできた変数は使用の直前ごとにrestoreし，初めてspillする変数は生存区間を分割する
+        # どちらでもなければ（分割しない設定か，分割しても変わらなければ），memoryAllocで定義の直後にstore，使用の直前にrestoreする
+        new_lis = lis
+        renamed = {}
+        names = []
+        not_split = {}
+        # li/fli/laなどで同じ値を定義するだけの変数は，store/restoreの代わりに使用の直前でその命令を作り直す（rematerialization）
+        remat = {}
+        for node, typ, already_spilled in ((spilled_int, "int", already_spilled_int), (spilled_float, "float", already_spilled_float)):
+            split_result = None
+            if node is not None:
+                remat[typ] = rematTemplate(ctx, new_lis, node, typ)
+            if node in slots:
+                new_lis = spillPiece(new_lis, node, typ, slots[node], remat[typ])
+            elif node is not None and ctx.options.split:
+                split_result = splitRange(new_lis, node, typ, slots, renamed, remat[typ])
+            if split_result is not None:
+                new_lis, pieces, minimal = split_result
+                names.append(pieces)
+                already_spilled.update(minimal)
+            else:
+                names.append([node] if node is not None else [])
+                if node is not None and node not in slots:
+                    not_split[typ] = node
+        if not_split:
+            if new_lis is not lis:
+                def_int, use_int, def_float, use_float = liveness.getDefAndUse(ctx, new_lis)
+            new_lis = memoryAlloc(
+                new_lis,
+                node_int=not_split.get("int"),
                 def_int=def_int,
                 use_int=use_int,
-                node_float=allocation_or_node_float,
+                node_float=not_split.get("float"),
                 def_float=def_float,
                 use_float=use_float,
+                remat_int=remat.get("int"),
+                remat_float=remat.get("float"),
             )
+        names_int, names_float = names
+
+        # build: 挿入したstore/restoreに合わせて生存解析の結果とグラフを作り直す
+        # CFGはstore/restoreの挿入やrematでブロックの形が変わらないので，命令のidxを付け替えるだけにする
+        line_idx = matchLines(lis, new_lis, renamed)
+        flow.updateInstrs(new_lis, line_idx)
+        if ctx.options.spill_update == "full":
+            graph_int, graph_float, live_int, live_float, def_int, use_int, def_float, use_float = build(ctx, new_lis, flow)
+        else:
+            graph_int, graph_float, live_int, live_float, def_int, use_int, def_float, use_float = updateAfterSpill(
+                ctx, new_lis, line_idx, flow, graph_int, graph_float, live_int, live_float, spilled_int, spilled_float, names_int, names_float
+            )
+            if ctx.options.spill_update == "check":
+                checkUpdate(ctx, new_lis, flow, (graph_int, graph_float, live_int, live_float))
+        lis = new_lis
     
-    # 不要な命令を削除する
-    allocation_or_node_int, allocation_or_node_float = removeUnnecessaryInstr(lis, allocation_or_node_int, allocation_or_node_float)
+    # レジスタが割り当てられなかった（どこでも生きていない）変数を定義する命令を削除する
+    lis, allocation_or_node_int, allocation_or_node_float = deadCode.removeUnallocated(ctx, lis, allocation_or_node_int, allocation_or_node_float)
+
+    return applyAllocation(ctx, lis, allocation_or_node_int, allocation_or_node_float)
 
+# 変数名 => レジスタ名 の割り当てに従ってlisを書き換える（linearScanからも使う）
+def applyAllocation (ctx:context.CompilationContext, lis:List[virtual.Virtual_Asm], allocation_int:Dict[str, str], allocation_float:Dict[str, str]) -> List[virtual.Virtual_Asm]:
     # allocationに従ってlisを書き換える
     for asm in lis:
         for i in range(len(asm.arg_list)):
-            if (asm.arg_list[i].typ == "int") and not (isImmediate(asm.arg_list[i].name)) and not (asm.arg_list[i].name in reglist.SPECIAL_INT_REGS):
-                asm.arg_list[i] = virtual.Reg(allocation_or_node_int[asm.arg_list[i].name], "int")
+            if (asm.arg_list[i].typ == "int") and not asm.arg_list[i].is_imm and not (asm.arg_list[i].name in ctx.special_int_regs):
+                asm.arg_list[i] = virtual.Reg(allocation_int[asm.arg_list[i].name], "int")
 
     # allocationに従ってlisを書き換える
     for asm in lis:
         for i in range(len(asm.arg_list)):
-            if (asm.arg_list[i].typ == "float") and not (isImmediate(asm.arg_list[i].name)) and not (asm.arg_list[i].name in reglist.SPECIAL_FLOAT_REGS):
-                asm.arg_list[i] = virtual.Reg(allocation_or_node_float[asm.arg_list[i].name], "float")
+            if (asm.arg_list[i].typ == "float") and not asm.arg_list[i].is_imm and not (asm.arg_list[i].name in ctx.special_float_regs):
+                asm.arg_list[i] = virtual.Reg(allocation_float[asm.arg_list[i].name], "float")
     
     return lis
 
@@ -339,10 +940,10 @@ def optimizeAllocOfArgs (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_
     arg_regs_int = []
     arg_regs_float = []
     for asm in lis:
-        if asm.instr_name == "* args" and asm.arg_list[0].typ == "int":
+        if asm.op == opcodes.ARGS and asm.arg_list[0].typ == "int":
             arg_regs_int.append(asm.arg_list[0].name)
     for asm in lis:
-        if asm.instr_name == "* args" and asm.arg_list[0].typ == "float":
+        if asm.op == opcodes.ARGS and asm.arg_list[0].typ == "float":
             arg_regs_float.append(asm.arg_list[0].name)
     
     # 引数の割り当て
@@ -2,16 +2,26 @@
 #
 # reglist.py
 # 使えるレジスタのリストのデータ（先頭から優先的に使われていく）
+# ここのリストは書き換えない（定数レジスタを取り除いたリストはcontext.CompilationContext.setConstRegsで作る）
 #
 #--------------------------------------------------
 
-# 使用方法が決まっているのでレジスタ割り当て等で解析に含めない特別なレジスタの集合
-SPECIAL_INT_REGS = {
-    'hp', 'x0', 'x25', 'x26', 'x27'
-}
-SPECIAL_FLOAT_REGS = {
-    'f25', 'f26', 'f27'
-}
+# 定数 => その値を常に保持している定数レジスタ（--const-regs fixedのときの表）
+# 0はx0で固定。プログラムごとの表はcontext.CompilationContext.setConstRegsで設定し，
+# 使用方法が決まっているのでレジスタ割り当て等で解析に含めない特別なレジスタの集合（hp, x0と定数レジスタ）もそこで作る
+FIXED_INT_CONST_REGS = {0: "x0", 1: "x25", 2: "x26", 3: "x27"}
+FIXED_FLOAT_CONST_REGS = {0.0: "f25", 1.0: "f26", 2.0: "f27"}
+
+# 定数レジスタとして使うレジスタの候補（先頭から順に使う）
+# x25,x26,x27,f25,f26,f27より多く使う場合は,callee-saveのレジスタを後ろから割り当て用のリストから外して使う
+CONST_INT_REGS = [
+    'x25', 'x26', 'x27',
+    'x24', 'x23', 'x22', 'x21', 'x20', 'x19', 'x18',
+]
+CONST_FLOAT_REGS = [
+    'f25', 'f26', 'f27',
+    'f24', 'f23', 'f22', 'f21', 'f20', 'f19', 'f18',
+]
 
 INT_REGS_FOR_FUNC = [
     # caller-saveのレジスタ
@@ -58,4 +68,10 @@ FLOAT_REGS_FOR_MAIN = [
     # 引数レジスタはできるだけ使わない方が良い
     'fa0', 'fa1', 'fa2', 'fa3', 'fa4', 'fa5', 'fa6', 'fa7',
 ]
-FLOAT_REGS_FOR_MAIN_RESPONSIBLE_IDX = 9
\ No newline at end of file
+FLOAT_REGS_FOR_MAIN_RESPONSIBLE_IDX = 9
+
+# regsからremovedを取り除いたリストと,それに合わせてずらしたRESPONSIBLE_IDXを返す
+def removeRegs (regs, responsible_idx, removed):
+    new_regs = [reg for reg in regs if reg not in removed]
+    new_idx = len([reg for reg in regs[:responsible_idx] if reg not in removed])
+    return new_regs, new_idx
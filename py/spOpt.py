@@ -8,65 +8,62 @@
 
 from typing import List
 import virtual
+import opcodes
 
-def spOpt (lis:List[virtual.Virtual_Asm], height_dif:int) -> List[virtual.Virtual_Asm]:
+# label_posは関数全体の命令列のcfg.labelPositions，offsetはlisがその命令列の何行目から始まるか（if文の節を処理するときに使う）
+def spOpt (lis:List[virtual.Virtual_Asm], height_dif:int, label_pos, offset:int = 0) -> List[virtual.Virtual_Asm]:
     new_lis = []
     i = 0
     while i < len(lis):
         asm = lis[i]
-        if asm.instr_name == "beq" or asm.instr_name == "bge" or asm.instr_name == "blt" or asm.instr_name == "bfeq" or asm.instr_name == "bfle" or asm.instr_name == "bflt":
+        if opcodes.INFO[asm.op].flags & opcodes.IS_BRANCH:
             new_lis.append(asm)
             i += 1
-            num = asm.arg_list[2].name.replace("then", "") # thenの後についている数字の取得
+            then_label = asm.arg_list[2].name
+            endif_label = "endif" + then_label.replace("then", "") # thenの後についている数字と同じ数字のendif
+            then_pos = label_pos[then_label] - offset
+            endif_pos = label_pos[endif_label] - offset
             # else節部分のアセンブリを取得
-            else_lis = []
-            while "then" + str(num) + ":" != lis[i].instr_name:
-                else_lis.append(lis[i])
-                i += 1
+            else_lis = spOpt(lis[i:then_pos], height_dif, label_pos, offset + i)
             # then節部分のアセンブリを取得
-            then_lis = []
-            while "endif" + str(num) + ":" != lis[i].instr_name:
-                then_lis.append(lis[i])
-                i += 1
-            
-            else_lis = spOpt(else_lis, height_dif)
-            then_lis = spOpt(then_lis, height_dif)
+            then_lis = spOpt(lis[then_pos:endif_pos], height_dif, label_pos, offset + then_pos)
+            i = endif_pos
 
             new_lis += else_lis + then_lis
             height_dif = 0
         
-        elif asm.instr_name == "addi":
+        elif asm.op == opcodes.ADDI:
             if asm.arg_list[0].name == "sp" and asm.arg_list[1].name == "sp":
                 height_dif += int(asm.arg_list[2].name)
             else:
                 new_lis.append(asm)
             i += 1
 
-        elif asm.instr_name == "lw" or asm.instr_name == "flw":
+        elif asm.op == opcodes.LW or asm.op == opcodes.FLW:
             if asm.arg_list[1].name == "sp":
-                new_lis.append(virtual.Virtual_Asm(asm.instr_name, asm.arg_count, [asm.arg_list[0], asm.arg_list[1], virtual.Reg(str(int(asm.arg_list[2].name) + height_dif), "int")]))
+                new_lis.append(virtual.Virtual_Asm(asm.op, asm.arg_count, [asm.arg_list[0], asm.arg_list[1], virtual.Reg(str(int(asm.arg_list[2].name) + height_dif), "int")]))
             else:
                 new_lis.append(asm)
             i += 1
 
-        elif asm.instr_name == "sw" or asm.instr_name == "fsw":
+        elif asm.op == opcodes.SW or asm.op == opcodes.FSW:
             if asm.arg_list[0].name == "sp":
-                new_lis.append(virtual.Virtual_Asm(asm.instr_name, asm.arg_count, [asm.arg_list[0], asm.arg_list[1], virtual.Reg(str(int(asm.arg_list[2].name) + height_dif), "int")]))
+                new_lis.append(virtual.Virtual_Asm(asm.op, asm.arg_count, [asm.arg_list[0], asm.arg_list[1], virtual.Reg(str(int(asm.arg_list[2].name) + height_dif), "int")]))
             else:
                 new_lis.append(asm)
             i += 1
         
-        elif asm.instr_name == "vlw" or asm.instr_name == "vsw":
+        elif asm.op == opcodes.VLW or asm.op == opcodes.VSW:
             if asm.arg_list[0].name == "sp":
-                new_lis.append(virtual.Virtual_Asm(asm.instr_name, asm.arg_count, [asm.arg_list[0], asm.arg_list[1], asm.arg_list[2], asm.arg_list[3], asm.arg_list[4], virtual.Reg(str(int(asm.arg_list[5].name) + height_dif), "int"), asm.arg_list[6]]))
+                new_lis.append(virtual.Virtual_Asm(asm.op, asm.arg_count, [asm.arg_list[0], asm.arg_list[1], asm.arg_list[2], asm.arg_list[3], asm.arg_list[4], virtual.Reg(str(int(asm.arg_list[5].name) + height_dif), "int"), asm.arg_list[6]]))
             else:
                 new_lis.append(asm)
             i += 1
 
         # 今までheight_difで調整してきたが、関数の呼び出し直前では、spを実際に変更する必要がある
-        elif asm.instr_name == "call" or asm.instr_name == "jalr":
+        elif asm.op == opcodes.CALL or asm.op == opcodes.JALR:
             if height_dif != 0:
-                new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(height_dif), "int")]))
+                new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(height_dif), "int")]))
                 height_dif = 0
             new_lis.append(asm)
             i += 1
@@ -77,12 +74,12 @@ def spOpt (lis:List[virtual.Virtual_Asm], height_dif:int) -> List[virtual.Virtua
 
     # 関数が返るときは、spの計算をする（基本的にはnew_lisの最後に入れればよく、j,ret,jalrがあるときは一個前に入れる）
     if height_dif != 0:
-        if new_lis[-1].instr_name in {"ret", "j", "jalr"}:
-            if len(new_lis) >= 2 and new_lis[-2].instr_name in {"ret", "j", "jalr"}:
-                new_lis.insert(-2, virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(height_dif), "int")]))
+        if new_lis[-1].op in {opcodes.RET, opcodes.J, opcodes.JALR}:
+            if len(new_lis) >= 2 and new_lis[-2].op in {opcodes.RET, opcodes.J, opcodes.JALR}:
+                new_lis.insert(-2, virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(height_dif), "int")]))
             else:
-                new_lis.insert(-1, virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(height_dif), "int")]))
+                new_lis.insert(-1, virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(height_dif), "int")]))
         else:
-            new_lis.append(virtual.Virtual_Asm("addi", 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(height_dif), "int")]))
+            new_lis.append(virtual.Virtual_Asm(opcodes.ADDI, 3, [virtual.Reg("sp", "int"), virtual.Reg("sp", "int"), virtual.Reg(str(height_dif), "int")]))
 
     return new_lis
@@ -0,0 +1,77 @@
+#--------------------------------------------------
+#
+# stackSlot.py
+# store, restoreする変数へのスタック上の位置（スロット）の割り当て
+#
+# 実装の方針：
+# スロットを変数と見て，storeを定義，restoreを使用とした生存解析を行い（liveness.solveLiveSets），
+# storeする変数と，そのstoreの直後に生きているスロットの間に枝を張った干渉グラフを彩色する
+# 生きている範囲が重ならない変数は同じスロットを使うので，変数の数ではなく同時に生きている変数の数だけスロットがあればよい
+# 彩色は初めてstoreする命令の順に，隣接する変数が使っていない一番小さい番号のスロットを選ぶ（番号kのスロットはspから-(k+1)*4の位置）
+# 関数呼び出しでは，その直後に生きているスロットのうち最も大きい番号のスロットまでをspの移動で守る（呼び出しの直後に生きていないスロットは呼び出し先が上書きしてよい）
+# expandは 変数名 => spからの位置 の辞書を引くだけなので，restoreの展開は定数時間で済み，if/elseの節ごとにスタックを複製する必要もない
+#
+#--------------------------------------------------
+
+import virtual
+import opcodes
+import liveness
+import cfg
+import error
+from typing import List, Dict, Set, Tuple
+
+# スロットの大きさ（バイト）
+SLOT_SIZE = 4
+
+# 命令ごとに，storeするスロットの集合とrestoreするスロットの集合を作る
+def getSlotDefAndUse (lis:List[virtual.Virtual_Asm], instr_idx_list:List[int]) -> Tuple[Dict[int, frozenset], Dict[int, frozenset]]:
+    defs, uses = {}, {}
+    empty = frozenset()
+    for i in instr_idx_list:
+        asm = lis[i]
+        defs[i] = frozenset((asm.arg_list[1].name,)) if asm.op == opcodes.STORE else empty
+        uses[i] = frozenset((asm.arg_list[1].name,)) if asm.op == opcodes.RESTORE else empty
+    return defs, uses
+
+# スロットの割り当て
+# 返り値は 変数名 => spからの位置 の辞書と，関数呼び出しの命令のidx => 呼び出しの前にspを動かす語数 の辞書
+# graphにlisのCFGを渡すとそれを使う（省略したときは作る）
+def assignStackSlots (lis:List[virtual.Virtual_Asm], graph:cfg.CFG=None) -> Tuple[Dict[str, int], Dict[int, int]]:
+    if not any(asm.op == opcodes.STORE for asm in lis): # storeがなければspを動かす必要はない
+        return {}, {i : 0 for i, asm in enumerate(lis) if opcodes.INFO[asm.op].flags & opcodes.IS_CALL}
+    if graph is None:
+        graph = cfg.CFG(lis)
+    instr_idx_list = graph.instr_idx_list
+    defs, uses = getSlotDefAndUse(lis, instr_idx_list)
+    live = liveness.solveLiveSets(graph.blocks, cfg.postOrder(graph.blocks), instr_idx_list, defs, uses)
+
+    # 干渉グラフ（頂点は初めてstoreする命令の順）
+    adj: Dict[str, Set[str]] = {}
+    for i in instr_idx_list:
+        for name in defs[i]:
+            adj.setdefault(name, set())
+            for other in live[i]:
+                if other != name:
+                    adj[name].add(other)
+                    adj.setdefault(other, set()).add(name)
+    for i in instr_idx_list:
+        for name in uses[i]:
+            if name not in adj:
+                error.error("Variable {} is restored but never stored.".format(name))
+
+    # 彩色
+    slot: Dict[str, int] = {}
+    for name in adj:
+        used = {slot[other] for other in adj[name] if other in slot}
+        k = 0
+        while k in used:
+            k += 1
+        slot[name] = k
+
+    # 関数呼び出しの直後に生きているスロットを守るのに必要な語数
+    frame = {}
+    for i in instr_idx_list:
+        if opcodes.INFO[lis[i].op].flags & opcodes.IS_CALL:
+            frame[i] = max((slot[name] + 1 for name in live[i]), default=0)
+
+    return {name : -(k + 1) * SLOT_SIZE for name, k in slot.items()}, frame
@@ -7,26 +7,28 @@
 
 from typing import List
 import virtual
+import opcodes
 
 # 末尾かどうかを判定する
-def isTail (instr_idx:int, lis:List[virtual.Virtual_Asm]) -> bool:
+# label_posはcfg.labelPositions(lis)
+def isTail (instr_idx:int, lis:List[virtual.Virtual_Asm], label_pos) -> bool:
     try:
         next_instr_idx = instr_idx + 1
         while True:
             # 次の命令がjであれば、そのジャンプ先をみに行く
-            if lis[next_instr_idx].instr_name == "j":
+            if lis[next_instr_idx].op == opcodes.J:
                 j_label = lis[next_instr_idx].arg_list[0].name # ジャンプ先のアドレスを取得
-                while next_instr_idx < len(lis) and lis[next_instr_idx].instr_name != j_label + ":": # ジャンプ先のアドレスに辿り着くまでスキップ
-                    next_instr_idx += 1
+                label_idx = label_pos.get(j_label, len(lis))
+                next_instr_idx = label_idx if label_idx > next_instr_idx else len(lis) # ジャンプ先のアドレスまでスキップ（前方にしか探さない）
 
             # 次の命令がラベルや意味のない命令であれば、その次をみに行く
-            elif ":" in lis[next_instr_idx].instr_name or lis[next_instr_idx].instr_name == "nop": 
+            elif lis[next_instr_idx].op == opcodes.LABEL or lis[next_instr_idx].op == opcodes.NOP: 
                 next_instr_idx += 1
             else:
                 break
         
         # 辿り着いた先がretやret_unitであれば末尾である
-        if lis[next_instr_idx].instr_name in {"ret", "ret_unit"}:
+        if lis[next_instr_idx].op in {opcodes.RET, opcodes.RET_UNIT}:
             return True
         else: # それ以外は末尾ではない
             return False
@@ -34,25 +36,26 @@ def isTail (instr_idx:int, lis:List[virtual.Virtual_Asm]) -> bool:
         return False
 
 # メイン部分
-def tailCallOpt (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
+# label_posはlisのCFGのlabel_pos（命令を1つずつ置き換えるだけなので，返すリストでもラベルの位置は変わらない）
+def tailCallOpt (lis:List[virtual.Virtual_Asm], label_pos) -> List[virtual.Virtual_Asm]:
     new_lis = []
     for i in range(len(lis)):
-        if lis[i].instr_name in {
-            "just_call_dir",
-            "just_call_cls",
-            "recv_ret_val_dir_int",
-            "recv_ret_val_dir_float",
-            "recv_ret_val_cls_int",
-            "recv_ret_val_cls_float"
-        } and isTail(i, lis):
-            if "recv_ret_val_dir" in lis[i].instr_name:
-                new_lis.append(virtual.Virtual_Asm("just_call_dir_and_jump", lis[i].arg_count - 1, lis[i].arg_list[1:]))
-            elif "recv_ret_val_cls" in lis[i].instr_name:
-                new_lis.append(virtual.Virtual_Asm("just_call_cls_and_jump", lis[i].arg_count - 1, lis[i].arg_list[1:]))
-            elif lis[i].instr_name == "just_call_dir":
-                new_lis.append(virtual.Virtual_Asm("just_call_dir_and_jump", lis[i].arg_count, lis[i].arg_list))
-            elif lis[i].instr_name == "just_call_cls":
-                new_lis.append(virtual.Virtual_Asm("just_call_cls_and_jump", lis[i].arg_count, lis[i].arg_list))
+        if lis[i].op in {
+            opcodes.JUST_CALL_DIR,
+            opcodes.JUST_CALL_CLS,
+            opcodes.RECV_RET_VAL_DIR_INT,
+            opcodes.RECV_RET_VAL_DIR_FLOAT,
+            opcodes.RECV_RET_VAL_CLS_INT,
+            opcodes.RECV_RET_VAL_CLS_FLOAT
+        } and isTail(i, lis, label_pos):
+            if lis[i].op == opcodes.RECV_RET_VAL_DIR_INT or lis[i].op == opcodes.RECV_RET_VAL_DIR_FLOAT:
+                new_lis.append(virtual.Virtual_Asm(opcodes.JUST_CALL_DIR_AND_JUMP, lis[i].arg_count - 1, lis[i].arg_list[1:]))
+            elif lis[i].op == opcodes.RECV_RET_VAL_CLS_INT or lis[i].op == opcodes.RECV_RET_VAL_CLS_FLOAT:
+                new_lis.append(virtual.Virtual_Asm(opcodes.JUST_CALL_CLS_AND_JUMP, lis[i].arg_count - 1, lis[i].arg_list[1:]))
+            elif lis[i].op == opcodes.JUST_CALL_DIR:
+                new_lis.append(virtual.Virtual_Asm(opcodes.JUST_CALL_DIR_AND_JUMP, lis[i].arg_count, lis[i].arg_list))
+            elif lis[i].op == opcodes.JUST_CALL_CLS:
+                new_lis.append(virtual.Virtual_Asm(opcodes.JUST_CALL_CLS_AND_JUMP, lis[i].arg_count, lis[i].arg_list))
         else:
             new_lis.append(lis[i])
     return new_lis
@@ -6,6 +6,7 @@
 #--------------------------------------------------
 
 import virtual
+import opcodes
 from typing import List
 
 VECTOR_LENGTH = 4
@@ -19,10 +20,10 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
 
         # 連続するlwを圧縮
         if (
-            (asm.instr_name == "lw" or asm.instr_name == "flw") and
+            (asm.op == opcodes.LW or asm.op == opcodes.FLW) and
             (asm.arg_list[0].name != asm.arg_list[1].name) and
             (i+1 < len(lis)) and
-            (lis[i+1].instr_name == "lw" or lis[i+1].instr_name == "flw") and
+            (lis[i+1].op == opcodes.LW or lis[i+1].op == opcodes.FLW) and
             asm.arg_list[1].name == lis[i+1].arg_list[1].name and
             abs(int(asm.arg_list[2].name) - int(lis[i+1].arg_list[2].name)) == 4
         ):
@@ -36,7 +37,7 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
             while i < len(lis):
                 # lwの次の命令もlwであり，基準レジスタと代入レジスタが同じではなく，オフセットが前の命令の+4になっていて，基準レジスタが同じ場合
                 if (
-                    (lis[i].instr_name == "lw" or lis[i].instr_name == "flw") and
+                    (lis[i].op == opcodes.LW or lis[i].op == opcodes.FLW) and
                     (lis[i].arg_list[0].name != lis[i].arg_list[1].name) and
                     int(lis[i].arg_list[2].name) == int(lw_lis[-1].arg_list[2].name) + 4 and
                     lis[i].arg_list[1].name == lw_lis[-1].arg_list[1].name
@@ -49,7 +50,7 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
                         break
                 # lwの次の命令もlwであり，オフセットが前の命令の-4になっていて，基準レジスタが同じ場合
                 elif (
-                    (lis[i].instr_name == "lw" or lis[i].instr_name == "flw") and
+                    (lis[i].op == opcodes.LW or lis[i].op == opcodes.FLW) and
                     (lis[i].arg_list[0].name != lis[i].arg_list[1].name) and
                     int(lis[i].arg_list[2].name) == int(lw_lis[-1].arg_list[2].name) - 4 and
                     lis[i].arg_list[1].name == lw_lis[-1].arg_list[1].name
@@ -71,7 +72,7 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
                 lw_len = len(lw_lis)
                 for j in range(res):
                     lw_lis.append(virtual.Virtual_Asm(
-                        "lw",
+                        opcodes.LW,
                         3,
                         [
                             virtual.Reg("x0", "int"),
@@ -85,16 +86,16 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
                 lw_lis.reverse()
                 mask.reverse()
             
-            new_lis.append(virtual.Virtual_Asm("vlw", VECTOR_LENGTH + 3, [lw_lis[0].arg_list[1]] + [
+            new_lis.append(virtual.Virtual_Asm(opcodes.VLW, VECTOR_LENGTH + 3, [lw_lis[0].arg_list[1]] + [
                 lw_asm.arg_list[0] for lw_asm in lw_lis
             ] + [lw_lis[0].arg_list[2], virtual.Reg("".join(list(map(str, mask))), "int")]))
         
         # 連続するswを圧縮
         elif (
-            (asm.instr_name == "sw" or asm.instr_name == "fsw") and
+            (asm.op == opcodes.SW or asm.op == opcodes.FSW) and
             (lis[i].arg_list[0].name != lis[i].arg_list[1].name) and
             (i+1 < len(lis)) and
-            (lis[i+1].instr_name == "sw" or lis[i+1].instr_name == "fsw") and
+            (lis[i+1].op == opcodes.SW or lis[i+1].op == opcodes.FSW) and
             asm.arg_list[0].name == lis[i+1].arg_list[0].name and
             abs(int(asm.arg_list[2].name) - int(lis[i+1].arg_list[2].name)) == 4
         ):
@@ -108,7 +109,7 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
             while i < len(lis):
                 # swの次の命令もswであり，基準レジスタと代入レジスタが同じではなく，オフセットが前の命令の+4になっていて，基準レジスタが同じ場合
                 if (
-                    (lis[i].instr_name == "sw" or lis[i].instr_name == "fsw") and
+                    (lis[i].op == opcodes.SW or lis[i].op == opcodes.FSW) and
                     (lis[i].arg_list[0].name != lis[i].arg_list[1].name) and
                     int(lis[i].arg_list[2].name) == int(sw_lis[-1].arg_list[2].name) + 4 and
                     lis[i].arg_list[0].name == sw_lis[-1].arg_list[0].name
@@ -121,7 +122,7 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
                         break
                 # swの次の命令もswであり，オフセットが前の命令の-4になっていて，基準レジスタが同じ場合
                 elif (
-                    (lis[i].instr_name == "sw" or lis[i].instr_name == "fsw") and
+                    (lis[i].op == opcodes.SW or lis[i].op == opcodes.FSW) and
                     (lis[i].arg_list[0].name != lis[i].arg_list[1].name) and
                     int(lis[i].arg_list[2].name) == int(sw_lis[-1].arg_list[2].name) - 4 and
                     lis[i].arg_list[0].name == sw_lis[-1].arg_list[0].name
@@ -143,7 +144,7 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
                 sw_len = len(sw_lis)
                 for j in range(res):
                     sw_lis.append(virtual.Virtual_Asm(
-                        "sw",
+                        opcodes.SW,
                         3,
                         [
                             sw_lis[-1].arg_list[0],
@@ -157,7 +158,7 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
                 sw_lis.reverse()
                 mask.reverse()
             
-            new_lis.append(virtual.Virtual_Asm("vsw", VECTOR_LENGTH + 3, [sw_lis[0].arg_list[0]] + [
+            new_lis.append(virtual.Virtual_Asm(opcodes.VSW, VECTOR_LENGTH + 3, [sw_lis[0].arg_list[0]] + [
                 sw_asm.arg_list[1] for sw_asm in sw_lis
             ] + [sw_lis[0].arg_list[2], virtual.Reg("".join(list(map(str, mask))), "int")]))
 
@@ -172,21 +173,21 @@ def replace (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
 def leftAlign (lis:List[virtual.Virtual_Asm]) -> List[virtual.Virtual_Asm]:
     i = 0
     while i < len(lis):
-        if lis[i].instr_name == "vsw" or lis[i].instr_name == "vlw":
+        if lis[i].op == opcodes.VSW or lis[i].op == opcodes.VLW:
             if lis[i].arg_list[6].name == "0011":
                 lis[i].arg_list[1] = virtual.Reg(lis[i].arg_list[3].name, lis[i].arg_list[3].typ)
                 lis[i].arg_list[2] = virtual.Reg(lis[i].arg_list[4].name, lis[i].arg_list[4].typ)
                 lis[i].arg_list[3] = virtual.Reg("x0", "int")
                 lis[i].arg_list[4] = virtual.Reg("x0", "int")
-                lis[i].arg_list[6].name = "1100"
-                lis[i].arg_list[5].name = str(int(lis[i].arg_list[5].name) + 8)
+                lis[i].arg_list[6] = virtual.Reg("1100", lis[i].arg_list[6].typ)
+                lis[i].arg_list[5] = virtual.Reg(str(int(lis[i].arg_list[5].name) + 8), lis[i].arg_list[5].typ)
             elif lis[i].arg_list[6].name == "0111":
                 lis[i].arg_list[1] = virtual.Reg(lis[i].arg_list[2].name, lis[i].arg_list[2].typ)
                 lis[i].arg_list[2] = virtual.Reg(lis[i].arg_list[3].name, lis[i].arg_list[3].typ)
                 lis[i].arg_list[3] = virtual.Reg(lis[i].arg_list[4].name, lis[i].arg_list[4].typ)
                 lis[i].arg_list[4] = virtual.Reg("x0", "int")
-                lis[i].arg_list[6].name = "1110"
-                lis[i].arg_list[5].name = str(int(lis[i].arg_list[5].name) + 4)
+                lis[i].arg_list[6] = virtual.Reg("1110", lis[i].arg_list[6].typ)
+                lis[i].arg_list[5] = virtual.Reg(str(int(lis[i].arg_list[5].name) + 4), lis[i].arg_list[5].typ)
         i += 1
     
     return lis
\ No newline at end of file
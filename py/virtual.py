@@ -13,14 +13,20 @@
 # という形になることで初めて
 # add var, x, y
 # とすればよいのだとわかる。すなわち、{}の部分は一旦放置し（このプログラム内ではこれを"!"と表している）、Letの処理のときに{}の部分を置き換える、という方針で計算を進めていけば良い。
+# ただし、Letのe1の命令列全体から!を探して置き換えると、e1が大きいとき（長いLetの連鎖やIfの節）に全体で2乗の時間がかかる。
+# そこで、Letのe1を変換するときに代入先dest（Letの変数）を渡していき、If・Let・MakeCls・LetTupleでは最後に評価される部分（Ifの両方の節、e2、e）にそのまま渡す。
+# 子を持たないノードの命令列では!は最後の命令の先頭の引数にしかないので、destが渡されていればその1命令だけを置き換えれば良い。
 #
 #--------------------------------------------------
 
 from typing import List, Tuple
 from struct import *
+import sys
+import weakref
 import closure
-import reglist
 import error
+import context
+import opcodes
 
 # 仮想レジスタの型
 # int: 整数
@@ -28,54 +34,74 @@ import error
 # (): unit型
 # label: ラベル
 # これら4種類のどれかに統一（todo: 本当にできているか確認）
+# (name, typ)が同じRegは1つのオブジェクトを共有する（flyweight）ので，作成後に書き換えてはいけない
+# 名前を変えたいときは，新しくRegを作って命令の引数を差し替える
+# 比較は(name, typ)で行うので，同じ名前のRegが別のオブジェクトになっても（別々のスレッドで同時に作られたときなど）結果は変わらない
+# is_imm: 名前に英字を含まない（即値やマスクなどの）Regか，指数表記の小数（1e-07など）のRegかどうか（作成時に一度だけ判定しておく）
 class Reg:
-    def __init__ (self, name:str, typ:str):
-        self.name = name
-        self.typ = typ
+    __slots__ = ("name", "typ", "is_imm", "__weakref__")
+    def __new__ (cls, name:str, typ:str):
+        key = (name, typ)
+        reg = reg_table.get(key)
+        if reg is None:
+            reg = object.__new__(cls)
+            object.__setattr__(reg, "name", sys.intern(name))
+            object.__setattr__(reg, "typ", typ)
+            object.__setattr__(reg, "is_imm", isImmName(name))
+            reg_table[key] = reg
+        return reg
+    def __eq__ (self, other) -> bool:
+        return self is other or (type(other) is Reg and self.name == other.name and self.typ == other.typ)
+    def __hash__ (self) -> int:
+        return hash((self.name, self.typ))
+    def __setattr__ (self, attr:str, value):
+        error.error("Reg is immutable: cannot set {} of {}.".format(attr, self.name))
+    # 共有されているオブジェクトなので,コピーしても同じオブジェクトを返す
+    def __copy__ (self):
+        return self
+    def __deepcopy__ (self, memo):
+        return self
+    def __reduce__ (self):
+        return (Reg, (self.name, self.typ))
+
+# 即値の名前かどうか（小数の定数はstrで名前にするので，小さい値や大きい値は1e-07のような指数表記になる）
+def isImmName (name:str) -> bool:
+    if not any(letter.isalpha() for letter in name):
+        return True
+    if name[0] not in "0123456789-.":
+        return False
+    try:
+        float(name)
+        return True
+    except ValueError:
+        return False
+
+# (name, typ) => Reg の表
+# どのコンパイルからも参照されなくなったRegは表からも消えるので，同じプロセスでコンパイルを続けても表は大きくならない
+reg_table = weakref.WeakValueDictionary()
 
 # 仮想アセンブリの型
+# opは命令の種類を表すopcodesのオペコード（命令名の文字列はemitで出力するときにだけopcodes.INFO[op].nameから取り出す）
+# def_use_cacheはliveness.getDefAndUseFromVirtualAsmが計算結果を置いておく場所で，(op, 計算時のarg_listの写し, 結果)が入る
+# opやarg_listが書き換えられると写しと一致しなくなるので，次に参照されたときに計算し直される
 class Virtual_Asm:
-    def __init__ (self, instr_name:str, arg_count:int, arg_list:List[Reg]):
-        self.instr_name = instr_name
+    __slots__ = ("op", "arg_count", "arg_list", "def_use_cache")
+    def __init__ (self, op:int, arg_count:int, arg_list:List[Reg]):
+        self.op = op
         self.arg_count = arg_count
         self.arg_list = arg_list
+        self.def_use_cache = None
 
-# 変数の名前から変数の型への写像
-class Env:
-    def __init__ (self):
-        self.env = {}
-    def get (self, arg_name:str) -> str:
-        if arg_name in self.env:
-            return self.env[arg_name]
-        elif arg_name in reglist.SPECIAL_INT_REGS: # 特別な用途の整数レジスタの名前が来た場合は、envに入っていなくてもintとわかる
-            return "int"
-        elif arg_name in reglist.SPECIAL_FLOAT_REGS: # 特別な用途の小数レジスタの名前が来た場合は、envに入っていなくてもfloatとわかる
-            return "float"
-        else: # 型が登録されていないレジスタ
-            error.error("Warning: {} is not added to env.".format(arg_name))
-    def set (self, arg_name:str, typ:str):
-        self.env[arg_name] = typ
-
-# 変数名を一意にするために、以下の変数をカウンターとして利用する
-flt_cnt = 0
-if_cnt = 0
-tuple_cnt = 0
-get_cnt = 0
-put_cnt = 0
-fundef_cnt = 0
-appcls_cnt = 0
-appdir_cnt = 0
-makecls_cnt = 0
-
-# Envオブジェクトの作成
-env = Env()
+# ラベルの行の仮想アセンブリを作る（ラベル名はarg_list[0]に持つ）
+def makeLabel (name:str) -> Virtual_Asm:
+    return Virtual_Asm(opcodes.LABEL, 1, [Reg(name, "label")])
 
 # arg_listをintのリストとfloatのリストに分割する
-def separateIntAndFloat (args_list:List[str]) -> Tuple[List[str], List[str]]:
+def separateIntAndFloat (ctx:context.CompilationContext, args_list:List[str]) -> Tuple[List[str], List[str]]:
     int_list = []
     float_list = []
     for arg in args_list:
-        typ = env.get(arg)
+        typ = ctx.env.get(arg)
         if typ == "float":
             float_list.append(arg)
         elif typ == "()":
@@ -84,51 +110,56 @@ def separateIntAndFloat (args_list:List[str]) -> Tuple[List[str], List[str]]:
             int_list.append(arg)
     return int_list, float_list
 
-# 仮想命令のリストlisのうち、変数の名前が!になっているところを引数newで置き換える処理
-def replaceAllExcl (lis:List[Virtual_Asm], new:Reg) -> List[Virtual_Asm]:
-    for virtual_asm in lis:
-        # Getに対する処理
-        if virtual_asm.instr_name == "lw_or_flw":
-            if new.typ == "float": # 置き換えたい変数newの型はfloatなので、flwを使う
-                virtual_asm.instr_name = "flw"
-                virtual_asm.arg_list[0] = new
-            else: # 置き換えたい変数newの型はfloat以外なので、lwを使う
-                virtual_asm.instr_name = "lw"
-                virtual_asm.arg_list[0] = Reg(new.name, "int")
-
-        # Appclsの返り値に対する処理
-        elif virtual_asm.instr_name == "app_cls":
-            if new.typ == "float":
-                virtual_asm.instr_name = "recv_ret_val_cls_float"
-                virtual_asm.arg_list[0] = new
-            elif new.typ == "()": # 置き換えたい変数の型はUnit、つまり返り値を格納する必要がない
-                virtual_asm.instr_name = "just_call_cls"
-                virtual_asm.arg_list.pop(0)
-                virtual_asm.arg_count -= 1
-            else:
-                virtual_asm.instr_name = "recv_ret_val_cls_int"
-                virtual_asm.arg_list[0] = Reg(new.name, "int")
-        
-        # Appdirの返り値に対する処理
-        elif virtual_asm.instr_name == "app_dir": 
-            if new.typ == "float":
-                virtual_asm.instr_name = "recv_ret_val_dir_float"
-                virtual_asm.arg_list[0] = new
-            elif new.typ == "()":
-                virtual_asm.instr_name = "just_call_dir"
-                virtual_asm.arg_list.pop(0)
-                virtual_asm.arg_count -= 1
-            else:
-                virtual_asm.instr_name = "recv_ret_val_dir_int"
-                virtual_asm.arg_list[0] = Reg(new.name, "int")
-        
-        # その他の命令に対する処理
+# 仮想命令virtual_asmのうち、変数の名前が!になっているところを引数newで置き換える処理
+def replaceExcl (ctx:context.CompilationContext, virtual_asm:Virtual_Asm, new:Reg):
+    # Getに対する処理
+    if virtual_asm.op == opcodes.LW_OR_FLW:
+        if new.typ == "float": # 置き換えたい変数newの型はfloatなので、flwを使う
+            virtual_asm.op = opcodes.FLW
+            virtual_asm.arg_list[0] = new
+        else: # 置き換えたい変数newの型はfloat以外なので、lwを使う
+            virtual_asm.op = opcodes.LW
+            virtual_asm.arg_list[0] = Reg(new.name, "int")
+
+    # Appclsの返り値に対する処理
+    elif virtual_asm.op == opcodes.APP_CLS:
+        if new.typ == "float":
+            virtual_asm.op = opcodes.RECV_RET_VAL_CLS_FLOAT
+            virtual_asm.arg_list[0] = new
+        elif new.typ == "()": # 置き換えたい変数の型はUnit、つまり返り値を格納する必要がない
+            virtual_asm.op = opcodes.JUST_CALL_CLS
+            virtual_asm.arg_list.pop(0)
+            virtual_asm.arg_count -= 1
+        else:
+            virtual_asm.op = opcodes.RECV_RET_VAL_CLS_INT
+            virtual_asm.arg_list[0] = Reg(new.name, "int")
+    
+    # Appdirの返り値に対する処理
+    elif virtual_asm.op == opcodes.APP_DIR: 
+        if new.typ == "float":
+            virtual_asm.op = opcodes.RECV_RET_VAL_DIR_FLOAT
+            virtual_asm.arg_list[0] = new
+        elif new.typ == "()":
+            virtual_asm.op = opcodes.JUST_CALL_DIR
+            virtual_asm.arg_list.pop(0)
+            virtual_asm.arg_count -= 1
         else:
-            for i in range(len(virtual_asm.arg_list)):
-                if virtual_asm.arg_list[i].name == "!": # !があればそこをnewで置き換える
-                    typ = "float" if virtual_asm.arg_list[i].typ == "float" else "int"
-                    virtual_asm.arg_list[i] = Reg(new.name, typ)
-                    env.set(new.name, typ)
+            virtual_asm.op = opcodes.RECV_RET_VAL_DIR_INT
+            virtual_asm.arg_list[0] = Reg(new.name, "int")
+    
+    # その他の命令に対する処理
+    else:
+        for i in range(len(virtual_asm.arg_list)):
+            if virtual_asm.arg_list[i].name == "!": # !があればそこをnewで置き換える
+                typ = "float" if virtual_asm.arg_list[i].typ == "float" else "int"
+                virtual_asm.arg_list[i] = Reg(new.name, typ)
+                ctx.env.set(new.name, typ)
+
+# 子を持たないノードの命令列lisについて、!を代入先destで置き換えて返す
+# !は最後の命令にしか現れないので、その命令だけを見れば良い（destがNoneのときは!のまま残す）
+def setDest (ctx:context.CompilationContext, lis:List[Virtual_Asm], dest:Reg) -> List[Virtual_Asm]:
+    if dest is not None and lis != []:
+        replaceExcl(ctx, lis[-1], dest)
     return lis
 
 # 関数の型は、Fun([引数の型], 返り値の型)という構造になっているので、返り値の型の部分を取り出す
@@ -150,204 +181,201 @@ def retrieveRetType (fun_type:str) -> str:
         ret_type = "int"
     return ret_type
 
+# If系のノードについて，branch命令と，branch命令の直後に置く節・thenラベルの後に置く節，ラベルを返す
+def ifHead (ctx:context.CompilationContext, closure_t:closure.Closure_t) -> Tuple[List[Virtual_Asm], closure.Closure_t, closure.Closure_t, str, str]:
+    ctx.if_cnt += 1
+    typ = type(closure_t)
+    # ラベルとしてthenとendifのラベルを作成
+    then_label = "then" + str(ctx.if_cnt)
+    endif_label = "endif" + str(ctx.if_cnt)
+    var1_typ = ctx.env.get(closure_t.var1) # = var2_typ
+    if typ is closure.IfEq or typ is closure.IfNEq:
+        if var1_typ == "float": # 小数同士の比較の場合
+            first_asm = [Virtual_Asm(opcodes.BFEQ, 3, [Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float"), Reg(then_label, "label")])]
+        else: # 整数同士の比較の場合
+            first_asm = [Virtual_Asm(opcodes.BEQ, 3, [Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int"), Reg(then_label, "label")])]
+    elif typ is closure.IfLE:
+        if var1_typ == "float":
+            first_asm = [Virtual_Asm(opcodes.BFLE, 3, [Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float"), Reg(then_label, "label")])]
+        else:
+            first_asm = [Virtual_Asm(opcodes.BGE, 3, [Reg(str(closure_t.var2), "int"), Reg(str(closure_t.var1), "int"), Reg(then_label, "label")])]
+    else:
+        if var1_typ == "float":
+            first_asm = [Virtual_Asm(opcodes.BFLT, 3, [Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float"), Reg(then_label, "label")])]
+        else:
+            first_asm = [Virtual_Asm(opcodes.BLT, 3, [Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int"), Reg(then_label, "label")])]
+    # IfNEqではe1とe2をIfEqのときと逆にする
+    if typ is closure.IfNEq:
+        return first_asm, closure_t.e1, closure_t.e2, then_label, endif_label
+    return first_asm, closure_t.e2, closure_t.e1, then_label, endif_label
+
+# MakeClsについて，クロージャをヒープ上に作る命令列を返す（続くclosure_t.eの命令列は含まない）
+def makeClsHead (ctx:context.CompilationContext, closure_t:closure.MakeCls) -> List[Virtual_Asm]:
+    ctx.makecls_cnt += 1
+    fv_length = len(closure_t.closure.actual_fv)
+    # 関数のアドレスを入れる
+    put_asm = [
+        Virtual_Asm(opcodes.LA, 2, [Reg("makecls" + str(ctx.makecls_cnt), "int"), Reg(closure_t.closure.entry, "label")]),
+        Virtual_Asm(opcodes.SW, 3, [Reg(closure_t.var, "int"), Reg("makecls" + str(ctx.makecls_cnt), "int"), Reg("0", "int")])
+    ]
+    # closureに実際にデータを入れる
+    int_list, float_list = separateIntAndFloat(ctx, closure_t.closure.actual_fv)
+    idx = 0
+    for int_arg in int_list:
+        put_asm.append(Virtual_Asm(opcodes.SW, 3, [Reg(closure_t.var, "int"), Reg(int_arg, "int"), Reg(str(4 * (idx+1)), "int")]))
+        idx += 1
+    for float_arg in float_list:
+        put_asm.append(Virtual_Asm(opcodes.FSW, 3, [Reg(closure_t.var, "int"), Reg(float_arg, "float"), Reg(str(4 * (idx+1)), "int")]))
+        idx += 1
+    # 型環境への追加
+    ctx.env.set(closure_t.var, "int")
+    # put_asm: 関数のアドレスと自由変数をヒープ上に入れる命令列
+    return [
+        Virtual_Asm(opcodes.MV, 2, [Reg(closure_t.var, "int"), Reg("hp", "int")]),
+        Virtual_Asm(opcodes.ADDI, 3, [Reg("hp", "int"), Reg("hp", "int"), Reg(str(4 * (fv_length + 1)), "int")]),
+    ] + put_asm
+
+# LetTupleについて，タプルの要素を取り出す命令列を返す（続くclosure_t.eの命令列は含まない）
+def letTupleHead (ctx:context.CompilationContext, closure_t:closure.LetTuple) -> List[Virtual_Asm]:
+    # タプルの中に含まれる全ての変数の型情報をenvに登録する
+    for var in closure_t.vars:
+        ctx.env.set(var[0], var[1])
+    # int,floatに分けてこの順でメモリから取り出す
+    int_vars, float_vars = separateIntAndFloat(ctx, [var[0] for var in closure_t.vars])
+    first_asm = []
+    idx = 0
+    for int_var in int_vars:
+        first_asm.append(Virtual_Asm(opcodes.LW, 3, [Reg(int_var, "int"), Reg(closure_t.var, "int"), Reg(str(idx * 4), "int")]))
+        idx += 1
+    for float_var in float_vars:
+        first_asm.append(Virtual_Asm(opcodes.FLW, 3, [Reg(float_var, "float"), Reg(closure_t.var, "int"), Reg(str(idx * 4), "int")]))
+        idx += 1
+    return first_asm
+
+# ctx.options.use_explicit_stackがTrueのときはClosure_t2VirtualAsm_iterを使う
+
+# destは結果の代入先（Noneなら!のまま残す）
+def lowerClosure_t (ctx:context.CompilationContext, closure_t:closure.Closure_t, fundefs:List[closure.Fundef], dest:Reg=None) -> List[Virtual_Asm]:
+    if ctx.options.use_explicit_stack:
+        return Closure_t2VirtualAsm_iter(ctx, closure_t, fundefs, dest)
+    return Closure_t2VirtualAsm_loop(ctx, closure_t, fundefs, dest)
+
 # メイン部分のClosure_t2VirtualAsm_loopで計算した結果、!が残ってゴミになっている部分を消去する
 # このようなゴミが残る現象は、例えば単に "Let((Ti1.2,int),Int(3),AppDir(min_caml_debug_int,[Ti1.2,]))" 等を実行したときに起こる。
-def Closure_t2VirtualAsm (closure_t:closure.Closure_t, fundefs:List[closure.Fundef]) -> List[Virtual_Asm]:
-    lis = Closure_t2VirtualAsm_loop(closure_t, fundefs)
+def Closure_t2VirtualAsm (ctx:context.CompilationContext, closure_t:closure.Closure_t, fundefs:List[closure.Fundef]) -> List[Virtual_Asm]:
+    lis = lowerClosure_t(ctx, closure_t, fundefs)
     for i in range(len(lis)):
         virtual_asm = lis[i]
-        if (virtual_asm.instr_name == "mv") and virtual_asm.arg_list[0].name == "!": # mvの受け取る先がなければ，無視
-            lis[i] = Virtual_Asm("nop", 0, [])
-        elif ("app_dir" in virtual_asm.instr_name) and virtual_asm.arg_list[0].name == "!": # app_dirの受け取る先がなければ，関数を呼ぶだけにする
-            virtual_asm.instr_name = "just_call_dir"
+        if (virtual_asm.op == opcodes.MV) and virtual_asm.arg_list[0].name == "!": # mvの受け取る先がなければ，無視
+            lis[i] = Virtual_Asm(opcodes.NOP, 0, [])
+        elif (virtual_asm.op == opcodes.APP_DIR) and virtual_asm.arg_list[0].name == "!": # app_dirの受け取る先がなければ，関数を呼ぶだけにする
+            virtual_asm.op = opcodes.JUST_CALL_DIR
             virtual_asm.arg_count -= 1
             virtual_asm.arg_list.pop(0)
-        elif ("app_cls" in virtual_asm.instr_name) and virtual_asm.arg_list[0].name == "!": # app_clsの受け取る先がなければ，関数を呼ぶだけにする
-            virtual_asm.instr_name = "just_call_cls"
+        elif (virtual_asm.op == opcodes.APP_CLS) and virtual_asm.arg_list[0].name == "!": # app_clsの受け取る先がなければ，関数を呼ぶだけにする
+            virtual_asm.op = opcodes.JUST_CALL_CLS
             virtual_asm.arg_count -= 1
             virtual_asm.arg_list.pop(0)
     return lis
 
 # メイン部分
-def Closure_t2VirtualAsm_loop (closure_t:closure.Closure_t, fundefs:List[closure.Fundef]) -> List[Virtual_Asm]:
-    global flt_cnt, if_cnt, tuple_cnt, get_cnt, put_cnt, fundef_cnt, appcls_cnt, appdir_cnt, makecls_cnt, env
+# 命令はoutの末尾に追加していき，outを返す
+# 子を持つノードでは，最後に評価される部分にdestをそのまま渡す
+def Closure_t2VirtualAsm_loop (ctx:context.CompilationContext, closure_t:closure.Closure_t, fundefs:List[closure.Fundef], dest:Reg=None, out:List[Virtual_Asm]=None) -> List[Virtual_Asm]:
+    if out is None:
+        out = []
+    typ = type(closure_t)
+
+    # first_asm : branch命令
+    # fall_e : branch命令の直後に置く節（IfNEq以外ではelse節）
+    # then_e : thenラベルの後に置く節（IfNEq以外ではthen節）
+    if typ in closure.IF_TYPES:
+        first_asm, fall_e, then_e, then_label, endif_label = ifHead(ctx, closure_t)
+        out += first_asm
+        Closure_t2VirtualAsm_loop(ctx, fall_e, fundefs, dest, out)
+        out.append(Virtual_Asm(opcodes.J, 1, [Reg(endif_label, "label")]))
+        out.append(makeLabel(then_label))
+        Closure_t2VirtualAsm_loop(ctx, then_e, fundefs, dest, out)
+        out.append(makeLabel(endif_label))
+    
+    # e1の代入先はLetの変数
+    elif typ is closure.Let:
+        Closure_t2VirtualAsm_loop(ctx, closure_t.e1, fundefs, Reg(closure_t.var, closure_t.type), out)
+        ctx.env.set(closure_t.var, closure_t.type)
+        Closure_t2VirtualAsm_loop(ctx, closure_t.e2, fundefs, dest, out)
+    
+    # クロージャ生成
+    elif typ is closure.MakeCls:
+        out += makeClsHead(ctx, closure_t)
+        Closure_t2VirtualAsm_loop(ctx, closure_t.e, fundefs, dest, out)
+    
+    # ヒープ上のタプルから要素を取り出す
+    elif typ is closure.LetTuple:
+        out += letTupleHead(ctx, closure_t)
+        Closure_t2VirtualAsm_loop(ctx, closure_t.e, fundefs, dest, out)
+
+    else:
+        out += setDest(ctx, leafAsm(ctx, closure_t), dest)
+    return out
+
+# 子を持たないノードを仮想アセンブリ化する（結果の代入先は!のままにする）
+def leafAsm (ctx:context.CompilationContext, closure_t:closure.Closure_t) -> List[Virtual_Asm]:
     typ = type(closure_t)
 
     if typ is closure.Unit:
-        return [Virtual_Asm("nop", 0, [])]
+        return [Virtual_Asm(opcodes.NOP, 0, [])]
 
     elif typ is closure.Int:
-        return [Virtual_Asm("li", 2, [Reg("!", "int"), Reg(str(closure_t.val), "int")])]
+        return [Virtual_Asm(opcodes.LI, 2, [Reg("!", "int"), Reg(str(closure_t.val), "int")])]
 
     elif typ is closure.Float:
-        flt_cnt += 1
+        ctx.flt_cnt += 1
         if closure_t.val == 0.0: # ゼロレジスタを使って初期化すればよい
             return [
-                Virtual_Asm("fmv.w.x", 2, [Reg("!", "float"), Reg("x0", "int")]),
+                Virtual_Asm(opcodes.FMV_W_X, 2, [Reg("!", "float"), Reg("x0", "int")]),
             ]
         else:
             return [
-                Virtual_Asm("fli", 2, [Reg("!", "float"), Reg(str(closure_t.val), "float")])
+                Virtual_Asm(opcodes.FLI, 2, [Reg("!", "float"), Reg(str(closure_t.val), "float")])
             ]
 
     elif typ is closure.Neg:
-        return [Virtual_Asm("neg", 2, [Reg("!", "int"), Reg(str(closure_t.var), "int")])]
+        return [Virtual_Asm(opcodes.NEG, 2, [Reg("!", "int"), Reg(str(closure_t.var), "int")])]
 
     elif typ is closure.Add:
-        return [Virtual_Asm("add", 3, [Reg("!", "int"), Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int")])]
+        return [Virtual_Asm(opcodes.ADD, 3, [Reg("!", "int"), Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int")])]
     elif typ is closure.Sub:
-        return [Virtual_Asm("sub", 3, [Reg("!", "int"), Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int")])]
+        return [Virtual_Asm(opcodes.SUB, 3, [Reg("!", "int"), Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int")])]
     elif typ is closure.Mul:
-        return [Virtual_Asm("sll", 3, [Reg("!", "int"), Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int")])]
+        return [Virtual_Asm(opcodes.SLL, 3, [Reg("!", "int"), Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int")])]
     elif typ is closure.Div:
-        return [Virtual_Asm("srl", 3, [Reg("!", "int"), Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int")])]
+        return [Virtual_Asm(opcodes.SRL, 3, [Reg("!", "int"), Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int")])]
 
     elif typ is closure.FNeg:
-        return [Virtual_Asm("fneg", 2, [Reg("!", "float"), Reg(str(closure_t.var), "float")])]
+        return [Virtual_Asm(opcodes.FNEG, 2, [Reg("!", "float"), Reg(str(closure_t.var), "float")])]
     elif typ is closure.FAdd:
-        return [Virtual_Asm("fadd", 3, [Reg("!", "float"), Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float")])]
+        return [Virtual_Asm(opcodes.FADD, 3, [Reg("!", "float"), Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float")])]
     elif typ is closure.FSub:
-        return [Virtual_Asm("fsub", 3, [Reg("!", "float"), Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float")])]
+        return [Virtual_Asm(opcodes.FSUB, 3, [Reg("!", "float"), Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float")])]
     elif typ is closure.FMul:
-        return [Virtual_Asm("fmul", 3, [Reg("!", "float"), Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float")])]
+        return [Virtual_Asm(opcodes.FMUL, 3, [Reg("!", "float"), Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float")])]
     elif typ is closure.FDiv:
-        return [Virtual_Asm("fdiv", 3, [Reg("!", "float"), Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float")])]
-    
-    elif typ is closure.IfEq:
-        if_cnt += 1
-        # ラベルとしてthenとendifのラベルを作成
-        then_label = "then" + str(if_cnt)
-        endif_label = "endif" + str(if_cnt)
-        var1_typ = env.get(closure_t.var1) # = var2_typ
-        if var1_typ == "float": # 小数同士の比較の場合
-            first_asm = [
-                Virtual_Asm("bfeq", 3, [Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float"), Reg(then_label, "label")]),
-            ]
-        else: # 整数同士の比較の場合
-            first_asm = [
-                Virtual_Asm("beq", 3, [Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int"), Reg(then_label, "label")]),
-            ]
-        # first_asm : branch命令
-        # Closure_t2VirtualAsm_loop(closure_t.e2, fundefs) : else節の命令
-        # Closure_t2VirtualAsm_loop(closure_t.e1, fundefs) : then節の命令
-        return first_asm + Closure_t2VirtualAsm_loop(closure_t.e2, fundefs) + [
-            Virtual_Asm("j", 1, [Reg(endif_label, "label")]),
-            Virtual_Asm(then_label + ":", 0, []),
-        ] + Closure_t2VirtualAsm_loop(closure_t.e1, fundefs) + [
-            Virtual_Asm(endif_label + ":", 0, []),
-        ]
-    
-    elif typ is closure.IfNEq:
-        if_cnt += 1
-        # ラベルとしてthenとendifのラベルを作成
-        then_label = "then" + str(if_cnt)
-        endif_label = "endif" + str(if_cnt)
-        var1_typ = env.get(closure_t.var1) # = var2_typ
-        if var1_typ == "float": # 小数同士の比較の場合
-            first_asm = [
-                Virtual_Asm("bfeq", 3, [Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float"), Reg(then_label, "label")]),
-            ]
-        else: # 整数同士の比較の場合
-            first_asm = [
-                Virtual_Asm("beq", 3, [Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int"), Reg(then_label, "label")]),
-            ]
-        # first_asm : branch命令
-        # Closure_t2VirtualAsm_loop(closure_t.e2, fundefs) : else節の命令
-        # Closure_t2VirtualAsm_loop(closure_t.e1, fundefs) : then節の命令
-        # IfNEqではe1とe2をIfEqのときと逆にする
-        return first_asm + Closure_t2VirtualAsm_loop(closure_t.e1, fundefs) + [
-            Virtual_Asm("j", 1, [Reg(endif_label, "label")]),
-            Virtual_Asm(then_label + ":", 0, []),
-        ] + Closure_t2VirtualAsm_loop(closure_t.e2, fundefs) + [
-            Virtual_Asm(endif_label + ":", 0, []),
-        ]
-    
-    elif typ is closure.IfLE:
-        if_cnt += 1
-        then_label = "then" + str(if_cnt)
-        endif_label = "endif" + str(if_cnt)
-        var1_typ = env.get(closure_t.var1)
-        if var1_typ == "float":
-            first_asm = [
-                Virtual_Asm("bfle", 3, [Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float"), Reg(then_label, "label")]),
-            ]
-        else:
-            first_asm = [
-                Virtual_Asm("bge", 3, [Reg(str(closure_t.var2), "int"), Reg(str(closure_t.var1), "int"), Reg(then_label, "label")]),
-            ]
-        return first_asm + Closure_t2VirtualAsm_loop(closure_t.e2, fundefs) + [
-            Virtual_Asm("j", 1, [Reg(endif_label, "label")]),
-            Virtual_Asm(then_label + ":", 0, []),
-        ] + Closure_t2VirtualAsm_loop(closure_t.e1, fundefs) + [
-            Virtual_Asm(endif_label + ":", 0, []),
-        ]
-
-    elif typ is closure.IfLT:
-        if_cnt += 1
-        then_label = "then" + str(if_cnt)
-        endif_label = "endif" + str(if_cnt)
-        var1_typ = env.get(closure_t.var1)
-        if var1_typ == "float":
-            first_asm = [
-                Virtual_Asm("bflt", 3, [Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float"), Reg(then_label, "label")]),
-            ]
-        else:
-            first_asm = [
-                Virtual_Asm("blt", 3, [Reg(str(closure_t.var1), "int"), Reg(str(closure_t.var2), "int"), Reg(then_label, "label")]),
-            ]
-        return first_asm + Closure_t2VirtualAsm_loop(closure_t.e2, fundefs) + [
-            Virtual_Asm("j", 1, [Reg(endif_label, "label")]),
-            Virtual_Asm(then_label + ":", 0, []),
-        ] + Closure_t2VirtualAsm_loop(closure_t.e1, fundefs) + [
-            Virtual_Asm(endif_label + ":", 0, []),
-        ]
-    
-    # replaceAllExclにより!を置換する
-    elif typ is closure.Let:
-        e1_asm = replaceAllExcl(Closure_t2VirtualAsm_loop(closure_t.e1, fundefs), Reg(closure_t.var, closure_t.type))
-        env.set(closure_t.var, closure_t.type)
-        return e1_asm + Closure_t2VirtualAsm_loop(closure_t.e2, fundefs) 
+        return [Virtual_Asm(opcodes.FDIV, 3, [Reg("!", "float"), Reg(str(closure_t.var1), "float"), Reg(str(closure_t.var2), "float")])]
     
     # 変数の型によってmvとfmvを使い分ける
     elif typ is closure.Var:
-        var_typ = env.get(closure_t.var)
+        var_typ = ctx.env.get(closure_t.var)
         if var_typ == "float":
-            return [Virtual_Asm("fmv", 2, [Reg("!", "float"), Reg(closure_t.var, "float")])]
+            return [Virtual_Asm(opcodes.FMV, 2, [Reg("!", "float"), Reg(closure_t.var, "float")])]
         else:
-            return [Virtual_Asm("mv", 2, [Reg("!", "int"), Reg(closure_t.var, "int")])]
-    
-    # クロージャ生成
-    elif typ is closure.MakeCls:
-        makecls_cnt += 1
-        fv_length = len(closure_t.closure.actual_fv)
-        # 関数のアドレスを入れる
-        put_asm = [
-            Virtual_Asm("la", 2, [Reg("makecls" + str(makecls_cnt), "int"), Reg(closure_t.closure.entry, "label")]),
-            Virtual_Asm("sw", 3, [Reg(closure_t.var, "int"), Reg("makecls" + str(makecls_cnt), "int"), Reg("0", "int")])
-        ]
-        # closureに実際にデータを入れる
-        int_list, float_list = separateIntAndFloat(closure_t.closure.actual_fv)
-        idx = 0
-        for int_arg in int_list:
-            put_asm.append(Virtual_Asm("sw", 3, [Reg(closure_t.var, "int"), Reg(int_arg, "int"), Reg(str(4 * (idx+1)), "int")]))
-            idx += 1
-        for float_arg in float_list:
-            put_asm.append(Virtual_Asm("fsw", 3, [Reg(closure_t.var, "int"), Reg(float_arg, "float"), Reg(str(4 * (idx+1)), "int")]))
-            idx += 1
-        # 型環境への追加
-        env.set(closure_t.var, "int")
-        # put_asm: 関数のアドレスと自由変数をヒープ上に入れる命令列
-        return [
-            Virtual_Asm("mv", 2, [Reg(closure_t.var, "int"), Reg("hp", "int")]),
-            Virtual_Asm("addi", 3, [Reg("hp", "int"), Reg("hp", "int"), Reg(str(4 * (fv_length + 1)), "int")]),
-        ] + put_asm + Closure_t2VirtualAsm_loop(closure_t.e, fundefs)
+            return [Virtual_Asm(opcodes.MV, 2, [Reg("!", "int"), Reg(closure_t.var, "int")])]
     
     elif typ is closure.AppCls:
         # 自由変数でない引数を，int,floatに分けて順番に取り出す
-        int_list, float_list = separateIntAndFloat(closure_t.args)
+        int_list, float_list = separateIntAndFloat(ctx, closure_t.args)
         return [
             Virtual_Asm(
-                "app_cls",
+                opcodes.APP_CLS,
                 len(int_list + float_list) + 2,
                 [
                     Reg("!", "unknown"), Reg(closure_t.var, "int")
@@ -360,10 +388,10 @@ def Closure_t2VirtualAsm_loop (closure_t:closure.Closure_t, fundefs:List[closure
 
     elif typ is closure.AppDir:
         # 引数をint,floatに分けて順番に取り出す
-        int_list, float_list = separateIntAndFloat(closure_t.args)
+        int_list, float_list = separateIntAndFloat(ctx, closure_t.args)
         return [
             Virtual_Asm(
-                "app_dir",
+                opcodes.APP_DIR,
                 len(int_list + float_list) + 2,
                 [
                     Reg("!", "unknown"),
@@ -377,140 +405,184 @@ def Closure_t2VirtualAsm_loop (closure_t:closure.Closure_t, fundefs:List[closure
     
     # タプルをヒープ上に作成する
     elif typ is closure.Tuple:
-        tuple_cnt += 1
+        ctx.tuple_cnt += 1
         vars_length = len(closure_t.vars)
         # int,floatに分けてこの順でメモリに格納する
-        int_list, float_list = separateIntAndFloat(closure_t.vars)
+        int_list, float_list = separateIntAndFloat(ctx, closure_t.vars)
         int_asm = []
         float_asm = []
         idx = 0
         for item in int_list:
-            int_asm.append(Virtual_Asm("sw", 3, [Reg("tuple"+str(tuple_cnt), "int"), Reg(item, "int"), Reg(str(4 * idx), "int")]))
+            int_asm.append(Virtual_Asm(opcodes.SW, 3, [Reg("tuple"+str(ctx.tuple_cnt), "int"), Reg(item, "int"), Reg(str(4 * idx), "int")]))
             idx += 1
         for item in float_list:
-            float_asm.append(Virtual_Asm("fsw", 3, [Reg("tuple"+str(tuple_cnt), "int"), Reg(item, "float"), Reg(str(4 * idx), "int")]))
+            float_asm.append(Virtual_Asm(opcodes.FSW, 3, [Reg("tuple"+str(ctx.tuple_cnt), "int"), Reg(item, "float"), Reg(str(4 * idx), "int")]))
             idx += 1
-        env.set("tuple"+str(tuple_cnt), "int")
+        ctx.env.set("tuple"+str(ctx.tuple_cnt), "int")
         # int_asm: intの引数をヒープ上に作る
         # float_asm: floatの引数をヒープ上に作る
         return [
-            Virtual_Asm("mv", 2, [Reg("tuple"+str(tuple_cnt), "int"), Reg("hp", "int")]),
-            Virtual_Asm("addi", 3, [Reg("hp", "int"), Reg("hp", "int"), Reg(str(4 * vars_length), "int")]),
+            Virtual_Asm(opcodes.MV, 2, [Reg("tuple"+str(ctx.tuple_cnt), "int"), Reg("hp", "int")]),
+            Virtual_Asm(opcodes.ADDI, 3, [Reg("hp", "int"), Reg("hp", "int"), Reg(str(4 * vars_length), "int")]),
         ] + int_asm + float_asm + [
-            Virtual_Asm("mv", 2, [Reg("!", "int"), Reg("tuple"+str(tuple_cnt), "int")]),
+            Virtual_Asm(opcodes.MV, 2, [Reg("!", "int"), Reg("tuple"+str(ctx.tuple_cnt), "int")]),
         ]
     
-    # ヒープ上のタプルから要素を取り出す
-    elif typ is closure.LetTuple:
-        # タプルの中に含まれる全ての変数の型情報をenvに登録する
-        for var in closure_t.vars:
-            env.set(var[0], var[1])
-        # int,floatに分けてこの順でメモリから取り出す
-        int_vars, float_vars = separateIntAndFloat([var[0] for var in closure_t.vars])
-        first_asm = []
-        idx = 0
-        for int_var in int_vars:
-            first_asm.append(Virtual_Asm("lw", 3, [Reg(int_var, "int"), Reg(closure_t.var, "int"), Reg(str(idx * 4), "int")]))
-            idx += 1
-        for float_var in float_vars:
-            first_asm.append(Virtual_Asm("flw", 3, [Reg(float_var, "float"), Reg(closure_t.var, "int"), Reg(str(idx * 4), "int")]))
-            idx += 1
-        # first_asm: タプルの要素を取り出す命令列
-        return first_asm + Closure_t2VirtualAsm_loop(closure_t.e, fundefs)
-    
     # 配列の要素を取り出す
     elif typ is closure.Get:
-        get_cnt += 1
-        env.set("get1."+str(get_cnt), "int")
-        env.set("get2."+str(get_cnt), "int")
+        ctx.get_cnt += 1
+        ctx.env.set("get1."+str(ctx.get_cnt), "int")
+        ctx.env.set("get2."+str(ctx.get_cnt), "int")
         # アドレスvar1 + var2 * 4を計算して、メモリ上のそのアドレスにあるものを取り出す
         return [
-            Virtual_Asm("slli", 3, [Reg("get1."+str(get_cnt), "int"), Reg(closure_t.var2, "int"), Reg("2", "int")]),
-            Virtual_Asm("add", 3, [Reg("get2."+str(get_cnt), "int"), Reg(closure_t.var1, "int"), Reg("get1."+str(get_cnt), "int")]),
-            Virtual_Asm("lw_or_flw", 3, [Reg("!", "unknown"), Reg("get2."+str(get_cnt), "int"), Reg("0", "int")])
+            Virtual_Asm(opcodes.SLLI, 3, [Reg("get1."+str(ctx.get_cnt), "int"), Reg(closure_t.var2, "int"), Reg("2", "int")]),
+            Virtual_Asm(opcodes.ADD, 3, [Reg("get2."+str(ctx.get_cnt), "int"), Reg(closure_t.var1, "int"), Reg("get1."+str(ctx.get_cnt), "int")]),
+            Virtual_Asm(opcodes.LW_OR_FLW, 3, [Reg("!", "unknown"), Reg("get2."+str(ctx.get_cnt), "int"), Reg("0", "int")])
         ]
     
     # 配列に値をセットする
     elif typ is closure.Put:
-        put_cnt += 1
-        env.set("put1."+str(put_cnt), "int")
-        env.set("put2."+str(put_cnt), "int")
+        ctx.put_cnt += 1
+        ctx.env.set("put1."+str(ctx.put_cnt), "int")
+        ctx.env.set("put2."+str(ctx.put_cnt), "int")
         return [
-            Virtual_Asm("slli", 3, [Reg("put1."+str(put_cnt), "int"), Reg(closure_t.var2, "int"), Reg("2", "int")]),
-            Virtual_Asm("add", 3, [Reg("put2."+str(put_cnt), "int"), Reg(closure_t.var1, "int"), Reg("put1."+str(put_cnt), "int")]),
+            Virtual_Asm(opcodes.SLLI, 3, [Reg("put1."+str(ctx.put_cnt), "int"), Reg(closure_t.var2, "int"), Reg("2", "int")]),
+            Virtual_Asm(opcodes.ADD, 3, [Reg("put2."+str(ctx.put_cnt), "int"), Reg(closure_t.var1, "int"), Reg("put1."+str(ctx.put_cnt), "int")]),
         ] + [
-            Virtual_Asm("fsw", 3, [Reg("put2."+str(put_cnt), "int"), Reg(closure_t.var3, "float"), Reg("0", "int")]) if env.get(closure_t.var3) == "float" else
-            Virtual_Asm("sw", 3, [Reg("put2."+str(put_cnt), "int"), Reg(closure_t.var3, "int"), Reg("0", "int")])
+            Virtual_Asm(opcodes.FSW, 3, [Reg("put2."+str(ctx.put_cnt), "int"), Reg(closure_t.var3, "float"), Reg("0", "int")]) if ctx.env.get(closure_t.var3) == "float" else
+            Virtual_Asm(opcodes.SW, 3, [Reg("put2."+str(ctx.put_cnt), "int"), Reg(closure_t.var3, "int"), Reg("0", "int")])
         ]
 
     else:
         error.error("Invalid Closure Type.")
 
+# Closure_t2VirtualAsm_loopと同じ結果を,再帰呼び出しの代わりに明示的なスタックを使って計算する
+# 長いLetの連鎖でも再帰の深さ制限に依存しない
+# 命令はoutに順に追加していき，tasksにはこれから行う処理を積む
+#   ("visit", 木, 代入先): 木を仮想アセンブリ化してoutに追加する
+#   ("let", Letの木): Letの変数をenvに登録する（e1の変換が終わった後に行う）
+#   ("emit", 命令列): 命令列をそのままoutに追加する
+def Closure_t2VirtualAsm_iter (ctx:context.CompilationContext, closure_t:closure.Closure_t, fundefs:List[closure.Fundef], dest:Reg=None) -> List[Virtual_Asm]:
+    out = []
+    tasks = [("visit", closure_t, dest)]
+    while tasks != []:
+        task = tasks.pop()
+        if task[0] == "visit":
+            node = task[1]
+            dest = task[2]
+            typ = type(node)
+            if typ is closure.Let:
+                tasks.append(("visit", node.e2, dest))
+                tasks.append(("let", node))
+                tasks.append(("visit", node.e1, Reg(node.var, node.type)))
+            elif typ in closure.IF_TYPES:
+                first_asm, fall_e, then_e, then_label, endif_label = ifHead(ctx, node)
+                out += first_asm
+                tasks.append(("emit", [makeLabel(endif_label)]))
+                tasks.append(("visit", then_e, dest))
+                tasks.append(("emit", [
+                    Virtual_Asm(opcodes.J, 1, [Reg(endif_label, "label")]),
+                    makeLabel(then_label),
+                ]))
+                tasks.append(("visit", fall_e, dest))
+            elif typ is closure.MakeCls:
+                out += makeClsHead(ctx, node)
+                tasks.append(("visit", node.e, dest))
+            elif typ is closure.LetTuple:
+                out += letTupleHead(ctx, node)
+                tasks.append(("visit", node.e, dest))
+            else:
+                out += setDest(ctx, leafAsm(ctx, node), dest)
+        elif task[0] == "let":
+            ctx.env.set(task[1].var, task[1].type)
+        else:
+            out += task[1]
+    return out
+
 # closure.Fundefを仮想アセンブリ列に落とし込む
-def Fundef2VirtualAsm (fundef:closure.Fundef, fundefs) -> List[Virtual_Asm]:
-    global fundef_cnt
-    env.set(fundef.name[0], fundef.name[1])
-    fundef_cnt += 1
+def Fundef2VirtualAsm (ctx:context.CompilationContext, fundef:closure.Fundef, fundefs) -> List[Virtual_Asm]:
+    ctx.env.set(fundef.name[0], fundef.name[1])
+    ctx.fundef_cnt += 1
 
     # 返り値を返す命令を生成
     ret_type = retrieveRetType(fundef.name[1])
     if ret_type == "()":
-        last_asm = [Virtual_Asm("ret_unit", 0, [])]  
+        last_asm = [Virtual_Asm(opcodes.RET_UNIT, 0, [])]  
     elif ret_type == "float":
-        last_asm = [Virtual_Asm("ret", 1, [Reg("ret_reg"+str(fundef_cnt), "float")])]
+        last_asm = [Virtual_Asm(opcodes.RET, 1, [Reg("ret_reg"+str(ctx.fundef_cnt), "float")])]
     else:
-        last_asm = [Virtual_Asm("ret", 1, [Reg("ret_reg"+str(fundef_cnt), "int")])]
+        last_asm = [Virtual_Asm(opcodes.RET, 1, [Reg("ret_reg"+str(ctx.fundef_cnt), "int")])]
     # 自由変数を取り出す
     formal_fv_int_list = []
     formal_fv_float_list = []
     for fv in fundef.formal_fv:
-        env.set(fv[0], fv[1])
+        ctx.env.set(fv[0], fv[1])
         if fv[1] == "int":
             formal_fv_int_list.append(fv[0])
         elif fv[1] == "float":
             formal_fv_float_list.append(fv[0])
         else:
             formal_fv_int_list.append(fv[0])
-    # # 自己再帰で使われる場合があるのでラベルを保持しておく（必要なければremoveUnnecessaryInstrで取り除かれるので問題なし，例えば関数のアドレスやクロージャを配列に入れるとき等に必要になる）
+    # # 自己再帰で使われる場合があるのでラベルを保持しておく（必要なければdeadCodeで取り除かれるので問題なし，例えば関数のアドレスやクロージャを配列に入れるとき等に必要になる）
     # クロージャを格納しておく
-    recursive_asm = [Virtual_Asm("mv", 2, [Reg(fundef.name[0], "int"), Reg("cls_address" + str(fundef_cnt), "label")])]
+    recursive_asm = [Virtual_Asm(opcodes.MV, 2, [Reg(fundef.name[0], "int"), Reg("cls_address" + str(ctx.fundef_cnt), "label")])]
     # 変数の型をenvに登録
     for arg in fundef.args:
-        env.set(arg[0], arg[1])
-    args_int_list, args_float_list = separateIntAndFloat(list(map(lambda x: x[0], fundef.args)))
+        ctx.env.set(arg[0], arg[1])
+    args_int_list, args_float_list = separateIntAndFloat(ctx, list(map(lambda x: x[0], fundef.args)))
     # recursive_asm: 自己再帰で使われる場合に備えて自身のラベルを保持する命令
     # last_asm: 返り値を返すことを含めたretの命令
     return [
-        Virtual_Asm(fundef.name[0] + ":", 0, []),
+        makeLabel(fundef.name[0]),
     ] + [
-        Virtual_Asm("* args", 1, [Reg(arg, 'int')]) for arg in args_int_list
+        Virtual_Asm(opcodes.ARGS, 1, [Reg(arg, 'int')]) for arg in args_int_list
     ] + [
-        Virtual_Asm("* args", 1, [Reg(arg, 'float')]) for arg in args_float_list
+        Virtual_Asm(opcodes.ARGS, 1, [Reg(arg, 'float')]) for arg in args_float_list
     ] + [
-        Virtual_Asm("* formal_fv", 1, [Reg(arg, 'int')]) for arg in formal_fv_int_list
+        Virtual_Asm(opcodes.FORMAL_FV, 1, [Reg(arg, 'int')]) for arg in formal_fv_int_list
     ] + [
-        Virtual_Asm("* formal_fv", 1, [Reg(arg, 'float')]) for arg in formal_fv_float_list
-    ] + recursive_asm + replaceAllExcl(
-        Closure_t2VirtualAsm_loop(fundef.body, fundefs),
-        Reg("ret_reg"+str(fundef_cnt), ret_type)
+        Virtual_Asm(opcodes.FORMAL_FV, 1, [Reg(arg, 'float')]) for arg in formal_fv_float_list
+    ] + recursive_asm + lowerClosure_t(
+        ctx, fundef.body, fundefs,
+        Reg("ret_reg"+str(ctx.fundef_cnt), ret_type)
     ) + last_asm
 
+# Fundef2VirtualAsmでfundefを仮想アセンブリ化したときのカウンターの増分（context.CompilationContext.getCountersと同じ順）
+# 仮想アセンブリは作らず，カウンターを増やすノード（Closure_t2VirtualAsm_loop, leafAsmを参照）を数えるだけにする
+def counterIncrements (fundef:closure.Fundef) -> Tuple[int, ...]:
+    flt = if_ = tpl = get = put = makecls = 0
+    for node in closure.subtrees(fundef.body):
+        typ = type(node)
+        if typ is closure.Float:
+            flt += 1
+        elif typ in closure.IF_TYPES:
+            if_ += 1
+        elif typ is closure.Tuple:
+            tpl += 1
+        elif typ is closure.Get:
+            get += 1
+        elif typ is closure.Put:
+            put += 1
+        elif typ is closure.MakeCls:
+            makecls += 1
+    return (flt, if_, tpl, get, put, 1, 0, 0, makecls)
+
 # List[closure.Fundef]を仮想アセンブリ列に落とし込む
-def Fundefs2VirtualAsm (fundefs:List[closure.Fundef]) -> List[List[Virtual_Asm]]:
+def Fundefs2VirtualAsm (ctx:context.CompilationContext, fundefs:List[closure.Fundef]) -> List[List[Virtual_Asm]]:
     ret = []
     for fundef in fundefs:
-        ret.append(Fundef2VirtualAsm(fundef, fundefs))
+        ret.append(Fundef2VirtualAsm(ctx, fundef, fundefs))
     return ret
 
 # デバッグ用
 def VirtualAsmList2Str (lis:List[Virtual_Asm]) -> str:
     ret = ""
     for virtual_asm in lis:
-        if ":" in virtual_asm.instr_name: # label
-            ret += virtual_asm.instr_name
-        elif "#" in virtual_asm.instr_name: # comment
-            ret += virtual_asm.instr_name
+        if virtual_asm.op == opcodes.LABEL: # label
+            ret += virtual_asm.arg_list[0].name + ":"
+        elif virtual_asm.op == opcodes.COMMENT: # comment
+            ret += virtual_asm.arg_list[0].name
         else:
-            ret += "\t" + virtual_asm.instr_name + " " + ", ".join([reg.name + "(" + reg.typ + ")" for reg in virtual_asm.arg_list])
+            ret += "\t" + opcodes.INFO[virtual_asm.op].name + " " + ", ".join([reg.name + "(" + reg.typ + ")" for reg in virtual_asm.arg_list])
         ret += "\n"
     return ret
@@ -0,0 +1,53 @@
+(* regression test: fisneg must not clobber a live float register *)
+(* compile with: python3 py/main.py --file fisneg --const-regs profile --const-float-regs 0 *)
+(* expected output: 1 followed by 1 .. 24 *)
+
+let a1 = float_of_int 1 in
+let a2 = float_of_int 2 in
+let a3 = float_of_int 3 in
+let a4 = float_of_int 4 in
+let a5 = float_of_int 5 in
+let a6 = float_of_int 6 in
+let a7 = float_of_int 7 in
+let a8 = float_of_int 8 in
+let a9 = float_of_int 9 in
+let a10 = float_of_int 10 in
+let a11 = float_of_int 11 in
+let a12 = float_of_int 12 in
+let a13 = float_of_int 13 in
+let a14 = float_of_int 14 in
+let a15 = float_of_int 15 in
+let a16 = float_of_int 16 in
+let a17 = float_of_int 17 in
+let a18 = float_of_int 18 in
+let a19 = float_of_int 19 in
+let a20 = float_of_int 20 in
+let a21 = float_of_int 21 in
+let a22 = float_of_int 22 in
+let a23 = float_of_int 23 in
+let a24 = float_of_int 24 in
+print_int (if fisneg (float_of_int (-5)) then 1 else 0);
+print_int (int_of_float a1);
+print_int (int_of_float a2);
+print_int (int_of_float a3);
+print_int (int_of_float a4);
+print_int (int_of_float a5);
+print_int (int_of_float a6);
+print_int (int_of_float a7);
+print_int (int_of_float a8);
+print_int (int_of_float a9);
+print_int (int_of_float a10);
+print_int (int_of_float a11);
+print_int (int_of_float a12);
+print_int (int_of_float a13);
+print_int (int_of_float a14);
+print_int (int_of_float a15);
+print_int (int_of_float a16);
+print_int (int_of_float a17);
+print_int (int_of_float a18);
+print_int (int_of_float a19);
+print_int (int_of_float a20);
+print_int (int_of_float a21);
+print_int (int_of_float a22);
+print_int (int_of_float a23);
+print_int (int_of_float a24)